@@ -1,29 +1,21 @@
 # app/ai_agent.py
 import os
-import vertexai
-from vertexai.generative_models import GenerativeModel, Tool
+import inspect
 from linebot.models import MessageEvent
 
 # 内部モジュールをインポート
 from .line_actions import LineActions
-from .function_definitions import function_declarations
+from .context_cache import ContextCache
+from .models import Session
+from .rate_limiter import RateLimiter, GLOBAL_KEY, BUSY_MESSAGE
+from .metrics import stage_timer, record_token_usage
+from .tracing import TRACER, argument_sizes
+from .logger import get_logger
 
-class AIAgent:
-    def __init__(self, gemini_model: GenerativeModel, line_actions: LineActions):
-        """
-        コンストラクタで、初期化済みのVertex AIモデルとLineActionsを受け取ります。
-        """
-        self.model = gemini_model
-        self.line_actions = line_actions
-        # 会話履歴をユーザー/グループごとに管理するための辞書
-        # この辞書が、AIの「記憶」の役割を果たします。
-        self.chat_sessions = {}
+logger = get_logger(__name__)
 
-    def _get_or_create_chat_session(self, session_id: str):
-        """セッションIDに基づいてチャットセッションを取得または新規作成"""
-        if session_id not in self.chat_sessions:
-            # AIの行動指針となる、詳細な指示書（システムプロンプト）
-            system_prompt = """
+# AIの行動指針となる、詳細な指示書（システムプロンプト）
+SYSTEM_PROMPT = """
 あなたは、飲食店選びをサポートする、非常に優秀で配慮の天才なファシリテーターAIです。
 あなたの目的は、参加者全員が納得する最適なレストランを1つ見つけることです。
 
@@ -47,18 +39,99 @@ class AIAgent:
 
 あなたの役割は、焦ってお店を提案することではありません。丁寧なヒアリングを通じて、ユーザーの要望を完璧に理解し、無駄のない最適な提案を行うことです。
 """
-            # ツールを認識済みのモデルから、新しいチャットセッションを開始
-            self.chat_sessions[session_id] = self.model.start_chat()
-            # 最初にシステムプロンプトを会話のコンテキストに含める
-            self.chat_sessions[session_id].send_message(system_prompt)
-            print(f"New chat session created for {session_id} with a detailed system prompt.")
 
-        return self.chat_sessions[session_id]
 
-    def process_individual_message(self, event: MessageEvent, session_data: dict):
+def _is_system_prompt(content) -> bool:
+    """会話履歴の発言が、最初に送ったシステムプロンプトか"""
+    if getattr(content, "role", None) != "user":
+        return False
+    # 文字列以外のパート（関数の実行結果など）は text を持たない
+    return any(getattr(part, "text", None) == SYSTEM_PROMPT for part in getattr(content, "parts", []))
+
+
+def _strip_system_prompt(history: list) -> list:
+    """
+    会話履歴から、システムプロンプトの発言とそれに対するモデルの返事を取り除く。
+    チャットを作り直す時は、新しいチャットの側でシステムプロンプトを渡すため、履歴に残すと二重になる。
+    """
+    stripped = []
+    skip_reply = False
+    for content in history:
+        if _is_system_prompt(content):
+            skip_reply = True
+            continue
+        if skip_reply and getattr(content, "role", None) == "model":
+            skip_reply = False
+            continue
+        skip_reply = False
+        stripped.append(content)
+    return stripped
+
+
+class AIAgent:
+    def __init__(self, gemini_model, line_actions: LineActions, context_cache: ContextCache = None,
+                 rate_limiter: RateLimiter = None):
+        """
+        コンストラクタで、初期化済みのVertex AIモデルとLineActionsを受け取ります。
+        context_cacheを渡すと、システムプロンプトとツールの定義をキャッシュしたモデルで会話します。
+        rate_limiterを渡すと、グループ・ユーザーごとと、Gemini全体の呼び出し回数を制限します。
+        """
+        self.model = gemini_model
+        self.line_actions = line_actions
+        self.context_cache = context_cache
+        self.rate_limiter = rate_limiter
+        # 会話履歴をユーザー/グループごとに管理するための辞書
+        # この辞書が、AIの「記憶」の役割を果たします。
+        self.chat_sessions = {}
+        # 各チャットセッションが参照しているコンテキストキャッシュの世代（キャッシュなしはNone）
+        self.chat_generations = {}
+
+    def _get_or_create_chat_session(self, session_id: str):
+        """セッションIDに基づいてチャットセッションを取得または新規作成"""
+        with stage_timer("get_or_create_chat_session", session_id=session_id):
+            cached = self.context_cache.get_model() if self.context_cache else None
+            generation = cached[1] if cached else None
+            chat = self.chat_sessions.get(session_id)
+            if chat is not None and self.chat_generations.get(session_id) == generation:
+                return chat
+
+            # キャッシュが作り直された（または使えなくなった）場合は、それまでの会話履歴を引き継いで作り直す
+            # システムプロンプトは作り直したチャットの側で渡すため、履歴からは取り除く
+            history = _strip_system_prompt(chat.history) if chat is not None else None
+            if cached:
+                # システムプロンプトとツールの定義はキャッシュに含まれているため、送り直さない
+                chat = cached[0].start_chat(history=history)
+            else:
+                # ツールを認識済みのモデルから、新しいチャットセッションを開始
+                chat = self.model.start_chat(history=history)
+                # 最初にシステムプロンプトを会話のコンテキストに含める
+                with stage_timer("llm_system_prompt"):
+                    response = chat.send_message(SYSTEM_PROMPT)
+                record_token_usage(response, "system_prompt")
+            self.chat_sessions[session_id] = chat
+            self.chat_generations[session_id] = generation
+            TRACER.set_attribute("created", True)
+            logger.info("New chat session created.", extra={"session_id": session_id, "context_cache_generation": generation})
+            return chat
+
+    def _acquire_rate_limit(self, reply_token: str, user_id: str, group_id: str = None) -> bool:
+        """
+        Geminiを呼び出してよいか判断する。制限を超えていれば、少し待つようにユーザーに返信してFalseを返す。
+        group_idを省略した場合（1対1チャット）は、ユーザー単位と全体の制限だけをかける。
+        """
+        if self.rate_limiter is None:
+            return True
+        if self.rate_limiter.try_acquire(("group", group_id), ("user", user_id), ("gemini", GLOBAL_KEY)):
+            return True
+        logger.warning("レート制限を超えたため、AIの呼び出しを見送ります", extra={"group_id": group_id, "user_id": user_id})
+        self.line_actions.reply_with_text(reply_token, BUSY_MESSAGE)
+        return False
+
+    def process_individual_message(self, event: MessageEvent, session_data: Session):
         """
         個別ヒアリング中のメッセージを処理する。
         常に全員の希望を考慮して、次のアクションを判断する。
+        1対1チャットではどの調整のメッセージか確実にはわからないため、ユーザー単位と全体のレート制限だけをかける。
         """
         user_message = event.message.text
         reply_token = event.reply_token
@@ -68,25 +141,28 @@ class AIAgent:
             self.line_actions.reply_with_text(reply_token, "AIモデルが準備できていません。")
             return
 
+        if not self._acquire_rate_limit(reply_token, session_id):
+            return
+
         chat = self._get_or_create_chat_session(session_id)
 
         # AIに渡すプロンプトを、現在の全希望を含めて作成
         prompt = f"""
         現在、以下の希望が全員から集まっています。
-        {session_data['preferences']}
+        {session_data.preferences_text()}
 
         上記を踏まえた上で、以下の新しいメッセージに対して、最適なアクション（お店の提案、追加の質問、ただの返事など）を判断し、必要な関数を呼び出してください。
         お店を提案する際は、必ず全員の希望を考慮した検索キーワードを生成してください。
         以下はグループlineで決めた条件なので、個別チャットではこれらの情報を使ってください。
-        {session_data['preferences']['common']}
+        {session_data.common_text()}
         また、一番最初に実行される際には、グループlineで決めた条件を確認するようにしてください。例、新宿でのランチですね！どのようなジャンルがお好みですか？
 
         新しいメッセージ: "{user_message}"
         """
         
-        self._send_prompt_and_execute_action(prompt, chat, reply_token)
+        self._send_prompt_and_execute_action(prompt, chat, reply_token, session_id)
 
-    def process_group_message(self, event: MessageEvent, session_data: dict):
+    def process_group_message(self, event: MessageEvent, session_data: Session):
         """
         グループLINEのメッセージを処理する。
         """
@@ -99,12 +175,15 @@ class AIAgent:
             self.line_actions.reply_with_text(reply_token, "AIモデルが準備できていません。")
             return
 
+        if not self._acquire_rate_limit(reply_token, session_id, group_id):
+            return
+
         chat = self._get_or_create_chat_session(session_id)
 
         # AIに渡すプロンプトを、現在の全希望を含めて作成
         prompt = f"""
         現在、以下の希望が全員から集まっています。
-        {session_data['preferences']}
+        {session_data.preferences_text()}
 
         上記を踏まえた上で、以下の新しいメッセージに対して、最適なアクション（追加の質問、ただの返事、お店の決定など）を判断し、必要な関数を呼び出してください。質問をする際には、グループメンバー全員が答えやすい決まっていることのみにしてください。（日時、エリア、朝食か夕食かなど）決して意見のわかれる予算やジャンルなどの質問はしないでください。
 
@@ -112,26 +191,33 @@ class AIAgent:
         新しいメッセージ: "{user_message}"
         """
         
-        self._send_prompt_and_execute_action(prompt, chat, reply_token)
+        self._send_prompt_and_execute_action(prompt, chat, reply_token, session_id)
 
-    def _send_prompt_and_execute_action(self, prompt: str, chat, reply_token: str):
+    def _send_prompt_and_execute_action(self, prompt: str, chat, reply_token: str, session_id: str = None):
         """プロンプトをAIに送信し、Function Callingを実行する共通処理"""
         try:
-            response = chat.send_message(prompt)
+            with stage_timer("llm_decision"):
+                response = chat.send_message(prompt)
+            record_token_usage(response, "chat")
             
             if response.candidates and response.candidates[0].function_calls:
                 function_call = response.candidates[0].function_calls[0]
                 function_name = function_call.name
                 args = {key: value for key, value in function_call.args.items()}
                 
-                print(f"AIが関数呼び出しを判断: {function_name}({args})")
+                logger.info("AIが関数呼び出しを判断", extra={"function": function_name})
+                logger.debug("関数呼び出しの引数", extra={"function": function_name, "function_args": args})
 
                 # 実行する関数に、reply_tokenも引数として渡す
                 args_with_reply_token = {"reply_token": reply_token, **args}
 
                 if hasattr(self.line_actions, function_name):
                     func = getattr(self.line_actions, function_name)
-                    func(**args_with_reply_token)
+                    # session_idを受け取れる関数（検索結果の続きを保持するものなど）には、session_idも渡す
+                    if "session_id" in inspect.signature(func).parameters:
+                        args_with_reply_token["session_id"] = session_id
+                    with stage_timer(f"tool.{function_name}", arg_sizes=argument_sizes(args)):
+                        func(**args_with_reply_token)
                 else:
                     self.line_actions.reply_with_text(reply_token, "AIが不明な関数を呼び出そうとしました。")
             
@@ -140,5 +226,5 @@ class AIAgent:
                 self.line_actions.reply_with_text(reply_token, response.text.strip())
 
         except Exception as e:
-            print(f"AIとの対話中にエラーが発生しました: {e}")
+            logger.exception("AIとの対話中にエラーが発生しました: %s", e, extra={"session_id": session_id})
             self.line_actions.reply_with_text(reply_token, "すみません、AIが応答できませんでした。")
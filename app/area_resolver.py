@@ -0,0 +1,265 @@
+# app/area_resolver.py
+import json
+import math
+import os
+import re
+import threading
+
+from .local_index import split_keywords, METERS_PER_DEG
+from .metrics import stage_timer
+from .search_cache import TTLCache
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# よく使われるエリアの中心座標と、周辺検索に使う半径（メートル）の初期値
+KNOWN_AREAS = {
+    "新宿": {"lat": 35.6909, "lng": 139.7003, "radius": 800},
+    "渋谷": {"lat": 35.6580, "lng": 139.7016, "radius": 800},
+    "東京駅": {"lat": 35.6812, "lng": 139.7671, "radius": 600},
+    "丸の内": {"lat": 35.6815, "lng": 139.7640, "radius": 500},
+    "池袋": {"lat": 35.7295, "lng": 139.7109, "radius": 800},
+    "銀座": {"lat": 35.6717, "lng": 139.7650, "radius": 700},
+    "有楽町": {"lat": 35.6751, "lng": 139.7630, "radius": 500},
+    "新橋": {"lat": 35.6663, "lng": 139.7583, "radius": 600},
+    "品川": {"lat": 35.6285, "lng": 139.7388, "radius": 700},
+    "六本木": {"lat": 35.6628, "lng": 139.7314, "radius": 600},
+    "恵比寿": {"lat": 35.6467, "lng": 139.7101, "radius": 600},
+    "中目黒": {"lat": 35.6440, "lng": 139.6990, "radius": 600},
+    "上野": {"lat": 35.7141, "lng": 139.7774, "radius": 700},
+    "秋葉原": {"lat": 35.6984, "lng": 139.7731, "radius": 600},
+    "吉祥寺": {"lat": 35.7033, "lng": 139.5797, "radius": 700},
+    "横浜": {"lat": 35.4657, "lng": 139.6223, "radius": 900},
+}
+
+# ジオコーディング結果をエリアとして扱う種別（お店や住所ではなく、地名・駅名であるもの）
+AREA_RESULT_TYPES = {
+    "locality", "sublocality", "sublocality_level_1", "sublocality_level_2",
+    "neighborhood", "colloquial_area", "train_station", "transit_station", "subway_station",
+}
+
+# 地名によく付く語尾。これで終わる言葉は、辞書になくてもエリア名としてジオコーディングする
+PLACE_SUFFIXES = (
+    "駅", "区", "市", "町", "村", "郡", "県", "丁目", "通り", "口", "台", "坂", "橋", "島",
+    "浜", "谷", "沢", "川", "山", "野", "原", "田", "宿", "寺", "茶屋", "が丘", "ヶ丘", "温泉",
+)
+# ジャンル・料理・お店の種類によく付く語尾（「和食」「韓国料理」「居酒屋」など）
+NON_AREA_SUFFIXES = ("食", "料理", "屋", "店", "肉", "鍋", "焼", "焼き", "酒場", "放題", "会", "席", "円")
+# 漢字だけで書かれるが、エリア名ではない言葉（ジャンル・こだわり条件・日時など）
+NON_AREA_WORDS = {
+    "中華", "寿司", "鮨", "蕎麦", "天丼", "海鮮", "魚介", "個室", "予算", "禁煙", "喫煙", "駐車場",
+    "高級", "格安", "宴会", "接待", "貸切", "夜景", "記念日", "誕生日", "少人数", "大人数", "今日",
+    "明日", "明後日", "今週", "来週", "週末", "平日", "土曜", "日曜", "昼", "夜", "深夜", "朝",
+}
+# 「新宿でランチ」のように空白なしで続けて書かれた時に、エリア名のあとに付く助詞や「周辺」などの語
+_PARTICLES = re.compile(r"から|まで|周辺|付近|あたり|辺り|近く|で|の|に|へ|を")
+# 空白なしでエリア名のあとに続けて書かれることの多いジャンル（「渋谷イタリアン」「新宿居酒屋」など）
+GENRE_WORDS = NON_AREA_WORDS | {
+    "ランチ", "ディナー", "モーニング", "カフェ", "バー", "イタリアン", "フレンチ", "スペイン料理", "ラーメン",
+    "焼肉", "焼き鳥", "焼鳥", "居酒屋", "和食", "洋食", "韓国料理", "定食", "うどん", "そば", "グルメ",
+    "スイーツ", "飲み会", "飲食店", "レストラン",
+}
+# 漢字（と「ヶ」「々」）だけの言葉。エリア名の多くはこの形で、カタカナやひらがなの言葉の多くはジャンル
+_KANJI_WORD = re.compile(r"^[\u4e00-\u9fff々ヶケ]{2,5}$")
+
+# ジオコーディングで求めた半径の下限と上限（メートル）
+MIN_RADIUS = 400
+MAX_RADIUS = 2000
+
+# エリアではないと分かった言葉を、再びジオコーディングしない期間（秒）と、覚えておく件数の上限
+# ファイルには保存しないため、再起動するか期限が切れれば、もう一度ジオコーディングする
+NEGATIVE_TTL_SECONDS = 60 * 60
+NEGATIVE_MAX_ENTRIES = 5000
+
+
+def looks_like_place(keyword: str) -> bool:
+    """
+    ジオコーディングする価値のある、地名らしい言葉か。
+    ジャンル（「和食」「イタリアン」）や条件（「個室」「5000円」）はジオコーディングしない。
+    """
+    if keyword in NON_AREA_WORDS or any(ch.isdigit() for ch in keyword):
+        return False
+    if keyword.endswith(PLACE_SUFFIXES):
+        return True
+    if keyword.endswith(NON_AREA_SUFFIXES):
+        return False
+    return bool(_KANJI_WORD.match(keyword))
+
+
+class AreaResolver:
+    """
+    検索キーワードに含まれるエリア名（「新宿」「東京駅」など）を、中心座標と検索半径に変換する。
+    結果はファイルにキャッシュし、ジオコーディングはエリアごとに1回だけ行う。
+    ジオコーディングするのは地名らしい言葉だけで、エリアではないと分かった言葉は
+    NEGATIVE_TTL_SECONDSの間だけメモリに覚えておき、その間はジオコーディングしない。
+    """
+
+    def __init__(self, gmaps_client, cache_path: str = None, acquire=None):
+        """
+        acquire: ジオコーディングしてよいかを返す関数（Places APIのレート制限）。省略した場合は制限しない
+        """
+        self.gmaps = gmaps_client
+        self.cache_path = cache_path
+        self.acquire = acquire
+        self._lock = threading.Lock()
+        # エリア名 -> {"lat", "lng", "radius"}
+        self._areas = dict(KNOWN_AREAS)
+        # エリアではないと分かった言葉（一時的に覚えておくだけで、ファイルには保存しない）
+        self._misses = TTLCache(NEGATIVE_TTL_SECONDS, NEGATIVE_MAX_ENTRIES)
+        if cache_path and os.path.exists(cache_path):
+            self._areas.update(self._load_cache(cache_path))
+
+    @staticmethod
+    def _load_cache(cache_path: str) -> dict:
+        """キャッシュファイルを読む。壊れている場合は警告を出して使わない（起動を止めない）"""
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                learned = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("エリアキャッシュを読み込めないため、使わずに起動します: %s", e, extra={"path": cache_path})
+            return {}
+        if not isinstance(learned, dict):
+            logger.warning("エリアキャッシュの形式が正しくないため、使わずに起動します", extra={"path": cache_path})
+            return {}
+        # 以前の形式で保存された、エリアではない言葉（None）は読み込まない
+        return {
+            name: area for name, area in learned.items()
+            if isinstance(area, dict) and {"lat", "lng", "radius"} <= set(area)
+        }
+
+    def resolve(self, query: str):
+        """
+        queryからエリアを探し、(エリア名, {"lat", "lng"}, 半径, エリア名を除いたキーワード) を返す。
+        エリアが見つからない場合は None を返す。
+        """
+        keywords = split_keywords(query)
+        if not keywords:
+            return None
+
+        for i, keyword in enumerate(keywords):
+            area = self._lookup(keyword)
+            if area:
+                return self._resolved(keyword, area, keywords[:i] + keywords[i + 1:])
+
+        # 「新宿でランチ」のように、エリア名とほかの言葉が空白なしで続いている場合は分けて探す
+        for i, keyword in enumerate(keywords):
+            split = self._split_area(keyword)
+            if split:
+                area = self._lookup(split[0])
+                if area:
+                    return self._resolved(split[0], area, keywords[:i] + split[1:] + keywords[i + 1:])
+
+        # キャッシュにない場合は、エリア名が来ることの多い先頭のキーワードが地名らしい時だけジオコーディングする
+        first_keyword, rest = keywords[0], keywords[1:]
+        split = self._split_area(first_keyword)
+        if split:
+            first_keyword, rest = split[0], split[1:] + rest
+        if first_keyword in self._misses or not looks_like_place(first_keyword):
+            return None
+        if self.acquire is not None and not self.acquire():
+            # レート制限を超えた場合は、キャッシュせずにエリアなしとして検索する
+            logger.info("レート制限のため、エリアのジオコーディングを見送ります", extra={"keyword": first_keyword})
+            return None
+        area = self._geocode(first_keyword)
+        if not area:
+            return None
+        return self._resolved(first_keyword, area, rest)
+
+    @staticmethod
+    def _resolved(name: str, area: dict, remaining: list) -> tuple:
+        return name, {"lat": area["lat"], "lng": area["lng"]}, area["radius"], " ".join(remaining)
+
+    def _split_area(self, keyword: str):
+        """
+        空白なしで続けて書かれた言葉を、先頭のエリア名らしい部分と残りに分け、[エリア名, 残り...] を返す。
+        分けられない場合は None を返す。
+        """
+        # 「新宿でランチ」「丸の内のカフェ」: 助詞などの前がエリア名らしければ、そこで分ける
+        for match in _PARTICLES.finditer(keyword):
+            head = keyword[:match.start()]
+            if head and (self._lookup(head) or looks_like_place(head)):
+                tail = keyword[match.end():]
+                # 「新宿駅周辺で」のように続く助詞は取り除く
+                while _PARTICLES.match(tail):
+                    tail = tail[_PARTICLES.match(tail).end():]
+                return [head] + ([tail] if tail else [])
+
+        # 「渋谷イタリアン」「三軒茶屋居酒屋」: 末尾のジャンルを切り離す（長い言葉から試す）
+        for genre in sorted(GENRE_WORDS, key=len, reverse=True):
+            head = keyword[:-len(genre)]
+            if keyword.endswith(genre) and head and (self._lookup(head) or looks_like_place(head)):
+                return [head, genre]
+
+        # 「新宿和食」: 言葉全体は地名らしくなくても、登録済みのエリア名で始まれば、そこで分ける
+        # 「新宿御苑」のように全体が地名らしい言葉は、そのままジオコーディングする
+        if not looks_like_place(keyword):
+            with self._lock:
+                names = sorted(self._areas, key=len, reverse=True)
+            for name in names:
+                if keyword.startswith(name) and len(keyword) > len(name):
+                    return [name, keyword[len(name):]]
+        return None
+
+    def _lookup(self, keyword: str):
+        area = self._areas.get(keyword)
+        # 「新宿駅」のような駅名は、「新宿」として登録されていればそれを使う
+        if area is None and keyword.endswith("駅"):
+            area = self._areas.get(keyword[:-1])
+        return area
+
+    def _geocode(self, keyword: str):
+        area = None
+        try:
+            with stage_timer("geocode"):
+                results = self.gmaps.geocode(keyword, language="ja", region="jp") if self.gmaps else []
+        except Exception as e:
+            # 一時的なエラーの可能性があるため、キャッシュせずに終える
+            logger.warning("エリアのジオコーディング中にエラーが発生しました: %s", e, extra={"keyword": keyword})
+            return None
+
+        for result in results:
+            if AREA_RESULT_TYPES & set(result.get("types", [])):
+                geometry = result["geometry"]
+                location = geometry["location"]
+                area = {
+                    "lat": location["lat"],
+                    "lng": location["lng"],
+                    "radius": self._radius_from_viewport(geometry.get("viewport")),
+                }
+                break
+
+        if area is None:
+            self._misses.put(keyword, True)
+            logger.info("エリアではない言葉として覚えておきます", extra={"keyword": keyword})
+            return None
+        self._store(keyword, area)
+        logger.info("エリアを解決しました", extra={"keyword": keyword, "area": area})
+        return area
+
+    @staticmethod
+    def _radius_from_viewport(viewport: dict) -> int:
+        """表示範囲(viewport)の対角線の半分を、検索半径の目安にする"""
+        if not viewport:
+            return MIN_RADIUS
+        northeast, southwest = viewport["northeast"], viewport["southwest"]
+        center_lat = (northeast["lat"] + southwest["lat"]) / 2
+        d_lat = (northeast["lat"] - southwest["lat"]) * METERS_PER_DEG
+        d_lng = (northeast["lng"] - southwest["lng"]) * METERS_PER_DEG * math.cos(math.radians(center_lat))
+        radius = int(math.hypot(d_lat, d_lng) / 2)
+        return max(MIN_RADIUS, min(MAX_RADIUS, radius))
+
+    def _store(self, keyword: str, area: dict):
+        with self._lock:
+            self._areas[keyword] = area
+            if not self.cache_path:
+                return
+            # 初期値として持っているエリアはファイルに書き出さない
+            learned = {name: value for name, value in self._areas.items() if name not in KNOWN_AREAS}
+            # 一時ファイルに書いてから置き換え、書き込み中に止まってもファイルが壊れないようにする
+            temp_path = f"{self.cache_path}.tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(learned, f, ensure_ascii=False)
+                os.replace(temp_path, self.cache_path)
+            except OSError as e:
+                logger.warning("エリアキャッシュの保存中にエラーが発生しました: %s", e)
@@ -0,0 +1,265 @@
+# app/container.py
+"""
+アプリで共有するクライアントとサービスを、初めて使われた時に作るコンテナ。
+vertexai・googlemaps のimportとクライアントの初期化は重い（数秒かかる）ため、起動時には行わず、
+最初に必要になった時か、/ready でのウォームアップ時に行う。
+
+    container = build_container()
+    container.ai_agent          # 初めて参照された時に、依存するサービスごと作られる
+    container.override("line_bot_api", fake)  # ベンチマークなどで差し替える
+"""
+import os
+import threading
+import time
+
+from .metrics import REGISTRY
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+GEMINI_MODEL_NAME = "gemini-2.5-flash"
+
+# リクエストの処理に必要なサービス（依存するサービスも含めて、ウォームアップでまとめて作る）
+WARM_UP_SERVICES = ("line_bot_api", "line_actions", "ai_agent")
+
+STARTUP_SECONDS = REGISTRY.gauge(
+    "restaurant_agent_startup_seconds",
+    "起動処理の所要時間（秒）（phase: import / warm_up）",
+    ("phase",),
+)
+SERVICE_INIT_SECONDS = REGISTRY.gauge(
+    "restaurant_agent_service_init_seconds",
+    "サービスごとの初期化の所要時間（秒）（依存するサービスの初期化を含む）",
+    ("service",),
+)
+
+
+class ServiceContainer:
+    """
+    名前ごとに登録した作成関数(factory)を、初めて参照された時に1回だけ呼び出して、結果を共有する。
+    作成関数はコンテナを引数に受け取り、依存するサービスを container.get() で取得する。
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._lock = threading.Lock()
+        # 同じサービスを複数のスレッドが同時に作らないよう、サービスごとにロックする
+        self._service_locks = {}
+
+    def register(self, name: str, factory):
+        self._factories[name] = factory
+
+    def override(self, name: str, instance):
+        """サービスを、作成済みのインスタンスに差し替える"""
+        with self._lock:
+            self._instances[name] = instance
+
+    def initialized(self, name: str) -> bool:
+        return name in self._instances
+
+    def get(self, name: str):
+        if name in self._instances:
+            return self._instances[name]
+        if name not in self._factories:
+            raise KeyError(f"サービス {name} は登録されていません。")
+
+        with self._lock:
+            service_lock = self._service_locks.setdefault(name, threading.Lock())
+        with service_lock:
+            if name not in self._instances:
+                started = time.perf_counter()
+                instance = self._factories[name](self)
+                elapsed = time.perf_counter() - started
+                SERVICE_INIT_SECONDS.set(elapsed, service=name)
+                logger.info("サービスを初期化しました", extra={"service": name, "elapsed_ms": round(elapsed * 1000, 1)})
+                with self._lock:
+                    self._instances[name] = instance
+        return self._instances[name]
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get(name)
+
+    def warm_up(self, names: tuple = WARM_UP_SERVICES) -> dict:
+        """
+        namesのサービスを作っておく。作れなかったサービスの {名前: エラー} を返す（すべて作れた場合は空）。
+        """
+        started = time.perf_counter()
+        errors = {}
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.exception("サービスの初期化に失敗しました: %s", e, extra={"service": name})
+                errors[name] = f"{type(e).__name__}: {e}"
+        STARTUP_SECONDS.set(time.perf_counter() - started, phase="warm_up")
+        return errors
+
+
+# --- 各サービスの作成関数 ---
+
+def _create_recorder(container):
+    # RECORD_PATH を指定すると、外部とのやりとりをそのファイルに記録する（リプレイ用）
+    if not os.getenv("RECORD_PATH"):
+        return None
+    from .recorder import Recorder
+    return Recorder(os.getenv("RECORD_PATH"))
+
+
+def _recording(container, kind: str, client):
+    """記録が有効な場合は、クライアントを呼び出しを記録するものに包む"""
+    recorder = container.get("recorder")
+    return recorder.wrap(kind, client) if recorder else client
+
+
+def _create_line_bot_api(container):
+    from linebot import LineBotApi
+    return _recording(container, "line", LineBotApi(os.getenv("LINE_CHANNEL_ACCESS_TOKEN")))
+
+
+def _create_vertexai(container):
+    import vertexai
+    # GCP_PROJECT_IDと認証情報を使用。リージョンはプロジェクトに合わせてください
+    vertexai.init(project=os.getenv("GCP_PROJECT_ID"), location="us-central1")
+    return vertexai
+
+
+def _create_gemini_tools(container):
+    from vertexai.preview.generative_models import Tool
+    from .function_definitions import get_function_declarations
+    container.get("vertexai")
+    return [Tool.from_function_declarations(get_function_declarations())]
+
+
+def _create_gemini_model(container):
+    try:
+        from vertexai.preview.generative_models import GenerativeModel
+        return _recording(container, "gemini", GenerativeModel(GEMINI_MODEL_NAME, tools=container.get("gemini_tools")))
+    except Exception as e:
+        logger.error("Vertex AI initialization failed: %s", e)
+        return None
+
+
+def _create_context_cache(container):
+    # システムプロンプトとツールの定義をVertex AIのコンテキストキャッシュに登録し、毎回送らずに済ませる（任意）
+    if not container.get("gemini_model") or os.getenv("GEMINI_CONTEXT_CACHE_ENABLED", "false").lower() != "true":
+        return None
+    from .ai_agent import SYSTEM_PROMPT
+    from .context_cache import ContextCache, VertexCachedContentBackend
+    backend = VertexCachedContentBackend(GEMINI_MODEL_NAME, container.get("gemini_tools"))
+    recorder = container.get("recorder")
+    if recorder:
+        from .recorder import RecordingCachedContentBackend
+        backend = RecordingCachedContentBackend(backend, recorder)
+    return ContextCache(
+        backend,
+        SYSTEM_PROMPT,
+        ttl_seconds=int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600")),
+        refresh_margin_seconds=int(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_MARGIN", "300")),
+    )
+
+
+def _create_gmaps(container):
+    try:
+        import googlemaps  # パッケージ名がgooglemapsであることに注意
+        client = googlemaps.Client(key=os.getenv("Maps_API_KEY"))  # .envのキー名に合わせてください
+    except Exception as e:
+        logger.error("Google Maps Client initialization failed: %s", e)
+        return None
+    return _recording(container, "maps", client)
+
+
+def _create_rate_limiter(container):
+    from .rate_limiter import RateLimiter
+    # グループ・ユーザーごと、外部APIごとの1分あたりの呼び出し回数の上限（0は無制限）
+    return RateLimiter({
+        "group": float(os.getenv("RATE_LIMIT_GROUP_PER_MIN", "30")),
+        "user": float(os.getenv("RATE_LIMIT_USER_PER_MIN", "15")),
+        "gemini": float(os.getenv("RATE_LIMIT_GEMINI_PER_MIN", "300")),
+        "places": float(os.getenv("RATE_LIMIT_PLACES_PER_MIN", "100")),
+    })
+
+
+def _create_local_index(container):
+    from .local_index import LocalPlaceIndex
+    # 過去の検索結果から作るローカルインデックス（よく検索されるエリアの高速化と、Places API障害時の代替）
+    return LocalPlaceIndex(
+        os.getenv("LOCAL_INDEX_PATH", "local_index.sqlite3"),
+        max_places=int(os.getenv("LOCAL_INDEX_MAX_PLACES", "20000")),
+    )
+
+
+def _create_gmaps_actions(container):
+    from .google_maps_actions import GoogleMapsActions
+    return GoogleMapsActions(
+        container.get("gemini_model"),
+        os.getenv("NGROK_BASE_URL", ""),
+        local_index=container.get("local_index"),
+        local_index_first=os.getenv("LOCAL_INDEX_FIRST", "false").lower() == "true",
+        area_cache_path=os.getenv("AREA_CACHE_PATH", "area_cache.json"),
+        gmaps_client=container.get("gmaps"),
+        rate_limiter=container.get("rate_limiter"),
+        search_cache=container.get("search_cache"),
+        enrichment_workers=int(os.getenv("ENRICHMENT_WORKERS", "4")),
+    )
+
+
+def _create_search_cache(container):
+    from .search_cache import SearchResultCache
+    # 正規化した検索条件ごとに、Places APIの検索結果を SEARCH_CACHE_TTL 秒保持する
+    return SearchResultCache(
+        ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL", "600")),
+        max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "500")),
+    )
+
+
+def _create_line_actions(container):
+    from .line_actions import LineActions
+    # PROGRESSIVE_CAROUSEL=true の場合、候補をすぐに返信し、口コミの要約はそろってからプッシュで送り直す
+    # 先に要約を取得するのは先頭の PROGRESSIVE_ENRICH_LIMIT 枚だけ（1枚ごとにPlace DetailsとGeminiを1回ずつ呼ぶ）
+    return LineActions(
+        container.get("line_bot_api"),
+        container.get("gmaps_actions"),
+        progressive_carousel=os.getenv("PROGRESSIVE_CAROUSEL", "false").lower() == "true",
+        progressive_enrich_limit=int(os.getenv("PROGRESSIVE_ENRICH_LIMIT", "1")),
+    )
+
+
+def _create_ai_agent(container):
+    from .ai_agent import AIAgent
+    return AIAgent(
+        container.get("gemini_model"),
+        container.get("line_actions"),
+        context_cache=container.get("context_cache"),
+        rate_limiter=container.get("rate_limiter"),
+    )
+
+
+def _create_scheduler(container):
+    from .scheduler import EventScheduler
+    # 処理待ちが WEBHOOK_MAX_QUEUE_DEPTH 件を超えたら、決まったコマンド以外は「混み合っています」と返す
+    return EventScheduler(
+        workers=int(os.getenv("WEBHOOK_WORKERS", "8")),
+        max_depth=int(os.getenv("WEBHOOK_MAX_QUEUE_DEPTH", "200")),
+    )
+
+
+def build_container() -> ServiceContainer:
+    container = ServiceContainer()
+    container.register("recorder", _create_recorder)
+    container.register("line_bot_api", _create_line_bot_api)
+    container.register("vertexai", _create_vertexai)
+    container.register("gemini_tools", _create_gemini_tools)
+    container.register("gemini_model", _create_gemini_model)
+    container.register("context_cache", _create_context_cache)
+    container.register("gmaps", _create_gmaps)
+    container.register("rate_limiter", _create_rate_limiter)
+    container.register("local_index", _create_local_index)
+    container.register("search_cache", _create_search_cache)
+    container.register("gmaps_actions", _create_gmaps_actions)
+    container.register("line_actions", _create_line_actions)
+    container.register("ai_agent", _create_ai_agent)
+    container.register("scheduler", _create_scheduler)
+    return container
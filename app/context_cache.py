@@ -0,0 +1,160 @@
+# app/context_cache.py
+"""
+毎回同じ内容を送っている先頭部分（システムプロンプトとツールの定義）を、
+Vertex AIのコンテキストキャッシュ（CachedContent）に登録して使い回す。
+
+- キャッシュはTTL付きで作成し、期限が近づいたら使う時に延長する
+- 失効していた場合や延長に失敗した場合は作り直す（作り直すたびに generation が増える）
+- 作成できない場合（トークン数が最小サイズに満たない、権限がない など）は None を返し、
+  呼び出し側はキャッシュを使わない通常のモデルで処理を続ける
+- 作成に失敗した後の再試行は別スレッドで行い、再試行中も呼び出し側を待たせない
+"""
+import datetime
+import threading
+import time
+
+from .metrics import REGISTRY, stage_timer
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+CONTEXT_CACHE_EVENTS = REGISTRY.counter(
+    "restaurant_agent_context_cache_events_total",
+    "コンテキストキャッシュの操作回数（event: create / refresh / error）",
+    ("event",),
+)
+
+# 作成に失敗した後、次に作成を試みるまでの秒数（再試行は別スレッドで行う）
+RETRY_INTERVAL_SECONDS = 60
+
+
+class VertexCachedContentBackend:
+    """Vertex AIのCachedContentを使って、キャッシュを作成・延長する"""
+
+    def __init__(self, model_name: str, tools: list = None):
+        self.model_name = model_name
+        self.tools = tools
+
+    def create(self, system_instruction: str, ttl: datetime.timedelta):
+        from vertexai.preview import caching
+        return caching.CachedContent.create(
+            model_name=self.model_name,
+            system_instruction=system_instruction,
+            tools=self.tools,
+            ttl=ttl,
+            display_name="restaurant-agent-prefix",
+        )
+
+    def extend(self, cached_content, ttl: datetime.timedelta):
+        cached_content.update(ttl=ttl)
+
+    def model_for(self, cached_content):
+        from vertexai.preview.generative_models import GenerativeModel
+        return GenerativeModel.from_cached_content(cached_content=cached_content)
+
+
+class ContextCache:
+    """
+    システムプロンプトとツールの定義をキャッシュしたモデルを管理する。
+    複数のスレッドから呼ばれても、キャッシュの作成・延長は1つずつ行う。
+    作成に失敗した後の再試行だけは、ロックを持たずに別スレッドで行う（失敗が続く間、毎回待たせないため）。
+    """
+
+    def __init__(self, backend, system_instruction: str, ttl_seconds: int = 3600,
+                 refresh_margin_seconds: int = 300):
+        self.backend = backend
+        self.system_instruction = system_instruction
+        self.ttl_seconds = ttl_seconds
+        # 残り時間がこれを下回ったら延長する
+        self.refresh_margin_seconds = min(refresh_margin_seconds, ttl_seconds / 2)
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._cached_content = None
+        self._model = None
+        self._expires_at = 0.0
+        # 作成に失敗した場合、次に再試行してよい時刻（失敗していなければ0）
+        self._retry_at = 0.0
+        self._retry_thread = None
+
+    def get_model(self):
+        """
+        キャッシュを参照するモデルと、そのキャッシュの世代を (model, generation) で返す。
+        キャッシュを使えない場合は None を返す。
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._model is not None and now < self._expires_at - self.refresh_margin_seconds:
+                return self._model, self.generation
+
+            if self._model is not None and now < self._expires_at and self._extend(now):
+                return self._model, self.generation
+
+            if self._retry_thread is not None or now < self._retry_at:
+                return None
+            if self._retry_at:
+                # 前回失敗している場合は、別スレッドで再試行し、その間はキャッシュなしで処理させる
+                self._retry_thread = threading.Thread(
+                    target=self._retry_create, name="context-cache-retry", daemon=True)
+                self._retry_thread.start()
+                return None
+            if self._create(now):
+                return self._model, self.generation
+            return None
+
+    def _ttl(self) -> datetime.timedelta:
+        return datetime.timedelta(seconds=self.ttl_seconds)
+
+    def _extend(self, now: float) -> bool:
+        try:
+            with stage_timer("context_cache_refresh"):
+                self.backend.extend(self._cached_content, self._ttl())
+        except Exception as e:
+            logger.warning("コンテキストキャッシュの延長に失敗したため、作り直します: %s", e)
+            CONTEXT_CACHE_EVENTS.inc(event="error")
+            return False
+        self._expires_at = now + self.ttl_seconds
+        CONTEXT_CACHE_EVENTS.inc(event="refresh")
+        return True
+
+    def _create(self, now: float) -> bool:
+        try:
+            cached_content, model = self._build()
+        except Exception as e:
+            self._failed(e, now)
+            return False
+        self._install(cached_content, model, now)
+        return True
+
+    def _retry_create(self):
+        """別スレッドで作成を再試行する。APIの呼び出し中はロックを持たない"""
+        try:
+            cached_content, model = self._build()
+        except Exception as e:
+            with self._lock:
+                self._failed(e, time.monotonic())
+                self._retry_thread = None
+            return
+        with self._lock:
+            self._install(cached_content, model, time.monotonic())
+            self._retry_thread = None
+
+    def _build(self) -> tuple:
+        with stage_timer("context_cache_create"):
+            cached_content = self.backend.create(self.system_instruction, self._ttl())
+            return cached_content, self.backend.model_for(cached_content)
+
+    def _failed(self, error: Exception, now: float):
+        logger.warning("コンテキストキャッシュを作成できませんでした。キャッシュを使わずに処理します: %s", error)
+        CONTEXT_CACHE_EVENTS.inc(event="error")
+        self._cached_content = None
+        self._model = None
+        self._retry_at = now + RETRY_INTERVAL_SECONDS
+
+    def _install(self, cached_content, model, now: float):
+        self._cached_content = cached_content
+        self._model = model
+        self._expires_at = now + self.ttl_seconds
+        self._retry_at = 0.0
+        self.generation += 1
+        CONTEXT_CACHE_EVENTS.inc(event="create")
+        logger.info("コンテキストキャッシュを作成しました", extra={"generation": self.generation})
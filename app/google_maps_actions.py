@@ -1,14 +1,103 @@
 # app/google_maps_actions.py
+import contextvars
+import functools
 import os
-import googlemaps
-from vertexai.generative_models import GenerativeModel
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .place_cursor import PlaceResultCursor
+from .local_index import LocalPlaceIndex
+from .area_resolver import AreaResolver
+from .rate_limiter import RateLimiter, RateLimitExceeded, GLOBAL_KEY
+from .search_cache import SearchResultCache, TTLCache, normalize_search, normalize_keywords
+from .models import Enrichment, Restaurant
+from .metrics import stage_timer, record_token_usage
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# 取得する情報の段階（tier）
+# lite: テキスト検索の結果とキャッシュ済みのAI分析だけでカードを作る（追加のAPI呼び出しなし）
+# full: 詳細API（口コミ・写真・ウェブサイト）とAIによる要約・ジャンル推定まで行う
+TIER_LITE = "lite"
+TIER_FULL = "full"
+
+# full tierで詳細情報として取得するフィールド
+FULL_DETAIL_FIELDS = ['name', 'formatted_address', 'website', 'rating', 'user_ratings_total', 'photo', 'reviews', 'place_id']
+
+# lite tierでジャンル表示に使う、Placesのtypeと日本語表記の対応
+PLACE_TYPE_LABELS = {
+    'cafe': 'カフェ',
+    'bar': 'バー',
+    'bakery': 'ベーカリー',
+    'meal_takeaway': 'テイクアウト',
+    'meal_delivery': 'デリバリー',
+    'restaurant': 'レストラン',
+}
+
+# エリア名だけで検索された場合に、周辺検索で使うキーワード
+DEFAULT_NEARBY_KEYWORD = "飲食店"
+
+# 1セッションあたりに保持する検索カーソルの数（古いものから捨てる）
+MAX_CURSORS_PER_SESSION = 5
+
+# お店のAI分析と検索結果をplace_idごとに保持する時間（秒）と件数の上限
+ENRICHMENT_CACHE_TTL_SECONDS = 24 * 60 * 60
+PLACE_CACHE_TTL_SECONDS = 6 * 60 * 60
+PLACE_CACHE_MAX_ENTRIES = 5000
+
+# 複数のお店の詳細とAI分析を並行して取得する時の、最大の同時実行数
+DEFAULT_ENRICHMENT_WORKERS = 4
 
 class GoogleMapsActions:
-    def __init__(self, gemini_model: GenerativeModel, ngrok_base_url: str):
-        self.gmaps = googlemaps.Client(key=os.getenv("Maps_API_KEY"))
+    def __init__(
+        self,
+        gemini_model,
+        ngrok_base_url: str,
+        default_tier: str = TIER_LITE,
+        local_index: LocalPlaceIndex = None,
+        local_index_first: bool = False,
+        area_cache_path: str = None,
+        gmaps_client=None,
+        rate_limiter: RateLimiter = None,
+        search_cache: SearchResultCache = None,
+        enrichment_workers: int = DEFAULT_ENRICHMENT_WORKERS,
+    ):
+        # gmaps_clientを渡すと、そのクライアントを使う（共有のクライアントや、ベンチマーク用の偽クライアントなど）
+        if gmaps_client is None:
+            import googlemaps
+            gmaps_client = googlemaps.Client(key=os.getenv("Maps_API_KEY"))
+        self.gmaps = gmaps_client
         self.gemini_model = gemini_model
         self.maps_api_key = os.getenv("Maps_API_KEY")
         self.ngrok_base_url = ngrok_base_url
+        self.default_tier = default_tier
+        # place_idごとのAI分析結果（Enrichment：口コミ要約・ジャンル）のキャッシュ
+        # 一度full tierで取得したお店は、以降のliteカードでも要約を表示できる
+        # プロセスが動き続けても増え続けないよう、期限と件数の上限を設ける
+        self.enrichment_cache = TTLCache(ENRICHMENT_CACHE_TTL_SECONDS, PLACE_CACHE_MAX_ENTRIES)
+        # place_idごとの検索結果（タップ時の詳細取得で使う）
+        self.place_cache = TTLCache(PLACE_CACHE_TTL_SECONDS, PLACE_CACHE_MAX_ENTRIES)
+        # セッションIDごとの検索カーソル {session_id: OrderedDict({検索条件: PlaceResultCursor})}
+        # 「他のお店を見る」で、同じ検索をやり直さずに続きを取り出すために使う
+        self.result_cursors = {}
+        # 過去の検索結果から作るローカルインデックス（Places APIの代替・先行検索用）
+        self.local_index = local_index
+        # Trueの場合、ローカルインデックスで十分な件数が見つかればPlaces APIを呼ばない
+        self.local_index_first = local_index_first
+        # キーワード中のエリア名を座標に変換し、テキスト検索ではなく周辺検索を使うためのリゾルバ
+        # ジオコーディングもPlaces APIと同じレート制限の中で行う
+        self.area_resolver = AreaResolver(self.gmaps, area_cache_path, acquire=functools.partial(self._acquire, "places"))
+        # Places APIとAI分析（Gemini）の呼び出し回数の制限
+        self.rate_limiter = rate_limiter
+        # 正規化した検索条件ごとの検索結果のキャッシュ（言い換えた同じ検索でPlaces APIを呼ばないため）
+        self.search_cache = search_cache
+        # full tierの情報を並行して取得する時の同時実行数
+        self.enrichment_workers = max(1, enrichment_workers)
+
+    def _acquire(self, api: str, cost: int = 1) -> bool:
+        """外部APIを呼び出してよいか。レート制限がなければ常にTrue"""
+        return self.rate_limiter is None or self.rate_limiter.try_acquire((api, GLOBAL_KEY), cost=cost)
 
     def search_and_format_restaurants(
         self, 
@@ -18,57 +107,246 @@ class GoogleMapsActions:
         min_price: int = None,
         max_price: int = None,
         max_results: int = 3, 
+        tier: str = None,
+        session_id: str = None,
         # target_datetime: datetime = None
     ) -> list:
-        if not self.gmaps:
-            print("Google Maps client not initialized.")
+        """
+        お店を検索し、カード表示用の Restaurant のリストを返す。
+        tierが"lite"の場合は検索結果のみで整形し、"full"の場合は詳細情報とAI分析まで行う。
+        session_idを指定すると検索カーソルを保持し、show_more_restaurantsで続きを取得できる。
+        """
+        tier = tier or self.default_tier
+        if not self.gmaps and self.local_index is None:
+            logger.error("Google Maps client not initialized.")
+            return []
+        if not query and not (location and radius):
+            logger.warning("検索キーワードまたは位置情報が指定されていません。")
             return []
-        print(f"Google Mapsで検索中: {query}")
+
+        # 語順や「あり」などの言い回しが違うだけの検索は、同じキーになる
+        search_key = normalize_search(query, location, radius, min_price, max_price)
+
         try:
-            # パラメータを動的に構築
-            params = { 'language': 'ja' }
-            if query:
-                params['keyword'] = query
-            if min_price is not None:
-                params['min_price'] = min_price
-            if max_price is not None:
-                params['max_price'] = max_price
+            cached = self.search_cache.get(search_key) if self.search_cache is not None else None
+            if cached is not None:
+                # キャッシュには1ページ目の結果だけを持つ。next_page_tokenはキャッシュの有効期間より早く
+                # 無効になることがあるため、続きが必要になったら検索し直して新しいトークンを使う
+                results, has_more = cached
+                logger.info("検索結果のキャッシュを使います", extra={"query": query, "tier": tier})
+                search_again = None
+                if has_more:
+                    search_again = functools.partial(
+                        self._resolve_and_search, query, location, radius, min_price, max_price, max_results, tier)
+                cursor = PlaceResultCursor(None, {'results': results}, search_again=search_again)
+            else:
+                places_result, fetch_page = self._resolve_and_search(query, location, radius, min_price, max_price, max_results, tier)
+                if places_result is None:
+                    return []
+                # Places APIの結果だけをキャッシュする（ローカルインデックスでの代替結果は一時的なもの）
+                if self.search_cache is not None and fetch_page is not None:
+                    has_more = bool(places_result.get('next_page_token'))
+                    self.search_cache.put(search_key, (list(places_result.get('results', [])), has_more))
+                cursor = PlaceResultCursor(fetch_page, places_result)
+
+            if session_id:
+                self._store_cursor(session_id, search_key, cursor)
 
+            return self._format_places(cursor.take(max_results), tier)
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.exception("Google Maps APIの処理中にエラーが発生しました: %s", e)
+            return []
+
+    def _resolve_and_search(self, query, location, radius, min_price, max_price, max_results, tier) -> tuple:
+        # 位置情報の指定がなければ、キーワード中のエリア名（「新宿」など）を座標に変換して周辺検索にする
+        # 範囲とキーワードが絞られるため、同じエリアの検索がキャッシュに当たりやすくなる
+        if not (location and radius):
+            resolved = self.area_resolver.resolve(query)
+            if resolved:
+                area_name, location, radius, query = resolved
+                query = query or DEFAULT_NEARBY_KEYWORD
+                logger.debug("エリア名から周辺検索に切り替えます", extra={"area": area_name, "radius": radius})
+
+        logger.info("Google Mapsで検索中", extra={"query": query, "tier": tier})
+        return self._search_places(query, location, radius, min_price, max_price, max_results)
+
+    def _search_places(self, query, location, radius, min_price, max_price, max_results) -> tuple:
+        """
+        検索結果の1ページ目と、次のページを取得する関数の組を返す。
+        ローカルインデックスを優先する設定で十分な件数が見つかればAPIを呼ばず、
+        Places APIが失敗した場合や、レート制限を超えた場合はローカルインデックスの結果で代替する。
+        レート制限を超えてローカルインデックスにも結果がなければ、RateLimitExceededを送出する。
+        """
+        if self.local_index is not None and self.local_index_first:
+            with stage_timer("local_index_search"):
+                hits = self.local_index.search(query, location, radius, min_price, max_price)
+            if len(hits) >= max_results:
+                logger.info("ローカルインデックスから検索結果を取得しました", extra={"query": query, "hits": len(hits)})
+                return {'results': hits}, None
+
+        if not self.gmaps:
+            return self._search_local_index_fallback(query, location, radius, min_price, max_price)
+
+        if not self._acquire("places"):
+            logger.warning("Places APIのレート制限を超えたため、ローカルインデックスで代替します", extra={"query": query})
+            places_result, fetch_page = self._search_local_index_fallback(query, location, radius, min_price, max_price)
+            if places_result is None:
+                raise RateLimitExceeded("places")
+            return places_result, fetch_page
+
+        # パラメータを動的に構築
+        params = { 'language': 'ja' }
+        if query:
+            params['keyword'] = query
+        if min_price is not None:
+            params['min_price'] = min_price
+        if max_price is not None:
+            params['max_price'] = max_price
+
+        try:
             # locationが指定されていれば、周辺検索(nearby_search)を利用
             if location and radius:
                 params['location'] = (location['lat'], location['lng'])
                 params['radius'] = radius
-                places_result = self.gmaps.places_nearby(**params)
+                with stage_timer("places_nearby_search", keyword_chars=len(query or ""), radius=radius):
+                    places_result = self.gmaps.places_nearby(**params)
+                search_page = self.gmaps.places_nearby
             # locationがなければ、これまで通りのテキスト検索(places)
-            elif query:
+            else:
                 params['query'] = query
                 del params['keyword'] # placesではkeyword引数はないため削除
-                places_result = self.gmaps.places(**params)
-            else:
-                print("検索キーワードまたは位置情報が指定されていません。")
-                return []
-            
-            formatted_restaurants = []
-            for place in places_result.get('results', [])[:max_results]:
-                place_id = place.get('place_id')
-                if not place_id:
-                    continue
-
-                # ★★★ ここが修正点 ① ★★★
-                # 詳細情報取得のリクエストから 'types' を削除
-                fields = ['name', 'formatted_address', 'website', 'rating', 'user_ratings_total', 'photo', 'reviews', 'place_id']
-                details = self.gmaps.place(place_id=place_id, fields=fields, language='ja').get('result', {})
-                
-                # ★★★ ここが修正点 ② ★★★
-                # 整形用の関数に、最初の検索結果(place)も渡すようにする
-                formatted_restaurant = self._format_place_details(details, place)
-                formatted_restaurants.append(formatted_restaurant)
-            
-            return formatted_restaurants
+                with stage_timer("places_text_search", query_chars=len(query or "")):
+                    places_result = self.gmaps.places(**params)
+                search_page = self.gmaps.places
         except Exception as e:
-            print(f"Google Maps APIの処理中にエラーが発生しました: {e}")
+            logger.warning("Places APIの検索に失敗したため、ローカルインデックスで代替します: %s", e)
+            return self._search_local_index_fallback(query, location, radius, min_price, max_price)
+
+        def fetch_page(page_token):
+            if not self._acquire("places"):
+                raise RateLimitExceeded("places")
+            with stage_timer("places_next_page"):
+                page = search_page(page_token=page_token)
+            self._add_to_local_index(page, query)
+            return page
+
+        self._add_to_local_index(places_result, query)
+        return places_result, fetch_page
+
+    def _search_local_index_fallback(self, query, location, radius, min_price, max_price) -> tuple:
+        if self.local_index is None:
+            return None, None
+        with stage_timer("local_index_search"):
+            hits = self.local_index.search(query, location, radius, min_price, max_price)
+        if not hits:
+            return None, None
+        return {'results': hits}, None
+
+    def _add_to_local_index(self, places_result: dict, query: str):
+        if self.local_index is not None:
+            self.local_index.add_places(places_result.get('results', []), query)
+
+    def show_more_restaurants(
+        self,
+        session_id: str,
+        query: str = None,
+        max_results: int = 3,
+        tier: str = None,
+    ) -> list:
+        """
+        以前の検索の続きを返す。検索はやり直さず、バッファ済みの結果か次のページから取り出す
+        （キャッシュした結果から始めた検索だけは、1ページ目を使い切った時に一度検索し直す）。
+        queryを省略した場合は、そのセッションで最後に行った検索の続きを返す。
+        """
+        tier = tier or self.default_tier
+        cursors = self.result_cursors.get(session_id)
+        if not cursors:
+            return []
+
+        cursor = None
+        if query:
+            # 同じキーワード（正規化したもの）の検索のうち、最も新しいものを使う
+            keywords = normalize_keywords(query)
+            for cursor_key in reversed(cursors):
+                if cursor_key[0] == keywords:
+                    cursor = cursors[cursor_key]
+                    break
+        if cursor is None:
+            cursor = next(reversed(cursors.values()))
+
+        try:
+            return self._format_places(cursor.take(max_results), tier)
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.exception("Google Maps APIの処理中にエラーが発生しました: %s", e)
             return []
 
+    def _store_cursor(self, session_id: str, cursor_key: tuple, cursor: PlaceResultCursor):
+        cursors = self.result_cursors.setdefault(session_id, OrderedDict())
+        cursors.pop(cursor_key, None)
+        cursors[cursor_key] = cursor
+        while len(cursors) > MAX_CURSORS_PER_SESSION:
+            cursors.popitem(last=False)
+
+    def _format_places(self, places: list, tier: str) -> list:
+        # place_idのない結果はカードにできないため使わない
+        places = [place for place in places if place.get('place_id')]
+        for place in places:
+            self.place_cache.put(place['place_id'], place)
+        if tier != TIER_FULL:
+            return [self._format_place_summary(place) for place in places]
+
+        enriched = self.enrich_restaurants([place['place_id'] for place in places])
+        # 詳細を取得できなかったお店は、検索結果だけのカードで代わりにする
+        return [enriched.get(place['place_id']) or self._format_place_summary(place) for place in places]
+
+    def has_enrichment(self, place_id: str) -> bool:
+        """そのお店のAI分析（口コミ要約・ジャンル）が取得済みか"""
+        return place_id in self.enrichment_cache
+
+    def enrich_restaurants(self, place_ids: list) -> dict:
+        """
+        複数のお店のfull tierの情報を並行して取得し、{place_id: 情報} で返す。
+        レート制限やエラーで取得できなかったお店は結果に含めない。
+        """
+        if not place_ids:
+            return {}
+
+        def enrich(place_id):
+            try:
+                return self.get_restaurant_details(place_id)
+            except RateLimitExceeded:
+                return None
+            except Exception as e:
+                logger.warning("お店の詳細の取得中にエラーが発生しました: %s", e, extra={"place_id": place_id})
+                return None
+
+        if len(place_ids) == 1:
+            results = [enrich(place_ids[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(place_ids), self.enrichment_workers)) as executor:
+                # トレースの区間が呼び出し元のトレースに記録されるよう、コンテキストを引き継ぐ
+                futures = [executor.submit(contextvars.copy_context().run, enrich, place_id) for place_id in place_ids]
+                results = [future.result() for future in futures]
+        return {place_id: result for place_id, result in zip(place_ids, results) if result is not None}
+
+    def get_restaurant_details(self, place_id: str) -> Restaurant:
+        """
+        1軒のお店について、詳細情報（口コミ・写真・ウェブサイト）とAI分析を含むfull tierの情報を返す。
+        カードがタップされた時や、最終決定の時にだけ呼び出す。
+        Places APIのレート制限を超えた場合は RateLimitExceeded を送出する。
+        """
+        if not self._acquire("places"):
+            raise RateLimitExceeded("places")
+        with stage_timer("places_details", place_id=place_id):
+            details = self.gmaps.place(place_id=place_id, fields=FULL_DETAIL_FIELDS, language='ja').get('result', {})
+
+        # 整形には、最初の検索結果(place)も使う
+        return self._format_place_details(details, self.place_cache.get(place_id, {}))
+
     def _get_photo_url(self, photo_reference: str, max_width: int = 800) -> str:
         if not photo_reference or not self.maps_api_key:
             return "https://placehold.co/600x400/EFEFEF/AAAAAA?text=No+Image"
@@ -81,16 +359,16 @@ class GoogleMapsActions:
         if not review_texts: return "高評価です！", "特にネガティブな点はありません。"
         prompt = f"あなたはプロのグルメ評論家です。以下の飲食店の口コミを分析し、ポジティブな点とネガティブな点を、それぞれ50字程度の箇条書きで要約してください。\n\n---口コミ---\n{review_texts}\n\n---要約---\n【ポジティブな点】:\n【ネガティブな点】:\n"
         try:
-            response = self.gemini_model.generate_content(prompt)
+            with stage_timer("ai_review_summary"):
+                response = self.gemini_model.generate_content(prompt)
+            record_token_usage(response, "review_summary")
             good_summary = response.text.split("【ポジティブな点】:")[1].split("【ネガティブな点】:")[0].strip()
             bad_summary = response.text.split("【ネガティブな点】:")[1].strip()
             return good_summary, bad_summary
         except Exception as e:
-            print(f"AIによる口コミ要約中にエラーが発生しました: {e}")
+            logger.warning("AIによる口コミ要約中にエラーが発生しました: %s", e)
             return "口コミ多数で高評価です。", "特筆すべきネガティブな点はありません。"
 
-    # ★★★ ここが変更点 ① ★★★
-    # 口コミと店名からジャンルを推定する新しい関数を追加
     def _extract_genre_by_ai(self, restaurant_name: str, reviews: list) -> str:
         """AIを使って店名と口コミから最も的確なジャンルを抽出する"""
         if not self.gemini_model:
@@ -113,36 +391,81 @@ class GoogleMapsActions:
         ---ジャンル---
         """
         try:
-            response = self.gemini_model.generate_content(prompt)
+            with stage_timer("ai_genre_extraction"):
+                response = self.gemini_model.generate_content(prompt)
+            record_token_usage(response, "genre_extraction")
             # AIの回答から余分なテキストを取り除く
             genre = response.text.strip().replace("ジャンル:", "").replace("【ジャンル】", "").strip()
             return genre or "その他"
         except Exception as e:
-            print(f"AIによるジャンル抽出中にエラーが発生しました: {e}")
+            logger.warning("AIによるジャンル抽出中にエラーが発生しました: %s", e)
             return "その他"
         
-    # ★★★ ここが修正点 ③ ★★★
-    # 引数に place を追加
-    def _format_place_details(self, details: dict, place: dict) -> dict:
+    def _format_place_details(self, details: dict, place: dict) -> Restaurant:
         photo_reference = details.get('photos', [{}])[0].get('photo_reference')
         reviews = details.get('reviews', [])
         restaurant_name = details.get('name', '名前不明')
-        good_summary, bad_summary = self._summarize_reviews_by_ai(reviews)
-        genre = self._extract_genre_by_ai(restaurant_name, reviews)
+        place_id = details.get('place_id') or place.get('place_id')
 
-        # ★★★ ここが修正点 ④ ★★★
-        # ジャンル情報は、詳細(details)ではなく、最初の検索結果(place)から取得する
-        excluded_types = {'restaurant', 'food', 'point_of_interest', 'establishment'}
-        genre_list = [t for t in place.get('types', []) if t not in excluded_types]
-        
-        return {
-            "name": details.get('name', '名前不明'),
-            "image_url": self._get_photo_url(photo_reference),
-            "rating": details.get('rating', 0.0),
-            "userRatingCount": str(details.get('user_ratings_total', 0)),
-            "address": details.get('formatted_address', '-'),
-            "genre": genre,
-            "url": details.get('website', f"https://www.google.com/maps/search/?api=1&query=Google&query_place_id={details.get('place_id')}"),
-            "reviewGoodSummary": good_summary,
-            "reviewBadSummary": bad_summary,
-        }
+        # AI分析は1店舗につき1回だけ行い、結果をキャッシュする
+        enrichment = self.enrichment_cache.get(place_id)
+        if enrichment is None and not self._acquire("gemini", cost=2):
+            # 口コミ要約とジャンル推定の2回分の余裕がなければAI分析を省く（キャッシュはしない）
+            logger.warning("Geminiのレート制限を超えたため、AI分析を省略します", extra={"place_id": place_id})
+            # ジャンルはAPIを呼ばずに求められる、検索結果のtypesから表示する
+            enrichment = Enrichment(self._genre_from_types(place), "ただいま混み合っているため、口コミの要約を表示できません。", "-")
+        if enrichment is None:
+            good_summary, bad_summary = self._summarize_reviews_by_ai(reviews)
+            genre = self._extract_genre_by_ai(restaurant_name, reviews)
+            enrichment = Enrichment(genre, good_summary, bad_summary)
+            if place_id:
+                self.enrichment_cache.put(place_id, enrichment)
+
+        return Restaurant(
+            place_id=place_id,
+            tier=TIER_FULL,
+            name=restaurant_name,
+            image_url=self._get_photo_url(photo_reference),
+            rating=details.get('rating', 0.0),
+            user_rating_count=int(details.get('user_ratings_total', 0)),
+            address=details.get('formatted_address', '-'),
+            genre=enrichment.genre,
+            url=details.get('website', self._get_maps_url(place_id)),
+            review_good_summary=enrichment.review_good_summary,
+            review_bad_summary=enrichment.review_bad_summary,
+        )
+
+    def _format_place_summary(self, place: dict) -> Restaurant:
+        """
+        テキスト検索(または周辺検索)の結果だけで、lite tierのカード情報を作る。
+        詳細APIやAIは呼び出さず、過去にfull tierで取得したAI分析があればそれを使う。
+        """
+        place_id = place.get('place_id')
+        photo_reference = place.get('photos', [{}])[0].get('photo_reference')
+        enrichment = self.enrichment_cache.get(place_id)
+
+        genre = enrichment.genre if enrichment is not None else self._genre_from_types(place)
+
+        return Restaurant(
+            place_id=place_id,
+            tier=TIER_LITE,
+            name=place.get('name', '名前不明'),
+            image_url=self._get_photo_url(photo_reference),
+            rating=place.get('rating', 0.0),
+            user_rating_count=int(place.get('user_ratings_total', 0)),
+            # 周辺検索(places_nearby)の結果には formatted_address がなく vicinity が入る
+            address=place.get('formatted_address') or place.get('vicinity', '-'),
+            genre=genre,
+            url=self._get_maps_url(place_id),
+            review_good_summary=enrichment.review_good_summary if enrichment else "「口コミを見る」で要約を表示します。",
+            review_bad_summary=enrichment.review_bad_summary if enrichment else "-",
+        )
+
+    @staticmethod
+    def _genre_from_types(place: dict) -> str:
+        """検索結果のtypesから、カードに表示するジャンルを決める"""
+        labels = [PLACE_TYPE_LABELS[t] for t in place.get('types', []) if t in PLACE_TYPE_LABELS]
+        return labels[0] if labels else "-"
+
+    def _get_maps_url(self, place_id: str) -> str:
+        return f"https://www.google.com/maps/search/?api=1&query=Google&query_place_id={place_id}"
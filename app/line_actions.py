@@ -5,6 +5,7 @@ from linebot.models import (
     QuickReply,
     QuickReplyButton,
     MessageAction,
+    PostbackAction,
     BubbleContainer,
     CarouselContainer,
     ImageComponent,
@@ -18,40 +19,80 @@ from linebot.models import (
     ButtonsTemplate,
     TemplateSendMessage,
 )
-from dotenv import load_dotenv
-load_dotenv()
 import os
-from .google_maps_actions import GoogleMapsActions
+from .google_maps_actions import GoogleMapsActions, TIER_LITE, TIER_FULL
+from .models import Restaurant
+from .metrics import stage_timer
+from .rate_limiter import RateLimitExceeded, BUSY_MESSAGE
+from .logger import get_logger
+
+logger = get_logger(__name__)
 
 NGROK_BASE_URL = os.getenv("NGROK_BASE_URL")
 
+# LINE Messaging APIの上限：1回の返信・プッシュで送れるメッセージ数と、1つのカルーセルに入れられるカードの数
+MAX_MESSAGES_PER_REQUEST = 5
+MAX_BUBBLES_PER_CAROUSEL = 12
+# progressive_carousel で口コミの要約を先に取得するのは、カルーセルの先頭から何枚までか
+# 要約1件ごとにPlace Details（maps.place）とGeminiを1回ずつ呼ぶため、残りのカードは「口コミを見る」を押された時に取得する
+DEFAULT_PROGRESSIVE_ENRICH_LIMIT = 1
+
 class LineActions:
-    def __init__(self, line_bot_api: LineBotApi, gmaps_actions: GoogleMapsActions):
+    def __init__(self, line_bot_api: LineBotApi, gmaps_actions: GoogleMapsActions, progressive_carousel: bool = False,
+                 progressive_enrich_limit: int = DEFAULT_PROGRESSIVE_ENRICH_LIMIT):
         """
         コンストラクタでLineBotApiのインスタンスを受け取る
+        progressive_carousel がTrueの場合、候補のカルーセルを検索結果だけですぐに返信し、
+        先頭の progressive_enrich_limit 枚の口コミの要約がそろったら、要約入りのカードをプッシュメッセージで送り直す
         """
         self.line_bot_api = line_bot_api
         self.gmaps_actions = gmaps_actions 
+        self.progressive_carousel = progressive_carousel
+        self.progressive_enrich_limit = progressive_enrich_limit
+
+    def _reply_message(self, reply_token: str, messages):
+        """LINEへの返信。すべての返信はここを通し、所要時間を計測する"""
+        if isinstance(messages, list) and len(messages) > MAX_MESSAGES_PER_REQUEST:
+            # 返信トークンは1回しか使えないため、上限を超えた分は送らない
+            logger.warning("返信のメッセージ数が上限を超えたため、超えた分を省略します", extra={"messages": len(messages)})
+            messages = messages[:MAX_MESSAGES_PER_REQUEST]
+        with stage_timer("line_reply"):
+            self.line_bot_api.reply_message(reply_token, messages)
+
+    def _push_messages(self, to: str, messages: list):
+        """LINEへのプッシュ。1回に送れる件数ごとに分けて送る"""
+        for start in range(0, len(messages), MAX_MESSAGES_PER_REQUEST):
+            with stage_timer("line_push"):
+                self.line_bot_api.push_message(to, messages[start:start + MAX_MESSAGES_PER_REQUEST])
 
     def search_restaurants(
         self, 
         reply_token: str, 
         query: str = None, 
         min_price: int = None,
-        max_price: int = None
+        max_price: int = None,
+        session_id: str = None,
     ):
         """
         AIから呼び出される、レストランを検索・提案するための関数。
         """
-        print(f"--- search_restaurants関数がAIによって呼び出されました ---")
+        logger.debug("search_restaurants関数がAIによって呼び出されました")
         
         # ダミーデータではなく、GoogleMapsActionsを使って本物の情報を取得
-        restaurant_list = self.gmaps_actions.search_and_format_restaurants(
-            query=query,
-            min_price=min_price,
-            max_price=max_price,
-            # target_datetime=datetime.now() # 日時指定がない場合は現在時刻で判定
-        )
+        try:
+            restaurant_list = self.gmaps_actions.search_and_format_restaurants(
+                query=query,
+                min_price=min_price,
+                max_price=max_price,
+                # 候補のカルーセルは検索結果だけで作り、口コミ要約はタップされた時に取得する
+                tier=TIER_LITE,
+                # 「他のお店を見る」で続きを出せるよう、セッションごとに検索結果を保持する
+                session_id=session_id,
+                # target_datetime=datetime.now() # 日時指定がない場合は現在時刻で判定
+            )
+        except RateLimitExceeded:
+            self.reply_with_text(reply_token, BUSY_MESSAGE)
+            return {"status": "error", "message": "Rate limit exceeded."}
         
         if not restaurant_list:
             self.reply_with_text(reply_token, "すみません、条件に合うお店が見つかりませんでした。")
@@ -59,8 +100,37 @@ class LineActions:
 
         # 取得した本物のデータでカルーセルを送信
         self.send_restaurant_carousel(reply_token, restaurant_list)
+        self._send_enriched_carousel(session_id, restaurant_list)
         
         return {"status": "success", "message": f"{len(restaurant_list)}件のレストランを提案しました。"}
+
+    def show_more_restaurants(
+        self,
+        reply_token: str,
+        query: str = None,
+        session_id: str = None,
+    ):
+        """
+        AIから、または「他のお店を見る」ボタンから呼び出される、前回の検索の続きを提案する関数。
+        """
+        logger.debug("show_more_restaurants関数が呼び出されました")
+
+        restaurant_list = []
+        if session_id:
+            try:
+                restaurant_list = self.gmaps_actions.show_more_restaurants(session_id, query=query)
+            except RateLimitExceeded:
+                self.reply_with_text(reply_token, BUSY_MESSAGE)
+                return {"status": "error", "message": "Rate limit exceeded."}
+
+        if not restaurant_list:
+            self.reply_with_text(reply_token, "すみません、これ以上の候補は見つかりませんでした。条件を変えて探してみましょうか？")
+            return {"status": "error", "message": "No more restaurants."}
+
+        self.send_restaurant_carousel(reply_token, restaurant_list)
+        self._send_enriched_carousel(session_id, restaurant_list)
+
+        return {"status": "success", "message": f"{len(restaurant_list)}件のレストランを追加で提案しました。"}
     
     def final_restaurant(
         self, 
@@ -72,14 +142,21 @@ class LineActions:
         """
         AIから呼び出される、レストランを決定する関数。
         """
-        print(f"--- final_restaurant関数がAIによって呼び出されました ---")
+        logger.debug("final_restaurant関数がAIによって呼び出されました")
         
         # ダミーデータではなく、GoogleMapsActionsを使って本物の情報を取得
-        restaurant_list = self.gmaps_actions.search_and_format_restaurants(
-            query,
-            min_price=min_price,
-            max_price=max_price,
-        )
+        # 最終決定では1軒だけを送るため、その1軒についてのみ詳細とAI分析を取得する
+        try:
+            restaurant_list = self.gmaps_actions.search_and_format_restaurants(
+                query,
+                min_price=min_price,
+                max_price=max_price,
+                max_results=1,
+                tier=TIER_FULL,
+            )
+        except RateLimitExceeded:
+            self.reply_with_text(reply_token, BUSY_MESSAGE)
+            return {"status": "error", "message": "Rate limit exceeded."}
         
         if not restaurant_list:
             self.reply_with_text(reply_token, "すみません、条件に合うお店が見つかりませんでした。")
@@ -91,12 +168,33 @@ class LineActions:
         return {"status": "success", "message": "最終的なレストランを提案しました。"}
 
 
+    def send_restaurant_detail(self, reply_token: str, place_id: str):
+        """
+        カルーセルのカードがタップされた時に、そのお店の口コミ要約などの詳細を送信する
+        """
+        try:
+            restaurant = self.gmaps_actions.get_restaurant_details(place_id)
+        except RateLimitExceeded:
+            self.reply_with_text(reply_token, BUSY_MESSAGE)
+            return {"status": "error", "message": "Rate limit exceeded."}
+        except Exception as e:
+            logger.exception("お店の詳細取得中にエラーが発生しました: %s", e, extra={"place_id": place_id})
+            self.reply_with_text(reply_token, "すみません、お店の詳細を取得できませんでした。")
+            return {"status": "error", "message": str(e)}
+
+        bubble = self._create_restaurant_bubble(restaurant)
+        self._reply_message(
+            reply_token,
+            FlexSendMessage(alt_text=f"{restaurant.name}の詳細", contents=bubble)
+        )
+        return {"status": "success", "message": "お店の詳細を送信しました。"}
+
     def reply_with_text(self, reply_token: str, text: str):
         """シンプルなテキストメッセージを返信する"""
         try:
-            self.line_bot_api.reply_message(reply_token, TextSendMessage(text=text))
+            self._reply_message(reply_token, TextSendMessage(text=text))
         except LineBotApiError as e:
-            print(f"Error replying text message: {e}")
+            logger.error("Error replying text message: %s", e)
 
     def send_start_prompt(self, reply_token, **kwargs):
         """「調整スタート」ボタン付きのButtonsTemplateを送信する"""
@@ -117,7 +215,7 @@ class LineActions:
             template=buttons_template
         )
         
-        self.line_bot_api.reply_message(reply_token, template_message)
+        self._reply_message(reply_token, template_message)
         return {"status": "success", "message": "Sent start prompt button template."}
     
     def reply_with_quick_reply(self, reply_token: str, question: str, choices: list):
@@ -132,10 +230,10 @@ class LineActions:
         message = TextSendMessage(text=question, quick_reply=QuickReply(items=items))
 
         try:
-            self.line_bot_api.reply_message(reply_token, message)
+            self._reply_message(reply_token, message)
             return {"status": "success", "message": f"質問「{question}」を送信しました。"}
         except LineBotApiError as e:
-            print(f"Error replying with quick reply: {e}")
+            logger.error("Error replying with quick reply: %s", e)
             return {"status": "error", "message": str(e)}
     
       
@@ -171,7 +269,7 @@ class LineActions:
             }
         )
 
-        self.line_bot_api.reply_message(
+        self._reply_message(
             reply_token, 
             [invitation_message, decision_button_message]
         )
@@ -202,7 +300,7 @@ class LineActions:
         text = f"希望をヒアリング中です...（「{user_input}」を受け付けました）"
         self.reply_with_text(reply_token, text)
 
-    def send_final_restaurant(self, reply_token: str, restaurant: dict):
+    def send_final_restaurant(self, reply_token: str, restaurant: Restaurant):
         """最終的に決定したレストランをFlex Messageで送信する"""
         bubble = self._create_final_restaurant_bubble(restaurant)
         messages_to_send = [
@@ -212,21 +310,18 @@ class LineActions:
                 contents=bubble
             )
         ]
-        self.line_bot_api.reply_message(reply_token, messages_to_send)
+        self._reply_message(reply_token, messages_to_send)
 
-    def _create_final_restaurant_bubble(self, restaurant: dict) -> BubbleContainer:
+    def _create_final_restaurant_bubble(self, restaurant: Restaurant) -> BubbleContainer:
         """最終的に提案するレストラン情報カード（バブル）を作成する"""
         return BubbleContainer(
             # hero: バブル上部のメイン画像エリア
             hero=ImageComponent(
-                url=restaurant.get(
-                    "image_url",
-                    "https://placehold.co/600x400/EFEFEF/AAAAAA?text=No+Image",
-                ),
+                url=restaurant.image_url,
                 size="full",
                 aspect_ratio="20:13",
                 aspect_mode="cover",
-                action=URIAction(uri=restaurant.get("url", "#"), label="ウェブサイト"),
+                action=URIAction(uri=restaurant.url, label="ウェブサイト"),
             ),
             # body: 主要な情報を表示する中央のエリア
             body=BoxComponent(
@@ -236,7 +331,7 @@ class LineActions:
                 contents=[
                     # 店名
                     TextComponent(
-                        text=restaurant.get("name", "レストラン名なし"),
+                        text=restaurant.name,
                         weight="bold", size="lg", wrap=True, color="#666565"
                     ),
                     # 評価（星と数字）
@@ -247,7 +342,7 @@ class LineActions:
                         contents=[
                             TextComponent(text="★★★★☆", size="md", color="#FFBF47", flex=0, gravity="center"),
                             TextComponent(
-                                text=str(restaurant.get("rating", 0.0)),
+                                text=str(restaurant.rating),
                                 size="sm", color="#999999", flex=0, margin="md", gravity="center"
                             ),
                         ],
@@ -261,7 +356,7 @@ class LineActions:
                                 size="sm"
                             ),
                             TextComponent(
-                                text=restaurant.get("address", "-"),
+                                text=restaurant.address,
                                 color="#929292", size="sm", flex=4, wrap=True,
                             ),
                         ],
@@ -277,7 +372,7 @@ class LineActions:
                                 layout="baseline", spacing="md",
                                 contents=[
                                     IconComponent(url=f"{NGROK_BASE_URL}/static/icons/genre.png", size="sm"),
-                                    TextComponent(text=restaurant.get("genre", "-"), color="#929292", size="sm", flex=4, wrap=True),
+                                    TextComponent(text=restaurant.genre, color="#929292", size="sm", flex=4, wrap=True),
                                 ],
                             ),
                             # 営業時間の行
@@ -285,7 +380,7 @@ class LineActions:
                                 layout="baseline", spacing="md",
                                 contents=[
                                     IconComponent(url=f"{NGROK_BASE_URL}/static/icons/clock.png", size="sm"),
-                                    TextComponent(text=restaurant.get("time", "9:00 ~ 22:00"), color="#929292", size="sm", flex=4, wrap=True),
+                                    TextComponent(text="9:00 ~ 22:00", color="#929292", size="sm", flex=4, wrap=True),
                                 ],
                             ),
                         ],
@@ -297,7 +392,7 @@ class LineActions:
                         layout="baseline", spacing="md",
                         contents=[
                             IconComponent(url=f"{NGROK_BASE_URL}/static/icons/comment.png", size="sm"),
-                            TextComponent(text=restaurant.get("userRatingCount", "200") + "件のレビュー", color="#929292", size="sm", flex=4, wrap=True),
+                            TextComponent(text=f"{restaurant.user_rating_count}件のレビュー", color="#929292", size="sm", flex=4, wrap=True),
                         ],
                     ),
                     # AIによる口コミ要約
@@ -310,7 +405,7 @@ class LineActions:
                                 contents=[
                                     IconComponent(url=f"{NGROK_BASE_URL}/static/icons/good.png", size="sm"),
                                     TextComponent(
-                                        text=restaurant.get("reviewGoodSummary", "（AIによる良い口コミの要約）"),
+                                        text=restaurant.review_good_summary,
                                         color="#929292", size="sm", flex=4, wrap=True,
                                     ),
                                 ]
@@ -321,7 +416,7 @@ class LineActions:
                                 contents=[
                                     IconComponent(url=f"{NGROK_BASE_URL}/static/icons/bad.png", size="sm"),
                                     TextComponent(
-                                        text=restaurant.get("reviewBadSummary", "（AIによる改善点や注意点の要約）"),
+                                        text=restaurant.review_bad_summary,
                                         color="#929292", size="sm", flex=4, wrap=True,
                                     ),
                                 ]
@@ -340,7 +435,7 @@ class LineActions:
                         style="primary",
                         height="sm",
                         action=URIAction(
-                            label="予約する", uri=restaurant.get("url", "#")
+                            label="予約する", uri=restaurant.url
                         ),
                         color="#CB2200" # 背景色
                     ),
@@ -357,30 +452,70 @@ class LineActions:
 
     def send_restaurant_carousel(self, reply_token: str, restaurant_list: list):
         """レストラン候補をカルーセル形式のFlex Messageで送信する"""
+        messages_to_send = [TextSendMessage(text="こちらのレストランはいかがでしょうか？")]
+        messages_to_send += self._create_carousel_messages(restaurant_list, "おすすめのレストランが見つかりました！")
+        self._reply_message(reply_token, messages_to_send)
+
+    def _send_enriched_carousel(self, to: str, restaurant_list: list):
+        """
+        検索結果だけで送ったカードのうち、先頭の progressive_enrich_limit 枚で口コミの要約がまだのお店を並行して分析し、
+        要約入りのカードをプッシュメッセージで送り直す（progressive_carousel がTrueの場合のみ）。
+        残りのカードは「口コミを見る」ボタンを残し、押された時にだけ要約を取得する。
+        """
+        if not self.progressive_carousel or not to:
+            return
+        pending = [
+            r.place_id for r in restaurant_list[:self.progressive_enrich_limit]
+            if r.tier == TIER_LITE and r.place_id and not self.gmaps_actions.has_enrichment(r.place_id)
+        ]
+        if not pending:
+            return
+
+        with stage_timer("progressive_enrichment", places=len(pending)):
+            enriched = self.gmaps_actions.enrich_restaurants(pending)
+        if not enriched:
+            return
+
+        updated_list = [enriched.get(r.place_id, r) for r in restaurant_list]
+        messages_to_send = [TextSendMessage(text="口コミの要約をまとめました！")]
+        messages_to_send += self._create_carousel_messages(updated_list, "口コミの要約をまとめました！")
+        try:
+            self._push_messages(to, messages_to_send)
+        except LineBotApiError as e:
+            # 先に送ったカルーセルで提案は済んでいるため、送り直せなくても処理は続ける
+            logger.warning("口コミ要約入りのカルーセルを送れませんでした: %s", e)
+
+    def _create_carousel_messages(self, restaurant_list: list, alt_text: str) -> list:
+        """
+        カードをカルーセル1つあたりの上限ごとに分けたFlex Messageのリストを作る。
+        「他のお店を見る」のクイックリプライは最後のメッセージにだけ付ける（LINEは最後のものだけ表示するため）。
+        """
         bubbles = [self._create_restaurant_bubble(r) for r in restaurant_list]
-        carousel_container = CarouselContainer(contents=bubbles)
-        messages_to_send = [
-            TextSendMessage(text="こちらのレストランはいかがでしょうか？"),
-            FlexSendMessage(
-                alt_text="おすすめのレストランが見つかりました！",
-                contents=carousel_container
-            )
+        messages = [
+            FlexSendMessage(alt_text=alt_text, contents=CarouselContainer(contents=bubbles[start:start + MAX_BUBBLES_PER_CAROUSEL]))
+            for start in range(0, len(bubbles), MAX_BUBBLES_PER_CAROUSEL)
         ]
-        self.line_bot_api.reply_message(reply_token, messages_to_send)
+        messages[-1].quick_reply = QuickReply(items=[
+            QuickReplyButton(
+                action=PostbackAction(
+                    label="他のお店を見る",
+                    data="action=more",
+                    display_text="他のお店を見る",
+                )
+            )
+        ])
+        return messages
 
-    def _create_restaurant_bubble(self, restaurant: dict) -> BubbleContainer:
+    def _create_restaurant_bubble(self, restaurant: Restaurant) -> BubbleContainer:
         """カルーセル内の個々のレストラン情報カード（バブル）を作成する"""
         return BubbleContainer(
             # hero: バブル上部のメイン画像エリア
             hero=ImageComponent(
-                url=restaurant.get(
-                    "image_url",
-                    "https://placehold.co/600x400/EFEFEF/AAAAAA?text=No+Image",
-                ),
+                url=restaurant.image_url,
                 size="full",
                 aspect_ratio="20:13",
                 aspect_mode="cover",
-                action=URIAction(uri=restaurant.get("url", "#"), label="ウェブサイト"),
+                action=URIAction(uri=restaurant.url, label="ウェブサイト"),
             ),
             # body: 主要な情報を表示する中央のエリア
             body=BoxComponent(
@@ -390,7 +525,7 @@ class LineActions:
                 contents=[
                     # 店名
                     TextComponent(
-                        text=restaurant.get("name", "レストラン名なし"),
+                        text=restaurant.name,
                         weight="bold", size="lg", wrap=True, color="#666565"
                     ),
                     # 評価（星と数字）
@@ -401,7 +536,7 @@ class LineActions:
                         contents=[
                             TextComponent(text="★★★★☆", size="md", color="#FFBF47", flex=0, gravity="center"),
                             TextComponent(
-                                text=str(restaurant.get("rating", 0.0)),
+                                text=str(restaurant.rating),
                                 size="sm", color="#999999", flex=0, margin="md", gravity="center"
                             ),
                         ],
@@ -415,7 +550,7 @@ class LineActions:
                                 size="sm"
                             ),
                             TextComponent(
-                                text=restaurant.get("address", "-"),
+                                text=restaurant.address,
                                 color="#929292", size="sm", flex=4, wrap=True,
                             ),
                         ],
@@ -431,7 +566,7 @@ class LineActions:
                                 layout="baseline", spacing="md",
                                 contents=[
                                     IconComponent(url=f"{NGROK_BASE_URL}/static/icons/genre.png", size="sm"),
-                                    TextComponent(text=restaurant.get("genre", "-"), color="#929292", size="sm", flex=4, wrap=True),
+                                    TextComponent(text=restaurant.genre, color="#929292", size="sm", flex=4, wrap=True),
                                 ],
                             ),
                             # 営業時間の行
@@ -439,7 +574,7 @@ class LineActions:
                                 layout="baseline", spacing="md",
                                 contents=[
                                     IconComponent(url=f"{NGROK_BASE_URL}/static/icons/clock.png", size="sm"),
-                                    TextComponent(text=restaurant.get("time", "9:00 ~ 22:00"), color="#929292", size="sm", flex=4, wrap=True),
+                                    TextComponent(text="9:00 ~ 22:00", color="#929292", size="sm", flex=4, wrap=True),
                                 ],
                             ),
                         ],
@@ -451,7 +586,7 @@ class LineActions:
                         layout="baseline", spacing="md",
                         contents=[
                             IconComponent(url=f"{NGROK_BASE_URL}/static/icons/comment.png", size="sm"),
-                            TextComponent(text=restaurant.get("userRatingCount", "200") + "件のレビュー", color="#929292", size="sm", flex=4, wrap=True),
+                            TextComponent(text=f"{restaurant.user_rating_count}件のレビュー", color="#929292", size="sm", flex=4, wrap=True),
                         ],
                     ),
                     # AIによる口コミ要約
@@ -464,7 +599,7 @@ class LineActions:
                                 contents=[
                                     IconComponent(url=f"{NGROK_BASE_URL}/static/icons/good.png", size="sm"),
                                     TextComponent(
-                                        text=restaurant.get("reviewGoodSummary", "（AIによる良い口コミの要約）"),
+                                        text=restaurant.review_good_summary,
                                         color="#929292", size="sm", flex=4, wrap=True,
                                     ),
                                 ]
@@ -475,7 +610,7 @@ class LineActions:
                                 contents=[
                                     IconComponent(url=f"{NGROK_BASE_URL}/static/icons/bad.png", size="sm"),
                                     TextComponent(
-                                        text=restaurant.get("reviewBadSummary", "（AIによる改善点や注意点の要約）"),
+                                        text=restaurant.review_bad_summary,
                                         color="#929292", size="sm", flex=4, wrap=True,
                                     ),
                                 ]
@@ -489,15 +624,32 @@ class LineActions:
                 layout="vertical",
                 spacing="sm",
                 background_color="#F9EDE7",
-                contents=[
-                    ButtonComponent(
-                        style="primary",
-                        height="sm",
-                        action=URIAction(
-                            label="詳しく見る", uri=restaurant.get("url", "#")
-                        ),
-                        color="#CB2200" # 背景色
-                    )
-                ],
+                contents=self._create_restaurant_footer_buttons(restaurant),
             ),
         )
+
+    def _create_restaurant_footer_buttons(self, restaurant: Restaurant) -> list:
+        """カードのフッターボタン。liteのカードには口コミ要約を取得するボタンを追加する"""
+        buttons = [
+            ButtonComponent(
+                style="primary",
+                height="sm",
+                action=URIAction(
+                    label="詳しく見る", uri=restaurant.url
+                ),
+                color="#CB2200" # 背景色
+            )
+        ]
+        if restaurant.tier == TIER_LITE and restaurant.place_id:
+            buttons.append(
+                ButtonComponent(
+                    style="link",
+                    height="sm",
+                    action=PostbackAction(
+                        label="口コミを見る",
+                        data=f"action=detail&place_id={restaurant.place_id}",
+                        display_text=f"{restaurant.name}の口コミを見る",
+                    ),
+                )
+            )
+        return buttons
@@ -0,0 +1,317 @@
+# app/local_index.py
+import atexit
+import heapq
+import json
+import math
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# 空間インデックスのグリッドの大きさ（度）。0.005度 ≒ 550m
+GRID_SIZE_DEG = 0.005
+# 1度あたりの距離（メートル）
+METERS_PER_DEG = 111320
+
+# メモリ上に保持するお店の数の上限（超えたら、最も長く検索結果に現れていないお店から捨てる）
+DEFAULT_MAX_PLACES = 20000
+# SQLiteへの書き込みをまとめて行う間隔（秒）
+DEFAULT_FLUSH_INTERVAL_SECONDS = 1.0
+
+
+def normalize_text(text: str) -> str:
+    """全角・半角や大文字・小文字の揺れをなくす"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def split_keywords(query: str) -> list:
+    """検索キーワードを空白（全角スペースを含む）で分割する"""
+    return [token for token in normalize_text(query).split() if token]
+
+
+def _ngrams(text: str) -> set:
+    """日本語は単語の区切りがないため、1文字と2文字の部分文字列を索引の単位にする"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    grams.discard(" ")
+    return grams
+
+
+def _grid_cell(lat: float, lng: float) -> tuple:
+    return (math.floor(lat / GRID_SIZE_DEG), math.floor(lng / GRID_SIZE_DEG))
+
+
+def _distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """2点間の距離（メートル）。街の範囲の距離なので、平面近似で十分な精度がある"""
+    d_lat = (lat2 - lat1) * METERS_PER_DEG
+    d_lng = (lng2 - lng1) * METERS_PER_DEG * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(d_lat, d_lng)
+
+
+class LocalPlaceIndex:
+    """
+    Places APIで取得したお店の情報から作る、オフライン検索用のローカルインデックス。
+    - 文字n-gramの転置インデックスで、日本語キーワードの全文検索を行う
+    - 緯度経度のグリッドで、location/radiusによる周辺検索を行う
+    データはSQLiteに保存し、起動時にメモリ上のインデックスへ読み込む。
+    SQLiteへの書き込みはリクエストの処理中には行わず、裏のスレッドで flush_interval 秒ごとにまとめて行う。
+    お店の数が max_places を超えたら、最も長く検索結果に現れていないお店からメモリとSQLiteの両方で捨てる。
+    よく検索されるエリアの検索をAPIなしで返したり、Places APIが使えない時の代替として使う。
+    """
+
+    def __init__(self, db_path: str = None, max_places: int = DEFAULT_MAX_PLACES,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL_SECONDS):
+        """db_pathを省略した場合は永続化せず、メモリ上だけで動作する"""
+        self.max_places = max_places
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._places = OrderedDict()         # place_id -> 検索結果(dict)。最後に追加・更新された順
+        self._documents = {}                 # place_id -> 全文検索用に正規化したテキスト
+        self._keywords = defaultdict(set)    # place_id -> そのお店がヒットした検索キーワード
+        self._postings = defaultdict(set)    # n-gram -> place_idの集合
+        self._grid = defaultdict(set)        # グリッドのセル -> place_idの集合
+
+        # まだSQLiteに書き込んでいない変更（place_id -> 行）と、SQLiteから消すお店
+        self._pending_rows = {}
+        self._pending_deletes = set()
+        self._db_lock = threading.Lock()
+        self._writer = None
+        self._stopped = threading.Event()
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS places ("
+                " place_id TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL,"
+                " keywords TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._places)
+
+    def add_places(self, places: list, query: str = None):
+        """
+        検索結果のお店を索引に追加する。
+        queryにはそのお店がヒットした検索キーワードを渡し、店名や住所に含まれない
+        ジャンルなどの言葉（例: 「和食」「個室」）でも見つけられるようにする。
+        """
+        keywords = split_keywords(query) if query else []
+        with self._lock:
+            for place in places:
+                place_id = place.get("place_id")
+                if not place_id:
+                    continue
+                self._keywords[place_id].update(keywords)
+                self._index_place(place_id, place)
+                if self._db is not None:
+                    self._pending_rows[place_id] = (place_id, place, sorted(self._keywords[place_id]), time.time())
+                    self._pending_deletes.discard(place_id)
+            for place_id in self._evict():
+                self._pending_rows.pop(place_id, None)
+                if self._db is not None:
+                    self._pending_deletes.add(place_id)
+            has_pending = bool(self._pending_rows or self._pending_deletes)
+
+        if has_pending:
+            self._start_writer()
+
+    def flush(self):
+        """まだ書き込んでいない変更を、SQLiteに書き込む"""
+        if self._db is None:
+            return
+        with self._lock:
+            rows, self._pending_rows = list(self._pending_rows.values()), {}
+            deletes, self._pending_deletes = list(self._pending_deletes), set()
+        if not rows and not deletes:
+            return
+        # JSONへの変換もリクエストの処理の外で行う
+        rows = [
+            (place_id, json.dumps(place, ensure_ascii=False), json.dumps(keywords, ensure_ascii=False), updated_at)
+            for place_id, place, keywords, updated_at in rows
+        ]
+        with self._db_lock:
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?)", rows)
+                self._db.executemany("DELETE FROM places WHERE place_id = ?", [(place_id,) for place_id in deletes])
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning("ローカルインデックスの保存中にエラーが発生しました: %s", e)
+
+    def close(self):
+        """裏の書き込みを止め、残っている変更を書き込む"""
+        self._stopped.set()
+        if self._writer is not None:
+            self._writer.join()
+        self.flush()
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._writer = threading.Thread(target=self._write_periodically, name="local-index-writer", daemon=True)
+        self._writer.start()
+        # 終了時に、まだ書き込んでいない変更を失わないようにする
+        atexit.register(self.close)
+
+    def _write_periodically(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def search(
+        self,
+        query: str = None,
+        location: dict = None,
+        radius: int = None,
+        min_price: int = None,
+        max_price: int = None,
+        limit: int = 20,
+    ) -> list:
+        """
+        Places APIの検索結果と同じ形式(dict)のリストを、評価の高い順に返す。
+        キーワードはすべてを含むお店（AND検索）、locationとradiusがあれば範囲内のお店に絞り込む。
+        """
+        with self._lock:
+            candidates = None
+
+            # まずn-gramの集合演算だけで候補を絞り、最後に残った候補だけを文字列で確認する
+            keywords = split_keywords(query) if query else []
+            for keyword in keywords:
+                matched = self._match_ngrams(keyword)
+                candidates = matched if candidates is None else candidates & matched
+                if not candidates:
+                    return []
+            if candidates is not None:
+                candidates = {
+                    place_id for place_id in candidates
+                    if all(keyword in self._documents[place_id] for keyword in keywords)
+                }
+
+            if location and radius:
+                nearby = self._match_location(location["lat"], location["lng"], radius)
+                candidates = nearby if candidates is None else candidates & nearby
+
+            if candidates is None:
+                return []
+
+            results = []
+            for place_id in candidates:
+                place = self._places[place_id]
+                price_level = place.get("price_level")
+                if price_level is not None:
+                    if min_price is not None and price_level < min_price:
+                        continue
+                    if max_price is not None and price_level > max_price:
+                        continue
+                results.append(place)
+
+        return heapq.nlargest(limit, results, key=lambda p: (p.get("rating", 0.0), p.get("user_ratings_total", 0)))
+
+    def _index_place(self, place_id: str, place: dict):
+        """1件のお店をメモリ上の転置インデックスと空間インデックスに登録する（ロック取得済みで呼ぶ）"""
+        old_document = self._documents.get(place_id)
+        if old_document is not None:
+            for gram in _ngrams(old_document):
+                self._postings[gram].discard(place_id)
+        old_place = self._places.get(place_id)
+        if old_place is not None and self._get_lat_lng(old_place):
+            self._grid[_grid_cell(*self._get_lat_lng(old_place))].discard(place_id)
+
+        document = normalize_text(" ".join([
+            place.get("name", ""),
+            place.get("formatted_address") or place.get("vicinity", ""),
+            " ".join(self._keywords[place_id]),
+        ]))
+        self._places[place_id] = place
+        self._places.move_to_end(place_id)
+        self._documents[place_id] = document
+        for gram in _ngrams(document):
+            self._postings[gram].add(place_id)
+
+        lat_lng = self._get_lat_lng(place)
+        if lat_lng:
+            self._grid[_grid_cell(*lat_lng)].add(place_id)
+
+    def _evict(self) -> list:
+        """お店の数が上限を超えた分を、古いものから捨てて、そのplace_idのリストを返す（ロック取得済みで呼ぶ）"""
+        evicted = []
+        while len(self._places) > self.max_places:
+            place_id = next(iter(self._places))
+            self._remove_place(place_id)
+            evicted.append(place_id)
+        return evicted
+
+    def _remove_place(self, place_id: str):
+        """1件のお店を、メモリ上のすべてのインデックスから取り除く（ロック取得済みで呼ぶ）"""
+        document = self._documents.pop(place_id, None)
+        if document is not None:
+            for gram in _ngrams(document):
+                posting = self._postings.get(gram)
+                if posting is not None:
+                    posting.discard(place_id)
+                    if not posting:
+                        del self._postings[gram]
+        place = self._places.pop(place_id, None)
+        lat_lng = self._get_lat_lng(place) if place is not None else None
+        if lat_lng:
+            cell = _grid_cell(*lat_lng)
+            self._grid[cell].discard(place_id)
+            if not self._grid[cell]:
+                del self._grid[cell]
+        self._keywords.pop(place_id, None)
+
+    def _match_ngrams(self, keyword: str) -> set:
+        """キーワードのn-gramをすべて含むお店を返す（部分文字列としての一致は呼び出し側で確認する）"""
+        candidates = None
+        for gram in sorted(_ngrams(keyword), key=lambda g: len(self._postings.get(g, ()))):
+            posting = self._postings.get(gram)
+            if not posting:
+                return set()
+            candidates = set(posting) if candidates is None else candidates & posting
+            if not candidates:
+                return set()
+        return candidates or set()
+
+    def _match_location(self, lat: float, lng: float, radius: int) -> set:
+        """中心から半径radiusメートル以内のお店を、周囲のグリッドだけを調べて返す"""
+        lat_span = radius / METERS_PER_DEG
+        lng_span = radius / (METERS_PER_DEG * max(math.cos(math.radians(lat)), 0.01))
+        min_cell = _grid_cell(lat - lat_span, lng - lng_span)
+        max_cell = _grid_cell(lat + lat_span, lng + lng_span)
+
+        matched = set()
+        for cell_lat in range(min_cell[0], max_cell[0] + 1):
+            for cell_lng in range(min_cell[1], max_cell[1] + 1):
+                for place_id in self._grid.get((cell_lat, cell_lng), ()):
+                    place_lat, place_lng = self._get_lat_lng(self._places[place_id])
+                    if _distance_m(lat, lng, place_lat, place_lng) <= radius:
+                        matched.add(place_id)
+        return matched
+
+    @staticmethod
+    def _get_lat_lng(place: dict):
+        location = place.get("geometry", {}).get("location")
+        if not location:
+            return None
+        return location["lat"], location["lng"]
+
+    def _load(self):
+        rows = self._db.execute("SELECT place_id, data, keywords FROM places ORDER BY updated_at").fetchall()
+        with self._lock:
+            for place_id, data, keywords in rows:
+                self._keywords[place_id].update(json.loads(keywords))
+                self._index_place(place_id, json.loads(data))
+            evicted = self._evict()
+        if evicted:
+            # 上限を下げて起動した場合は、古いお店をSQLiteからも消す
+            self._db.executemany("DELETE FROM places WHERE place_id = ?", [(place_id,) for place_id in evicted])
+            self._db.commit()
+        logger.info("ローカルインデックスを読み込みました: %d件", len(self._places))
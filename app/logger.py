@@ -0,0 +1,156 @@
+# app/logger.py
+"""
+構造化ログ（JSON Lines）の設定。
+- ログの書き出しはキュー経由で別スレッドが行い、リクエストを処理するスレッドでは入出力を待たない
+- 同じ種類のINFO以下のログが短時間に大量に出る場合は、一定数を超えた分を間引く（レート制限、WARNING以上は常に出力）
+- INFO以下のログは、LOG_SAMPLE_RATE の割合だけを出力する（WARNING以上は常に出力）
+- セッションの中身など大きなデータは、DEBUG_SESSION_DUMP を有効にした時だけ出力する
+
+環境変数:
+    LOG_LEVEL            出力するログレベル（既定: INFO、正しくない値の場合は警告を出してINFOにする）
+    LOG_SAMPLE_RATE      INFO以下のログを出力する割合 0.0〜1.0（既定: 1.0）
+    LOG_RATE_LIMIT       同じ種類のログを LOG_RATE_INTERVAL 秒あたり何件まで出力するか（既定: 20）
+    LOG_RATE_INTERVAL    レート制限の集計間隔（秒、既定: 10）
+    DEBUG_SESSION_DUMP   true の場合、セッションの中身をDEBUGログに出力する
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from .tracing import current_trace_id
+
+ROOT_LOGGER_NAME = "restaurant_agent"
+
+# LogRecordが標準で持つ属性。これ以外の属性（extraで渡したもの）をJSONのフィールドとして出力する
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TraceContextFilter(logging.Filter):
+    """ログを出したスレッドで処理中のトレースIDを付ける（キューに入れる前に呼ばれる必要がある）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace_id = current_trace_id()
+        if trace_id:
+            record.trace_id = trace_id
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """INFO以下のログを sample_rate の割合だけ通す"""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.sample_rate >= 1.0:
+            return True
+        return random.random() < self.sample_rate
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    同じ種類のログ（ロガー名とメッセージのテンプレートが同じもの）を、interval秒あたりlimit件までに制限する。
+    間引いた件数は、次に出力するそのログの suppressed フィールドに記録する。
+    障害の調査に必要なWARNING以上のログは、間引かずに常に出力する。
+    """
+
+    def __init__(self, limit: int, interval: float):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._windows = {}  # (ロガー名, テンプレート) -> [期間の開始時刻, 出力した件数, 間引いた件数]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.limit <= 0:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                window = self._windows[key] = [now, 0, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+            if window[1] >= self.limit:
+                window[2] += 1
+                return False
+            window[1] += 1
+            return True
+
+
+def setup_logging():
+    """
+    アプリ全体のログを設定する。何度呼び出しても設定は1回だけ行う。
+    ログはキューに積み、QueueListenerのスレッドが標準エラー出力に書き出す。
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        stream_handler = logging.StreamHandler(sys.stderr)
+        stream_handler.setFormatter(JsonFormatter())
+
+        log_queue = queue.Queue(-1)
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        # フィルタはキューに入れる前（ログを出したスレッド）で評価し、捨てるログはキューに入れない
+        queue_handler.addFilter(TraceContextFilter())
+        queue_handler.addFilter(SamplingFilter(float(os.getenv("LOG_SAMPLE_RATE", "1.0"))))
+        queue_handler.addFilter(RateLimitFilter(
+            int(os.getenv("LOG_RATE_LIMIT", "20")),
+            float(os.getenv("LOG_RATE_INTERVAL", "10")),
+        ))
+
+        level_name = os.getenv("LOG_LEVEL", "INFO").upper()
+        # 正しくないログレベルでは、getLevelNameは数値ではなく "Level XXX" という文字列を返す
+        level = logging.getLevelName(level_name)
+        root = logging.getLogger(ROOT_LOGGER_NAME)
+        root.setLevel(level if isinstance(level, int) else logging.INFO)
+        root.addHandler(queue_handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        if not isinstance(level, int):
+            # ログの設定を誤っても起動は止めず、INFOで出力する
+            root.warning("LOG_LEVELの値が正しくないため、INFOで出力します", extra={"log_level": level_name})
+
+
+def get_logger(name: str) -> logging.Logger:
+    """モジュールごとのロガー。get_logger(__name__) のように使う"""
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name.rsplit('.', 1)[-1]}")
+
+
+def session_dump_enabled() -> bool:
+    return os.getenv("DEBUG_SESSION_DUMP", "false").lower() == "true"
@@ -1,65 +1,50 @@
 # app/main.py
-from fastapi import FastAPI, Request, HTTPException
-from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError, LineBotApiError
-from linebot.models import MessageEvent, TextMessage, TextSendMessage, JoinEvent, QuickReply, QuickReplyButton, MessageAction, BubbleContainer, CarouselContainer, ImageComponent, BoxComponent, TextComponent, ButtonComponent, SeparatorComponent, URIAction, FlexSendMessage
+import time
+_import_started = time.perf_counter()
+
+# 他のモジュールがimport時に環境変数を読むため、最初に.envを読み込む（.envを読むのはここだけ）
 from dotenv import load_dotenv
+load_dotenv()
+
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from linebot import WebhookHandler
+from linebot.exceptions import InvalidSignatureError
+from linebot.models import MessageEvent, TextMessage, JoinEvent, PostbackEvent
 import os
-from .line_actions import LineActions
-from .function_definitions import function_declarations
+import functools
+import threading
+from urllib.parse import parse_qs
 from fastapi.staticfiles import StaticFiles
-from .ai_agent import AIAgent
-from .google_maps_actions import GoogleMapsActions
-
-# Vertex AI関連のインポート
-import vertexai
-from vertexai.preview.generative_models import GenerativeModel, Tool
+from .container import build_container, STARTUP_SECONDS
+from .scheduler import PRIORITY_COMMAND, PRIORITY_GROUP, PRIORITY_INDIVIDUAL, SchedulerStopped
+from .rate_limiter import BUSY_MESSAGE
+from .metrics import REGISTRY, stage_timer
+from .tracing import TRACER, traced_event
+from .logger import setup_logging, get_logger, session_dump_enabled
+from .models import Session
 
-# Google Maps Platform関連のインポート
-import googlemaps  # パッケージ名がgooglemapsであることに注意
-
-# 環境変数をロード
-load_dotenv()
+setup_logging()
+logger = get_logger(__name__)
 
-LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
 LINE_CHANNEL_SECRET = os.getenv("LINE_CHANNEL_SECRET")
-MAPS_API_KEY = os.getenv("Maps_API_KEY")  # .envのキー名に合わせてください
-GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 # NGROK_AUTHTOKEN = os.getenv("NGROK_AUTHTOKEN") # ngrokサービスがDocker Composeで動くため、Pythonコードで直接使う必要は通常ありません
 
 # 環境変数の存在チェック (テストのために一旦緩めるか、正確な値を設定してください)
 # if not all([LINE_CHANNEL_ACCESS_TOKEN, LINE_CHANNEL_SECRET, MAPS_API_KEY, GCP_PROJECT_ID]):
 #     raise ValueError("Required environment variables are not set. Check your .env file.")
 
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
+# 署名検証とイベントの解析だけに使う（軽いため起動時に作る）
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
+# Vertex AI・Google Maps・LINEのクライアントや、それを使うサービスは、初めて使う時に作る
+# （起動を速くし、最初のWebhookをすぐに受け付けるため。/ready で事前に作っておける）
+container = build_container()
+
 app = FastAPI()
 # ハッカソン用のシンプルなセッション管理（共有メモ帳）
 # サーバーのメモリ上に存在するため、再起動すると消えますが、デモでは十分です。
-sessions = {}
-
-# Vertex AIの初期化 (GCP_PROJECT_IDと認証情報を使用)
-try:
-    vertexai.init(
-        project=GCP_PROJECT_ID, location="us-central1"
-    )  # あなたのプロジェクトのリージョンに合わせてください
-    gemini_model = GenerativeModel("gemini-2.5-flash",
-        tools=[Tool.from_function_declarations(function_declarations)])
-except Exception as e:
-    print(f"Vertex AI initialization failed: {e}")
-    gemini_model = None
-
-# Google Maps APIクライアントの初期化
-try:
-    gmaps = googlemaps.Client(key=MAPS_API_KEY)
-except Exception as e:
-    print(f"Google Maps Client initialization failed: {e}")
-    gmaps = None
-
-gmaps_actions = GoogleMapsActions(gemini_model, os.getenv("NGROK_BASE_URL", ""))
-actions = LineActions(line_bot_api, gmaps_actions)
-ai_agent = AIAgent(gemini_model, actions)
+sessions = {}  # グループID -> Session
 
 # "app/static" ディレクトリを "/static" というパスで公開する
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
@@ -73,19 +58,141 @@ async def root():
 async def callback(request: Request):
     signature = request.headers["X-Line-Signature"]
     body = await request.body()
+    body_text = body.decode("utf-8")
+
+    # 署名検証の時間を単独で計測するため、イベント処理の前に検証する
+    with stage_timer("signature_verification"):
+        valid = handler.parser.signature_validator.validate(body_text, signature)
+    if not valid:
+        raise HTTPException(status_code=400, detail="Invalid signature")
+
+    # リプレイ用の記録が有効な場合は、受け取ったWebhookをそのまま記録する
+    recorder = container.recorder
+    if recorder:
+        recorder.record_webhook(body_text)
+
     try:
-        handler.handle(body.decode("utf-8"), signature)
+        with stage_timer("webhook_parse"):
+            events = handler.parser.parse(body_text, signature)
     except InvalidSignatureError:
         raise HTTPException(status_code=400, detail="Invalid signature")
+
+    # 処理は待たずにキューに入れて、すぐにLINEプラットフォームへ応答する
+    scheduler = container.scheduler
+    try:
+        for event in events:
+            priority, key, extra_keys = classify_event(event)
+            if scheduler.admits(priority):
+                scheduler.submit(functools.partial(dispatch_event, event), priority, key, extra_keys)
+            elif getattr(event, "reply_token", None):
+                # 処理待ちを増やし続けないよう、すぐに返せる短い返信だけを優先して送る。
+                # グループのキーで順番を待つと、そのグループの処理待ちをすべて待つ間に
+                # reply_tokenの期限が切れるため、返信ごとに別のキーにする
+                scheduler.submit(functools.partial(reply_busy, event.reply_token), PRIORITY_COMMAND,
+                                 f"busy:{event.reply_token}")
+    except SchedulerStopped:
+        # 停止中は受け付けず、LINEプラットフォームに再送してもらう
+        logger.warning("停止中のため、Webhookを受け付けませんでした")
+        raise HTTPException(status_code=503, detail="Shutting down")
     return "OK"
 
+@app.get("/ready")
+def ready():
+    """
+    リクエストの処理に必要なクライアントとサービスを作っておき（ウォームアップ）、使える状態かを返す。
+    作れなかったサービスがある場合や、Vertex AIかGoogle Mapsのクライアントを作れなかった場合は503を返す。
+    """
+    errors = container.warm_up()
+    if not errors:
+        for name in ("gemini_model", "gmaps"):
+            if container.get(name) is None:
+                errors[name] = "initialization failed"
+    body = {"ready": not errors, "errors": errors}
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.on_event("startup")
+def warm_up_in_background():
+    """起動直後からWebhookを受け付けつつ、裏でクライアントとサービスを作っておく"""
+    if os.getenv("WARM_UP_ON_STARTUP", "true").lower() == "true":
+        threading.Thread(target=container.warm_up, name="warm-up", daemon=True).start()
+
+@app.on_event("shutdown")
+def shutdown_scheduler():
+    """処理待ちのイベントを処理し終えてから終了する"""
+    if container.initialized("scheduler"):
+        container.scheduler.shutdown(timeout=30)
+    # 処理し終えてから、ローカルインデックスのまだ保存していない変更を書き込む
+    if container.initialized("local_index") and container.local_index is not None:
+        container.local_index.close()
+
+@app.get("/metrics")
+async def metrics():
+    """処理段階ごとの所要時間やトークン数を、Prometheusのテキスト形式で返す"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# デバッグ用エンドポイント（トレースの参照）は、ユーザーIDなどを含むため環境変数で有効にした時だけ公開する
+DEBUG_ENDPOINTS_ENABLED = os.getenv("DEBUG_ENDPOINTS_ENABLED", "false").lower() == "true"
+
+@app.get("/debug/traces")
+async def debug_traces(limit: int = 20, min_ms: float = 0, group_id: str = None, user_id: str = None):
+    """最近のトレースを新しい順に返す。min_msで遅いものだけ、group_id/user_idで特定の会話だけに絞り込める"""
+    if not DEBUG_ENDPOINTS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    filters = {key: value for key, value in {"group_id": group_id, "user_id": user_id}.items() if value}
+    return {"traces": TRACER.recent(limit=limit, min_duration_ms=min_ms, **filters)}
+
+@app.get("/debug/traces/{trace_id}")
+async def debug_trace(trace_id: str):
+    if not DEBUG_ENDPOINTS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    trace = TRACER.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
 # --- LINEイベントのハンドラ定義 ---
-@handler.add(JoinEvent)
+# グループでの決まったコマンド（優先して処理する）
+GROUP_COMMANDS = {"スタート", "終了", "お店を決める！"}
+
+def classify_event(event) -> tuple:
+    """
+    イベントの (優先度, 順番待ちのキー, 同時に処理しない追加のキー) を決める。
+    お店の最終決定や決まったコマンドを、1対1チャットでの検索より先に処理する。
+    キーはグループならグループID、1対1チャットならユーザーIDで、キーごとに公平に順番を回す。
+    グループでのイベントは送ったユーザーのIDも追加のキーにし、
+    同じユーザーの1対1チャットと同時に処理しない（チャットセッションを共有しているため）。
+    """
+    group_id = getattr(event.source, "group_id", None)
+    user_id = getattr(event.source, "user_id", None)
+    key = group_id or user_id
+    extra_keys = (user_id,) if group_id and user_id else ()
+    if isinstance(event, JoinEvent):
+        return PRIORITY_COMMAND, key, extra_keys
+    if isinstance(event, MessageEvent) and group_id:
+        if isinstance(event.message, TextMessage) and event.message.text.lower().strip() in GROUP_COMMANDS:
+            return PRIORITY_COMMAND, key, extra_keys
+        return PRIORITY_GROUP, key, extra_keys
+    return PRIORITY_INDIVIDUAL, key, extra_keys
+
+def reply_busy(reply_token: str):
+    """受け付けられなかったイベントに、少し待つよう返信する（ワーカースレッドで実行する）"""
+    container.line_actions.reply_with_text(reply_token, BUSY_MESSAGE)
+
+def dispatch_event(event):
+    """ワーカースレッドで、イベントの種類に応じたハンドラを呼び出す"""
+    if isinstance(event, JoinEvent):
+        handle_join(event)
+    elif isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+        handle_message(event)
+    elif isinstance(event, PostbackEvent):
+        handle_postback(event)
+
+@traced_event
 def handle_join(event):
     """ボットがグループに参加した時の処理"""
-    actions.send_start_prompt(event.reply_token)
+    container.line_actions.send_start_prompt(event.reply_token)
 
-@handler.add(MessageEvent, message=TextMessage)
+@traced_event
 def handle_message(event):
     """ユーザーからのテキストメッセージを処理"""
     reply_token = event.reply_token
@@ -98,18 +205,13 @@ def handle_message(event):
         
         if user_message.lower().strip() == "スタート":
             # 「共有メモ帳」に、このグループ用の新しいページを作成
-            sessions[group_id] = {
-                "status": "hearing",
-                "preferences": {}
-            }
+            sessions[group_id] = Session()
 
         if user_message.lower().strip() == "終了":
-            actions.send_start_prompt(event.reply_token)
+            container.line_actions.send_start_prompt(event.reply_token)
 
-        if "common" not in sessions[group_id]["preferences"]:
-            sessions[group_id]["preferences"]["common"] = []
-        sessions[group_id]["preferences"]["common"].append(user_message)
-        ai_agent.process_group_message(event, sessions[group_id])
+        sessions[group_id].add_common(user_message)
+        container.ai_agent.process_group_message(event, sessions[group_id])
         return
 
     # --- 1対1チャットでの処理 ---
@@ -124,21 +226,37 @@ def handle_message(event):
 
         if active_group_id:
             # 1. ユーザーの希望を「共有メモ帳」に記録
-            if user_id not in sessions[active_group_id]["preferences"]:
-                sessions[active_group_id]["preferences"][user_id] = []
-            sessions[active_group_id]["preferences"][user_id].append(user_message)
+            sessions[active_group_id].add_member_message(user_id, user_message)
             
-            print("--- 現在の全希望 ---")
-            print(sessions[active_group_id])
-            print("--------------------")
+            # セッションの中身は大きく、個人の希望も含むため、デバッグ時だけ出力する
+            if session_dump_enabled():
+                logger.debug("現在の全希望", extra={"group_id": active_group_id, "session": sessions[active_group_id].preferences()})
             
             # 2. AIエージェントに、現在の全希望を渡して処理させる
-            ai_agent.process_individual_message(event, sessions[active_group_id])
+            # （グループは推測なので、グループ単位のレート制限には使わない。
+            #   使うと、すべての1対1チャットが同じグループの上限を分け合ってしまう）
+            container.ai_agent.process_individual_message(event, sessions[active_group_id])
         else:
-            actions.reply_with_text(reply_token, "参加中の飲み会調整が見つかりません。グループで幹事さんが「調整スタート」と入力したか確認してください。")
+            container.line_actions.reply_with_text(reply_token, "参加中の飲み会調整が見つかりません。グループで幹事さんが「調整スタート」と入力したか確認してください。")
+
+@traced_event
+def handle_postback(event):
+    """カードのボタン（口コミを見る など）が押された時の処理"""
+    data = parse_qs(event.postback.data)
+    action = data.get("action", [None])[0]
+
+    if action == "detail":
+        place_id = data.get("place_id", [None])[0]
+        if place_id:
+            container.line_actions.send_restaurant_detail(event.reply_token, place_id)
+
+    elif action == "more":
+        # 1対1チャットでの検索結果は、user_idをセッションIDとして保持している
+        container.line_actions.show_more_restaurants(event.reply_token, session_id=event.source.user_id)
 
 @app.get("/test/vertex-ai")
 async def test_vertex_ai_connection():
+    gemini_model = container.gemini_model
     if not gemini_model:
         raise HTTPException(
             status_code=500,
@@ -159,6 +277,7 @@ async def test_vertex_ai_connection():
 
 @app.get("/test/google-maps")
 async def test_Maps_connection():
+    gmaps = container.gmaps
     if not gmaps:
         raise HTTPException(
             status_code=500,
@@ -194,3 +313,6 @@ async def test_Maps_connection():
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Google Maps test failed: {e}")
+
+
+STARTUP_SECONDS.set(time.perf_counter() - _import_started, phase="import")
@@ -0,0 +1,213 @@
+# app/metrics.py
+"""
+プロセス内で処理段階ごとの所要時間や呼び出し回数を集計し、Prometheusのテキスト形式で出力する。
+外部ライブラリには依存しない。
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from .tracing import TRACER
+
+# 所要時間（秒）のヒストグラムのバケット。LINEの返信やAPI呼び出しの分布が見えるよう、数msから数十秒まで
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple, labelvalues: tuple, extra: dict = None) -> str:
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs += list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} のラベルは {self.labelnames} です: {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            lines.extend(self._render_sample(labelvalues, value))
+        return lines
+
+    def _render_sample(self, labelvalues: tuple, value) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """増えるだけの値（呼び出し回数、トークン数など）"""
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """増減する現在の値（キューの長さなど）"""
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """所要時間などの分布"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def _render_sample(self, labelvalues: tuple, state: dict) -> list:
+        lines = []
+        cumulative = 0
+        for upper_bound, count in zip(self.buckets, state["counts"]):
+            cumulative += count
+            labels = _format_labels(self.labelnames, labelvalues, {"le": _format_value(upper_bound)})
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, labelvalues)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"メトリクス {metric.name} は登録済みです。")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式（version 0.0.4）で全メトリクスを出力する"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# アプリ全体で共有するレジストリと、標準のメトリクス
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "restaurant_agent_stage_seconds",
+    "処理段階ごとの所要時間（秒）",
+    ("stage",),
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "restaurant_agent_stage_errors_total",
+    "処理段階ごとの例外の発生回数",
+    ("stage",),
+)
+GEMINI_TOKENS = REGISTRY.counter(
+    "restaurant_agent_gemini_tokens_total",
+    "Geminiの呼び出しで消費したトークン数（kind: prompt / response / cached）。cachedはpromptのうちコンテキストキャッシュから読んだ分",
+    ("purpose", "kind"),
+)
+
+
+@contextmanager
+def stage_timer(stage: str, **attributes):
+    """
+    with stage_timer("places_text_search"): のように使い、その処理の所要時間をヒストグラムに記録する。
+    例外が発生した場合はエラー回数も数える（例外はそのまま呼び出し元に伝える）。
+    トレース中であれば、同じ名前の子スパンとしても記録する（attributesはスパンにだけ付ける）。
+    """
+    started = time.perf_counter()
+    try:
+        with TRACER.span(stage, **attributes):
+            yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+def record_token_usage(response, purpose: str):
+    """
+    Geminiの応答に含まれるusage_metadataから、プロンプトと応答のトークン数を記録する。
+    コンテキストキャッシュを使った場合は、キャッシュから読んだ（送らずに済んだ）トークン数も記録する。
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    GEMINI_TOKENS.inc(getattr(usage, "prompt_token_count", 0) or 0, purpose=purpose, kind="prompt")
+    GEMINI_TOKENS.inc(getattr(usage, "candidates_token_count", 0) or 0, purpose=purpose, kind="response")
+    GEMINI_TOKENS.inc(getattr(usage, "cached_content_token_count", 0) or 0, purpose=purpose, kind="cached")
@@ -0,0 +1,154 @@
+# app/models.py
+"""
+調整中のグループ（セッション）・メンバーの希望・お店の情報を表すデータモデル。
+
+辞書の代わりに __slots__ を使ったクラスにして、1件あたりのメモリを減らす。
+プロンプトやFlex Messageを作る時は属性をそのまま使い、毎回の変換をしない。
+保存する時は to_compact() / dumps() で、キー名を含まない短いJSONに変換する。
+"""
+import json
+import threading
+
+# セッションの状態
+STATUS_HEARING = "hearing"
+
+# 全員共通の希望（グループLINEでのメッセージ）を表すメンバーID
+COMMON_MEMBER_ID = "common"
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class MemberPreference:
+    """1人のメンバー（または全員共通）の希望のメッセージ"""
+    __slots__ = ("member_id", "messages")
+
+    def __init__(self, member_id: str, messages: list = None):
+        self.member_id = member_id
+        self.messages = messages if messages is not None else []
+
+    def to_compact(self) -> list:
+        return [self.member_id, self.messages]
+
+    @classmethod
+    def from_compact(cls, data: list) -> "MemberPreference":
+        return cls(data[0], list(data[1]))
+
+
+class Session:
+    """
+    1つのグループの調整の状態。全員共通の希望と、メンバーごとの希望を持つ。
+    プロンプトに埋め込む希望の文字列は、希望が追加されるまで使い回す。
+    グループと1対1チャットのイベントは別のワーカーで同時に処理されるため、
+    希望の追加と文字列の作成はロックの中で行い、古い文字列を使い回さないようにする。
+    """
+    __slots__ = ("status", "common", "members", "_preferences_text", "_lock")
+
+    def __init__(self, status: str = STATUS_HEARING, common: MemberPreference = None, members: dict = None):
+        self.status = status
+        self.common = common if common is not None else MemberPreference(COMMON_MEMBER_ID)
+        # メンバーID -> MemberPreference（希望を送った順）
+        self.members = members if members is not None else {}
+        self._preferences_text = None
+        self._lock = threading.Lock()
+
+    def add_common(self, message: str):
+        with self._lock:
+            self.common.messages.append(message)
+            self._preferences_text = None
+
+    def add_member_message(self, member_id: str, message: str):
+        with self._lock:
+            preference = self.members.get(member_id)
+            if preference is None:
+                preference = self.members[member_id] = MemberPreference(member_id)
+            preference.messages.append(message)
+            self._preferences_text = None
+
+    def preferences_text(self) -> str:
+        """全員の希望（共通の希望とメンバーごとの希望）を、プロンプトに埋め込む文字列にする"""
+        with self._lock:
+            if self._preferences_text is None:
+                self._preferences_text = _dumps(self._preferences())
+            return self._preferences_text
+
+    def common_text(self) -> str:
+        """全員共通の希望を、プロンプトに埋め込む文字列にする"""
+        with self._lock:
+            return _dumps(self.common.messages)
+
+    def preferences(self) -> dict:
+        """希望を {"common": [...], メンバーID: [...]} の辞書にする（ログ出力用。その時点のコピーを返す）"""
+        with self._lock:
+            return {member_id: list(messages) for member_id, messages in self._preferences().items()}
+
+    def _preferences(self) -> dict:
+        preferences = {COMMON_MEMBER_ID: self.common.messages}
+        for member_id, preference in self.members.items():
+            preferences[member_id] = preference.messages
+        return preferences
+
+    def to_compact(self) -> list:
+        with self._lock:
+            return [self.status, list(self.common.messages), [[p.member_id, list(p.messages)] for p in self.members.values()]]
+
+    @classmethod
+    def from_compact(cls, data: list) -> "Session":
+        status, common, members = data
+        members = [MemberPreference.from_compact(m) for m in members]
+        return cls(status, MemberPreference(COMMON_MEMBER_ID, list(common)), {m.member_id: m for m in members})
+
+    def dumps(self) -> str:
+        return _dumps(self.to_compact())
+
+    @classmethod
+    def loads(cls, text: str) -> "Session":
+        return cls.from_compact(json.loads(text))
+
+
+class Enrichment:
+    """AIによるお店の分析結果（ジャンルと口コミの要約）"""
+    __slots__ = ("genre", "review_good_summary", "review_bad_summary")
+
+    def __init__(self, genre: str, review_good_summary: str, review_bad_summary: str):
+        self.genre = genre
+        self.review_good_summary = review_good_summary
+        self.review_bad_summary = review_bad_summary
+
+
+class Restaurant:
+    """カードに表示する1軒のお店の情報"""
+    __slots__ = (
+        "place_id", "tier", "name", "image_url", "rating", "user_rating_count",
+        "address", "genre", "url", "review_good_summary", "review_bad_summary",
+    )
+
+    def __init__(self, place_id: str, tier: str, name: str, image_url: str, rating: float = 0.0,
+                 user_rating_count: int = 0, address: str = "-", genre: str = "-", url: str = "#",
+                 review_good_summary: str = "-", review_bad_summary: str = "-"):
+        self.place_id = place_id
+        self.tier = tier
+        self.name = name
+        self.image_url = image_url
+        self.rating = rating
+        self.user_rating_count = user_rating_count
+        self.address = address
+        self.genre = genre
+        self.url = url
+        self.review_good_summary = review_good_summary
+        self.review_bad_summary = review_bad_summary
+
+    def to_compact(self) -> list:
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def from_compact(cls, data: list) -> "Restaurant":
+        return cls(*data)
+
+    def dumps(self) -> str:
+        return _dumps(self.to_compact())
+
+    @classmethod
+    def loads(cls, text: str) -> "Restaurant":
+        return cls.from_compact(json.loads(text))
@@ -0,0 +1,111 @@
+# app/place_cursor.py
+import time
+from collections import deque
+from itertools import islice
+
+from .rate_limiter import RateLimitExceeded
+
+
+class PlaceResultCursor:
+    """
+    Places APIの検索結果を、必要な分だけ少しずつ取り出すためのカーソル。
+    1ページ目の結果をバッファとして保持し、バッファが尽きたら next_page_token で次のページを取得する。
+    一度返したお店(place_id)は二度と返さない。
+    キャッシュした1ページ目から始める場合はトークンを持たず（期限が切れているおそれがあるため）、
+    続きが必要になった時に search_again で検索し直して、新しいトークンで次のページを取得する。
+    """
+    # next_page_tokenは発行直後だとINVALID_REQUESTになるため、少し待ってから再試行する
+    # 待つ間はスケジューラのワーカーとそのセッションの処理が止まるため、待つのはトークンを受け取ってから
+    # PAGE_TOKEN_MAX_WAIT 秒までに限る（「他のお店を見る」はふつう数秒以上後に押されるため、実際にはほとんど待たない）
+    PAGE_TOKEN_RETRY_WAIT = 1.0
+    PAGE_TOKEN_MAX_WAIT = 2.0
+
+    def __init__(self, fetch_page, first_page: dict, search_again=None):
+        """
+        fetch_page: page_tokenを受け取り、次のページの検索結果(dict)を返す関数
+        first_page: 最初の検索結果
+        search_again: 1ページ目の結果が尽きた時に検索し直し、(1ページ目の検索結果, fetch_page) を返す関数
+        """
+        self._fetch_page = fetch_page
+        self._search_again = search_again
+        self._buffer = deque(first_page.get('results', []))
+        self._next_page_token = first_page.get('next_page_token')
+        # next_page_tokenを受け取った時刻（トークンが使えるようになるまで待つ時間の上限に使う）
+        self._token_received_at = time.monotonic()
+        self._seen_place_ids = set()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> dict:
+        while True:
+            if not self._buffer:
+                if self._next_page_token:
+                    self._load_next_page()
+                elif self._search_again:
+                    self._run_search_again()
+                else:
+                    raise StopIteration
+                continue
+
+            place = self._buffer.popleft()
+            place_id = place.get('place_id')
+            if not place_id or place_id in self._seen_place_ids:
+                continue
+            self._seen_place_ids.add(place_id)
+            return place
+
+    def take(self, count: int) -> list:
+        """
+        次のcount件を取り出す（足りなければある分だけ）。
+        レート制限で次のページを取得できなかった場合は、それまでに取り出せた分を返す（1件もなければ例外をそのまま伝える）。
+        """
+        places = []
+        try:
+            for place in islice(self, count):
+                places.append(place)
+        except RateLimitExceeded:
+            if not places:
+                raise
+        return places
+
+    @property
+    def exhausted(self) -> bool:
+        return not self._buffer and not self._next_page_token and not self._search_again
+
+    def _run_search_again(self):
+        # レート制限で失敗した場合は、次に呼ばれた時にもう一度検索する
+        first_page, fetch_page = self._search_again()
+        self._search_again = None
+        # 1ページ目のお店は返し済みのものとして読み飛ばされ、続きから返す
+        self._fetch_page = fetch_page
+        self._buffer.extend((first_page or {}).get('results', []))
+        self._next_page_token = (first_page or {}).get('next_page_token') if fetch_page else None
+        self._token_received_at = time.monotonic()
+
+    def _load_next_page(self):
+        from googlemaps.exceptions import ApiError
+
+        page_token = self._next_page_token
+        # 取得に失敗しても同じトークンで無限に再試行しないよう、先に消しておく
+        self._next_page_token = None
+
+        deadline = self._token_received_at + self.PAGE_TOKEN_MAX_WAIT
+        while True:
+            try:
+                page = self._fetch_page(page_token)
+                break
+            except RateLimitExceeded:
+                # 時間をおけば取得できるため、トークンを戻して次に呼ばれた時に取得する
+                self._next_page_token = page_token
+                raise
+            except ApiError as e:
+                # 受け取ってから十分に時間が経ったトークンは、待っても使えるようにならない
+                remaining = deadline - time.monotonic()
+                if e.status != 'INVALID_REQUEST' or remaining <= 0:
+                    raise
+                time.sleep(min(self.PAGE_TOKEN_RETRY_WAIT, remaining))
+
+        self._buffer.extend(page.get('results', []))
+        self._next_page_token = page.get('next_page_token')
+        self._token_received_at = time.monotonic()
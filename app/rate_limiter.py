@@ -0,0 +1,102 @@
+# app/rate_limiter.py
+"""
+トークンバケットによるレート制限。
+グループ・ユーザーごと、外部API（Gemini / Places）ごとに、1分あたりに使える回数を制限する。
+制限を超えた場合、呼び出し側はキャッシュやローカルインデックスの結果、
+または「少し待ってください」という返信で処理を続ける（待たせて溜め込むことはしない）。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from .metrics import REGISTRY
+
+# グループ・ユーザーのように相手ごとに分けない制限（API全体の制限）に使うキー
+GLOBAL_KEY = "global"
+
+BUSY_MESSAGE = "ただいま混み合っています。少し時間をおいてから、もう一度送ってください。"
+
+RATE_LIMITED = REGISTRY.counter(
+    "restaurant_agent_rate_limited_total",
+    "レート制限で断った回数（scope: group / user / gemini / places）",
+    ("scope",),
+)
+
+
+class RateLimitExceeded(Exception):
+    """レート制限により、外部APIを呼び出せなかった"""
+
+    def __init__(self, scope: str):
+        super().__init__(f"{scope} のレート制限を超えました。")
+        self.scope = scope
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, per_minute: float, now: float):
+        self.rate = per_minute / 60.0
+        # 1分間に使える回数までは、まとめて使える
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated_at = now
+
+    def available(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return self.tokens
+
+
+class RateLimiter:
+    """
+    scopeごとに1分あたりの回数を設定し、(scope, キー) ごとのトークンバケットで制限する。
+    回数が0または未設定のscopeは制限しない。
+    """
+
+    def __init__(self, per_minute: dict, max_keys: int = 10000):
+        self.per_minute = {scope: limit for scope, limit in per_minute.items() if limit and limit > 0}
+        # 使われなくなったグループ・ユーザーのバケットが溜まり続けないよう、古いものから捨てる
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def try_acquire(self, *keys, cost: float = 1) -> bool:
+        """
+        keys に指定した (scope, キー) のすべてに余裕があれば、それぞれから cost 回分を使って True を返す。
+        1つでも足りなければ、どれも使わずに False を返す。キーがNoneのものは無視する。
+        """
+        return self._acquire(keys, cost) is None
+
+    def acquire(self, *keys, cost: float = 1):
+        """try_acquire と同じだが、制限を超えた場合は RateLimitExceeded を送出する"""
+        scope = self._acquire(keys, cost)
+        if scope is not None:
+            raise RateLimitExceeded(scope)
+
+    def _acquire(self, keys: tuple, cost: float):
+        """使えた場合はNone、制限を超えた場合はそのscopeを返す"""
+        limited = [(scope, key) for scope, key in keys if key is not None and scope in self.per_minute]
+        if not limited:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            buckets = [self._bucket(scope, key, now) for scope, key in limited]
+            for (scope, _), bucket in zip(limited, buckets):
+                if bucket.available(now) < cost:
+                    RATE_LIMITED.inc(scope=scope)
+                    return scope
+            for bucket in buckets:
+                bucket.tokens -= cost
+            return None
+
+    def _bucket(self, scope: str, key: str, now: float) -> TokenBucket:
+        bucket_key = (scope, key)
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self._buckets[bucket_key] = TokenBucket(self.per_minute[scope], now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(bucket_key)
+        return bucket
@@ -0,0 +1,404 @@
+# app/recorder.py
+"""
+本番の会話を、外部とのやりとりごとJSON Linesファイルに記録し（キャプチャ）、
+ネットワークなしで同じ会話を再生する（リプレイ）ための仕組み。
+
+キャプチャ（環境変数 RECORD_PATH を指定すると有効）:
+    受け取ったWebhookの本文、Geminiへのリクエストと応答、Places APIの応答、LINEへ送ったメッセージを、
+    起きた順に1行ずつ書き出す。APIキーなどの秘密の値は "REDACTED" に置き換える。
+
+リプレイ（bench.replay から使う）:
+    ReplayStore が記録を読み込み、Replay* の各クライアントが、同じリクエストに対して記録した応答を返す。
+    同じリクエストが複数回あった場合は、同じLINEイベントの処理中に記録したものを優先し、記録した順に返す。
+    同時に進んでいた会話の順番によってプロンプトが変わった場合は、同じイベントの同じ種類の呼び出しの応答を
+    記録した順に返す（近似一致として数える）。どちらもなければ ReplayMiss を送出する。
+    LINEへ送ったメッセージは、記録と比べられるよう同じ形式で保持する。
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter
+from collections.abc import Mapping
+from types import SimpleNamespace
+
+from .tracing import current_event_id, current_trace_id
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+RECORD_FORMAT_VERSION = 1
+
+# 記録するGoogle Maps Platformのメソッド
+MAPS_METHODS = ("places", "places_nearby", "place", "geocode")
+
+# 記録から取り除く秘密の値を持つ環境変数
+SECRET_ENV_VARS = ("Maps_API_KEY", "LINE_CHANNEL_ACCESS_TOKEN", "LINE_CHANNEL_SECRET")
+REDACTED = "REDACTED"
+
+# 会話の流れを変える設定。キャプチャ時の値を記録し、リプレイ時に同じ値にする
+REPLAY_CONFIG_VARS = ("GEMINI_CONTEXT_CACHE_ENABLED", "PROGRESSIVE_CAROUSEL", "LOCAL_INDEX_FIRST")
+
+
+class ReplayMiss(Exception):
+    """リプレイ中に、記録にないリクエストが送られた"""
+
+
+class ReplayedError(Exception):
+    """キャプチャ時に外部APIが返したエラーを、リプレイで再現したもの"""
+
+
+def _to_plain(value):
+    """protobufのMapCompositeなどを、JSONにできる dict / list / 値 に変換する"""
+    if isinstance(value, Mapping):
+        return {str(k): _to_plain(v) for k, v in value.items()}
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return value
+    if hasattr(value, "__iter__"):
+        return [_to_plain(v) for v in value]
+    return str(value)
+
+
+def request_key(*args, **kwargs) -> str:
+    """Places APIの呼び出しを、記録と照合するためのキーにする（引数の順番・型の違いを吸収する）"""
+    return json.dumps(_to_plain({"args": args, "kwargs": kwargs}), ensure_ascii=False, sort_keys=True, default=str)
+
+
+def serialize_gemini_response(response) -> dict:
+    """Geminiの応答のうち、アプリが使う部分（テキスト・関数呼び出し・トークン数）を記録する"""
+    try:
+        text = response.text
+    except (ValueError, AttributeError):
+        # 関数呼び出しだけの応答では text を取得できない
+        text = None
+    function_calls = []
+    if response.candidates:
+        function_calls = [
+            {"name": fc.name, "args": _to_plain(fc.args)}
+            for fc in (response.candidates[0].function_calls or [])
+        ]
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "text": text,
+        "function_calls": function_calls,
+        "usage": {
+            name: getattr(usage, name, 0) or 0
+            for name in ("prompt_token_count", "candidates_token_count", "cached_content_token_count")
+        } if usage is not None else None,
+    }
+
+
+def serialize_line_messages(messages) -> list:
+    if not isinstance(messages, (list, tuple)):
+        messages = [messages]
+    return [message.as_json_dict() if hasattr(message, "as_json_dict") else message for message in messages]
+
+
+class Recorder:
+    """外部とのやりとりを、スレッドセーフにJSON Linesファイルへ追記する"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._secrets = [os.environ[name] for name in SECRET_ENV_VARS if os.getenv(name)]
+        self._seq = 0
+        self._file = open(path, "a", encoding="utf-8")
+        self.write({
+            "type": "meta",
+            "version": RECORD_FORMAT_VERSION,
+            "config": {name: os.getenv(name) for name in REPLAY_CONFIG_VARS if os.getenv(name) is not None},
+        })
+        logger.info("外部とのやりとりを記録します", extra={"path": path})
+
+    def write(self, record: dict):
+        record.setdefault("ts", round(time.time(), 3))
+        trace_id = current_trace_id()
+        if trace_id:
+            record.setdefault("trace_id", trace_id)
+        event_id = current_event_id()
+        if event_id:
+            record.setdefault("event_id", event_id)
+        with self._lock:
+            self._seq += 1
+            record["seq"] = self._seq
+            line = self._redact(json.dumps(record, ensure_ascii=False, default=str))
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def _redact(self, text: str) -> str:
+        for secret in self._secrets:
+            text = text.replace(secret, REDACTED)
+        return text
+
+    def record_webhook(self, body: str):
+        self.write({"type": "webhook", "body": body})
+
+    def call(self, kind: str, method: str, request, func, serialize=None):
+        """func() を呼び出し、リクエストと応答（またはエラー）を記録して、応答を返す"""
+        record = {"type": kind, "method": method, "request": request}
+        try:
+            response = func()
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            self.write(record)
+            raise
+        record["response"] = serialize(response) if serialize else response
+        self.write(record)
+        return response
+
+    def wrap(self, kind: str, client):
+        """クライアントを、呼び出しを記録するものに包む（kind: gemini / maps / line）"""
+        if client is None:
+            return None
+        wrappers = {"gemini": RecordingGenerativeModel, "maps": RecordingMapsClient, "line": RecordingLineBotApi}
+        return wrappers[kind](client, self)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+# --- キャプチャ用のクライアント（本物のクライアントを包んで、呼び出しを記録する） ---
+
+class RecordingGenerativeModel:
+    def __init__(self, model, recorder: Recorder):
+        self._model = model
+        self._recorder = recorder
+
+    def generate_content(self, contents, **kwargs):
+        return self._recorder.call(
+            "gemini", "generate_content", contents,
+            lambda: self._model.generate_content(contents, **kwargs), serialize_gemini_response,
+        )
+
+    def start_chat(self, **kwargs):
+        return RecordingChatSession(self._model.start_chat(**kwargs), self._recorder)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+class RecordingChatSession:
+    def __init__(self, chat, recorder: Recorder):
+        self._chat = chat
+        self._recorder = recorder
+
+    def send_message(self, content, **kwargs):
+        return self._recorder.call(
+            "gemini", "send_message", content,
+            lambda: self._chat.send_message(content, **kwargs), serialize_gemini_response,
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class RecordingCachedContentBackend:
+    """コンテキストキャッシュのバックエンドを包み、キャッシュを参照するモデルの呼び出しも記録する"""
+
+    def __init__(self, backend, recorder: Recorder):
+        self._backend = backend
+        self._recorder = recorder
+
+    def create(self, system_instruction: str, ttl):
+        return self._backend.create(system_instruction, ttl)
+
+    def extend(self, cached_content, ttl):
+        self._backend.extend(cached_content, ttl)
+
+    def model_for(self, cached_content):
+        return RecordingGenerativeModel(self._backend.model_for(cached_content), self._recorder)
+
+
+class RecordingMapsClient:
+    def __init__(self, client, recorder: Recorder):
+        self._client = client
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name not in MAPS_METHODS:
+            return attr
+
+        def call(*args, **kwargs):
+            return self._recorder.call("maps", name, request_key(*args, **kwargs), lambda: attr(*args, **kwargs))
+        return call
+
+
+class RecordingLineBotApi:
+    def __init__(self, line_bot_api, recorder: Recorder):
+        self._line_bot_api = line_bot_api
+        self._recorder = recorder
+
+    # 送信の完了を待っている呼び出し元が先に終了しても記録が残るよう、送る前に記録する
+    def reply_message(self, reply_token: str, messages, **kwargs):
+        self._recorder.write({"type": "line", "method": "reply_message", "to": reply_token,
+                              "messages": serialize_line_messages(messages)})
+        self._line_bot_api.reply_message(reply_token, messages, **kwargs)
+
+    def push_message(self, to: str, messages, **kwargs):
+        self._recorder.write({"type": "line", "method": "push_message", "to": to,
+                              "messages": serialize_line_messages(messages)})
+        self._line_bot_api.push_message(to, messages, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._line_bot_api, name)
+
+
+# --- リプレイ用のクライアント（記録した応答を返す） ---
+
+def load_records(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ReplayStore:
+    """
+    記録を読み込み、外部APIへのリクエストに対して記録した応答を返す。
+    リプレイ中の外部APIの呼び出し回数と、近似一致・記録になかったリクエストの数を数える。
+    """
+
+    def __init__(self, records: list):
+        self._lock = threading.Lock()
+        self._by_request = {}  # (種類, メソッド, リクエスト) -> 記録のリスト
+        self._by_event = {}    # (種類, メソッド, イベントID) -> 記録のリスト
+        self._used = set()     # 返した記録のseq
+        self.config = {}
+        self.webhooks = []
+        self.recorded_outputs = []
+        self.recorded_calls = Counter()
+        self.calls = Counter()
+        self.approximate = Counter()
+        self.misses = Counter()
+        for record in records:
+            kind = record.get("type")
+            if kind == "meta":
+                self.config.update(record.get("config", {}))
+            elif kind == "webhook":
+                self.webhooks.append(record["body"])
+            elif kind == "line":
+                self.recorded_outputs.append({k: record[k] for k in ("method", "to", "messages")})
+                self.recorded_calls[f"line.{record['method']}"] += 1
+            elif kind in ("gemini", "maps"):
+                key = (kind, record["method"], self._request_text(record["request"]))
+                self._by_request.setdefault(key, []).append(record)
+                self._by_event.setdefault((kind, record["method"], record.get("event_id")), []).append(record)
+                self.recorded_calls[f"{kind}.{record['method']}"] += 1
+
+    @staticmethod
+    def _request_text(request) -> str:
+        return request if isinstance(request, str) else json.dumps(request, ensure_ascii=False, sort_keys=True)
+
+    def _first_unused(self, records: list, event_id: str = None):
+        for record in records:
+            if record["seq"] not in self._used and (event_id is None or record.get("event_id") == event_id):
+                self._used.add(record["seq"])
+                return record
+        return None
+
+    def take(self, kind: str, method: str, request) -> dict:
+        """記録した応答を返す。記録になければ ReplayMiss、キャプチャ時にエラーだった場合は ReplayedError を送出する"""
+        name = f"{kind}.{method}"
+        event_id = current_event_id()
+        with self._lock:
+            self.calls[name] += 1
+            same_request = self._by_request.get((kind, method, self._request_text(request)), [])
+            record = (self._first_unused(same_request, event_id) if event_id else None) or self._first_unused(same_request)
+            if record is None and event_id:
+                record = self._first_unused(self._by_event.get((kind, method, event_id), []))
+                if record is not None:
+                    self.approximate[name] += 1
+            if record is None:
+                self.misses[name] += 1
+        if record is None:
+            raise ReplayMiss(f"{name} の記録がありません: {str(request)[:80]}")
+        if "error" in record:
+            raise ReplayedError(record["error"])
+        return record["response"]
+
+    def count(self, name: str):
+        with self._lock:
+            self.calls[name] += 1
+
+
+class ReplayResponse:
+    """記録したGeminiの応答を、アプリが使う属性（text / candidates / usage_metadata）で返す"""
+
+    def __init__(self, data: dict):
+        self.text = data.get("text") or ""
+        function_calls = [SimpleNamespace(name=fc["name"], args=fc["args"]) for fc in data.get("function_calls", [])]
+        self.candidates = [SimpleNamespace(function_calls=function_calls)]
+        usage = data.get("usage")
+        self.usage_metadata = SimpleNamespace(**usage) if usage is not None else None
+
+
+class ReplayGenerativeModel:
+    def __init__(self, store: ReplayStore):
+        self.store = store
+
+    def generate_content(self, contents, **kwargs) -> ReplayResponse:
+        return ReplayResponse(self.store.take("gemini", "generate_content", contents))
+
+    def start_chat(self, history: list = None, **kwargs) -> "ReplayChatSession":
+        return ReplayChatSession(self.store, history)
+
+
+class ReplayChatSession:
+    def __init__(self, store: ReplayStore, history: list = None):
+        self.store = store
+        self.history = list(history or [])
+
+    def send_message(self, content, **kwargs) -> ReplayResponse:
+        return ReplayResponse(self.store.take("gemini", "send_message", content))
+
+
+class ReplayCachedContentBackend:
+    """キャプチャ時にコンテキストキャッシュを使っていた場合に、同じ流れで処理するためのバックエンド"""
+
+    def __init__(self, model: ReplayGenerativeModel):
+        self.model = model
+
+    def create(self, system_instruction: str, ttl):
+        return REDACTED
+
+    def extend(self, cached_content, ttl):
+        pass
+
+    def model_for(self, cached_content) -> ReplayGenerativeModel:
+        return self.model
+
+
+class ReplayMapsClient:
+    def __init__(self, store: ReplayStore):
+        self.store = store
+
+    def __getattr__(self, name):
+        if name not in MAPS_METHODS:
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            return self.store.take("maps", name, request_key(*args, **kwargs))
+        return call
+
+
+class ReplayLineBotApi:
+    """送ったメッセージを、記録と同じ形式で保持する"""
+
+    def __init__(self, store: ReplayStore):
+        self.store = store
+        self._lock = threading.Lock()
+        self.outputs = []
+
+    def reply_message(self, reply_token: str, messages, **kwargs):
+        self._send("reply_message", reply_token, messages)
+
+    def push_message(self, to: str, messages, **kwargs):
+        self._send("push_message", to, messages)
+
+    def _send(self, method: str, to: str, messages):
+        self.store.count(f"line.{method}")
+        # 記録と同じく、JSONにしてから比べる（タプルとリストの違いなどを吸収する）
+        output = json.loads(json.dumps({"method": method, "to": to, "messages": serialize_line_messages(messages)},
+                                       ensure_ascii=False, default=str))
+        with self._lock:
+            self.outputs.append(output)
@@ -0,0 +1,179 @@
+# app/scheduler.py
+"""
+Webhookイベントを優先度付きで処理するワーカープール。
+
+- 優先度の高いクラスのイベントから順に処理する（数字が小さいほど優先）
+- 同じクラスの中では、キー（グループIDやユーザーID）ごとに順番に1件ずつ取り出し、
+  1つのグループがイベントを大量に送っても、他のグループが待たされ続けないようにする
+- 同じキーのイベントは同時に処理せず、届いた順に1件ずつ処理する（会話の状態を壊さないため）
+  キーのイベントが複数のクラスにある場合も届いた順に処理し、キーの中で最も高い優先度で順番を待つ
+- extra_keys を指定したイベントは、それらのキーのイベントとも同時に処理しない
+  （同じユーザーのグループでの発言と1対1チャットが、同じチャットセッションを同時に使わないようにする）
+- 処理待ちが max_depth 件に達したら、決まったコマンド以外は受け付けない（受付制御）
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+from .metrics import REGISTRY
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# 優先度のクラス
+PRIORITY_COMMAND = 0     # お店の最終決定、スタート・終了などの決まったコマンド、グループへの参加
+PRIORITY_GROUP = 1       # グループでのヒアリング
+PRIORITY_INDIVIDUAL = 2  # 1対1チャットでの検索や、カードのボタン操作
+PRIORITY_NAMES = ("command", "group", "individual")
+
+QUEUE_DEPTH = REGISTRY.gauge(
+    "restaurant_agent_scheduler_queue_depth",
+    "処理待ちのイベント数",
+    ("priority",),
+)
+REJECTED_EVENTS = REGISTRY.counter(
+    "restaurant_agent_scheduler_rejected_total",
+    "処理待ちが多すぎるため受け付けなかったイベント数",
+    ("priority",),
+)
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "restaurant_agent_scheduler_wait_seconds",
+    "イベントがキューに入ってから処理が始まるまでの時間（秒）",
+    ("priority",),
+)
+
+
+class SchedulerStopped(RuntimeError):
+    """停止したスケジューラに処理を submit() した"""
+
+
+class EventScheduler:
+    """
+    submit() で受け付けた処理を、workers 個のスレッドで優先度順に実行する。
+    スレッドは最初に submit() された時に起動する。
+    """
+
+    def __init__(self, workers: int = 8, max_depth: int = 0):
+        self.workers = workers
+        # 処理待ちの上限（0の場合は制限しない）
+        self.max_depth = max_depth
+        self._cond = threading.Condition()
+        # 優先度ごとに、キー -> 処理待ちの (受付順, 受付時刻, 処理, 追加のキー) のキュー。OrderedDictの順番がキーを回す順番
+        self._queues = [OrderedDict() for _ in PRIORITY_NAMES]
+        self._depths = [0] * len(PRIORITY_NAMES)
+        self._busy_keys = set()
+        self._sequence = 0
+        self._threads = []
+        self._stopping = False
+
+    def submit(self, func, priority: int, key: str, extra_keys: tuple = ()):
+        """
+        func（引数なしの関数）を、priority のクラス・key の順番待ちに加える。
+        extra_keys のいずれかのキーのイベントを処理している間は、func を処理しない。
+        """
+        with self._cond:
+            if self._stopping:
+                raise SchedulerStopped("スケジューラは停止しています。")
+            if not self._threads:
+                self._start()
+            self._sequence += 1
+            self._queues[priority].setdefault(key, deque()).append(
+                (self._sequence, time.perf_counter(), func, tuple(extra_keys)))
+            self._depths[priority] += 1
+            QUEUE_DEPTH.inc(priority=PRIORITY_NAMES[priority])
+            self._cond.notify()
+
+    def admits(self, priority: int) -> bool:
+        """
+        priority のイベントを受け付けられるか。決まったコマンドは常に受け付ける。
+        受け付けない場合は、断った回数を記録する。
+        """
+        if priority == PRIORITY_COMMAND or self.max_depth <= 0 or self.depth() < self.max_depth:
+            return True
+        REJECTED_EVENTS.inc(priority=PRIORITY_NAMES[priority])
+        return False
+
+    def depth(self, priority: int = None) -> int:
+        """処理待ちのイベント数（priorityを省略した場合は全クラスの合計）"""
+        with self._cond:
+            return sum(self._depths) if priority is None else self._depths[priority]
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """処理待ち・処理中のイベントがなくなるまで待つ。タイムアウトした場合はFalseを返す"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while any(self._depths) or self._busy_keys:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def shutdown(self, timeout: float = None):
+        """新しい受け付けを止め、処理待ちのイベントを処理し終えるまで待つ"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"event-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_task(self):
+        """
+        処理中でないキーのうち、優先度が最も高く、最も長く順番を待っているキーの処理を取り出す。
+        取り出すのはキーの中で最も早く届いた処理で、優先度の低いクラスにあることもある。
+        """
+        for queue in self._queues:
+            for key in queue:
+                if key in self._busy_keys:
+                    continue
+                priority = self._oldest_priority(key)
+                tasks = self._queues[priority][key]
+                if not self._busy_keys.isdisjoint(tasks[0][3]):
+                    continue
+                task = tasks.popleft()
+                if tasks:
+                    # 次の順番は他のキーに譲る
+                    self._queues[priority].move_to_end(key)
+                else:
+                    del self._queues[priority][key]
+                self._depths[priority] -= 1
+                return priority, key, task
+        return None
+
+    def _oldest_priority(self, key: str) -> int:
+        """key の処理待ちのうち、最も早く届いた処理があるクラス"""
+        heads = [(queue[key][0][0], priority) for priority, queue in enumerate(self._queues) if key in queue]
+        return min(heads)[1]
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while True:
+                    item = self._next_task()
+                    if item is not None:
+                        break
+                    if self._stopping and not any(self._depths):
+                        return
+                    self._cond.wait()
+                priority, key, (_, enqueued_at, func, extra_keys) = item
+                keys = (key,) + extra_keys
+                self._busy_keys.update(keys)
+
+            priority_name = PRIORITY_NAMES[priority]
+            QUEUE_DEPTH.dec(priority=priority_name)
+            QUEUE_WAIT_SECONDS.observe(time.perf_counter() - enqueued_at, priority=priority_name)
+            try:
+                func()
+            except Exception as e:
+                logger.exception("イベントの処理中にエラーが発生しました: %s", e, extra={"priority": priority_name})
+            finally:
+                with self._cond:
+                    self._busy_keys.difference_update(keys)
+                    # このキーの次のイベントを、待機中のワーカーが取り出せるようにする
+                    self._cond.notify_all()
@@ -0,0 +1,109 @@
+# app/search_cache.py
+"""
+検索条件を正規化して、同じ意味の検索の結果を使い回すキャッシュ。
+
+AIは同じ希望を毎回少しずつ違う言い方で検索する（「新宿 和食 個室」と「和食 新宿 個室あり」など）。
+キーワードを分割して「あり」などの語尾や意味のない語を取り除き、並べ替えてから、
+価格帯・位置の条件と合わせてキーにすることで、言い換えた検索でも同じ結果に当たるようにする。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from .local_index import split_keywords
+from .metrics import REGISTRY
+
+# 検索結果を絞り込む意味のない語
+NOISE_WORDS = {
+    "お店", "店", "飲食店", "レストラン", "おすすめ", "オススメ", "人気", "いい", "良い",
+    "近く", "周辺", "付近", "あたり", "辺り", "で", "の", "が", "を", "に",
+}
+# 「個室あり」「駐車場付き」のように、付いていてもいなくても同じ意味になる語尾
+OPTIONAL_SUFFIXES = ("あり", "有り", "付き", "つき", "ok", "可")
+
+# Placesの価格帯は0〜4。0以下・4以上の指定は、指定なしと同じ
+MIN_PRICE_LEVEL = 0
+MAX_PRICE_LEVEL = 4
+
+SEARCH_CACHE_REQUESTS = REGISTRY.counter(
+    "restaurant_agent_search_cache_requests_total",
+    "検索結果キャッシュの参照回数（result: hit / miss）",
+    ("result",),
+)
+
+
+def normalize_keywords(query: str) -> tuple:
+    """キーワードを分割し、語尾と意味のない語を取り除いて、並べ替えたタプルにする"""
+    tokens = set()
+    for token in split_keywords(query):
+        for suffix in OPTIONAL_SUFFIXES:
+            if token.endswith(suffix) and len(token) > len(suffix):
+                token = token[:-len(suffix)]
+                break
+        if token not in NOISE_WORDS:
+            tokens.add(token)
+    # すべて取り除かれた場合は、元のキーワードで区別する
+    return tuple(sorted(tokens)) if tokens else tuple(sorted(set(split_keywords(query))))
+
+
+def normalize_search(query: str, location: dict = None, radius: int = None,
+                     min_price: int = None, max_price: int = None) -> tuple:
+    """検索条件を、同じ意味の検索が同じ値になるキーに変換する"""
+    location_key = (round(location['lat'], 4), round(location['lng'], 4)) if location else None
+    if min_price is not None and min_price <= MIN_PRICE_LEVEL:
+        min_price = None
+    if max_price is not None and max_price >= MAX_PRICE_LEVEL:
+        max_price = None
+    return (normalize_keywords(query), location_key, radius, min_price, max_price)
+
+
+class TTLCache:
+    """キーごとに値をTTL付きで保持する（件数が上限を超えたら、最も長く使われていないものから捨てる）"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # キー -> (期限, 値)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        return self._lookup(key) is not None
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is None else value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+
+class SearchResultCache(TTLCache):
+    """正規化した検索条件をキーに、検索結果をTTL付きで保持する（件数が上限を超えたら古いものから捨てる）"""
+
+    def __init__(self, ttl_seconds: float = 600, max_entries: int = 500):
+        super().__init__(ttl_seconds, max_entries)
+
+    def get(self, key: tuple, default=None):
+        value = self._lookup(key)
+        SEARCH_CACHE_REQUESTS.inc(result="miss" if value is None else "hit")
+        return default if value is None else value
@@ -0,0 +1,219 @@
+# app/tracing.py
+"""
+1つのWebhookイベントの処理を追跡する、軽量なトレーシング。
+イベントごとにトレースを開始し、その中の処理（LLM・Google Maps・LINEの呼び出しなど）を子スパンとして記録する。
+完了したトレースはメモリ上のリングバッファに保持し（任意でJSON Linesファイルにも書き出す）、
+デバッグ用のエンドポイントから参照できる。
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+# app.logger がこのモジュールを使うため、循環importを避けてロガーを直接取得する
+logger = logging.getLogger("restaurant_agent.tracing")
+
+# 現在処理中のスパン（スレッド・非同期タスクごとに独立）
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def current_trace_id():
+    """処理中のトレースのID（トレース中でなければNone）"""
+    span = _current_span.get()
+    return span.trace.trace_id if span is not None else None
+
+
+def current_event_id():
+    """処理中のトレースのLINEイベントID（webhookEventId）。トレース中でなければNone"""
+    span = _current_span.get()
+    return span.trace.root.attributes.get("event_id") if span is not None else None
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "started_at", "_started", "duration_ms", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: str, attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+        self.attributes = attributes
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def finish(self, error: BaseException = None):
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_offset_ms": round((self.started_at - self.trace.root.started_at) * 1000, 3),
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    def __init__(self, name: str, attributes: dict):
+        self.trace_id = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self.spans = []
+        self.root = self.add_span(name, None, attributes)
+
+    def add_span(self, name: str, parent_id: str, attributes: dict) -> Span:
+        span = Span(self, name, parent_id, attributes)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "started_at": self.root.started_at,
+            "duration_ms": round(self.root.duration_ms, 3) if self.root.duration_ms is not None else None,
+            "attributes": self.root.attributes,
+            "error": self.root.error,
+            "spans": [span.to_dict() for span in spans],
+        }
+
+
+class Tracer:
+    def __init__(self, max_traces: int = 200, file_path: str = None):
+        self._lock = threading.Lock()
+        self._traces = deque(maxlen=max_traces)
+        self.file_path = file_path
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """新しいトレースを開始する。withブロックを抜けるとリングバッファ（とファイル）に保存される"""
+        trace = Trace(name, attributes)
+        token = _current_span.set(trace.root)
+        error = None
+        try:
+            yield trace.root
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            trace.root.finish(error)
+            _current_span.reset(token)
+            self._store(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """現在のトレースに子スパンを追加する。トレース中でなければ何も記録しない"""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        span = parent.trace.add_span(name, parent.span_id, attributes)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            span.finish(error)
+            _current_span.reset(token)
+
+    def set_attribute(self, key: str, value):
+        """現在のスパンに属性を追加する"""
+        span = _current_span.get()
+        if span is not None:
+            span.set_attribute(key, value)
+
+    def recent(self, limit: int = 20, min_duration_ms: float = 0, **attributes) -> list:
+        """
+        新しい順にトレースを返す。
+        min_duration_msより遅いもの、attributesで指定した属性（group_idなど）が一致するものだけに絞り込める。
+        """
+        with self._lock:
+            traces = list(self._traces)
+        results = []
+        for trace in reversed(traces):
+            if (trace.root.duration_ms or 0) < min_duration_ms:
+                continue
+            if any(trace.root.attributes.get(key) != value for key, value in attributes.items()):
+                continue
+            results.append(trace.to_dict())
+            if len(results) >= limit:
+                break
+        return results
+
+    def get(self, trace_id: str):
+        with self._lock:
+            for trace in self._traces:
+                if trace.trace_id == trace_id:
+                    return trace.to_dict()
+        return None
+
+    def _store(self, trace: Trace):
+        with self._lock:
+            self._traces.append(trace)
+        if self.file_path:
+            try:
+                with open(self.file_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+            except OSError as e:
+                logger.warning("トレースの書き出し中にエラーが発生しました: %s", e)
+
+
+def argument_sizes(args: dict) -> dict:
+    """
+    スパンに付ける、関数の引数の概要。ユーザーの入力した文章をトレースに残さないよう、
+    値ではなく文字列・リストの長さ（それ以外は型の名前）だけを記録する。
+    """
+    return {
+        key: len(value) if isinstance(value, (str, list, tuple, dict)) else type(value).__name__
+        for key, value in args.items()
+    }
+
+
+def event_attributes(event) -> dict:
+    """LINEのイベントから、トレースに付ける属性（種別・イベントID・グループID・ユーザーID）を取り出す"""
+    source = getattr(event, "source", None)
+    attributes = {"event_type": getattr(event, "type", type(event).__name__)}
+    if getattr(event, "webhook_event_id", None):
+        attributes["event_id"] = event.webhook_event_id
+    if getattr(source, "group_id", None):
+        attributes["group_id"] = source.group_id
+    if getattr(source, "user_id", None):
+        attributes["user_id"] = source.user_id
+    return attributes
+
+
+def traced_event(func):
+    """LINEイベントのハンドラに付けるデコレータ。イベントごとに新しいトレースを開始する"""
+    @functools.wraps(func)
+    def wrapper(event):
+        with TRACER.trace(func.__name__, **event_attributes(event)):
+            return func(event)
+    return wrapper
+
+
+TRACER = Tracer(
+    max_traces=int(os.getenv("TRACE_BUFFER_SIZE", "200")),
+    file_path=os.getenv("TRACE_FILE_PATH") or None,
+)
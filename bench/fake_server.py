@@ -0,0 +1,38 @@
+# bench/fake_server.py
+"""
+外部サービスを偽物に差し替えたアプリを、HTTPサーバーとして起動する（負荷試験の対象用）。
+
+使い方:
+    python -m bench.fake_server --port 8000 --gemini-ms 800 --maps-ms 150 --line-ms 50
+署名には bench.harness.BENCH_CHANNEL_SECRET（bench-channel-secret）を使う。
+"""
+import argparse
+
+import uvicorn
+
+from .harness import BenchmarkApp
+
+
+def main():
+    parser = argparse.ArgumentParser(description="偽の外部サービスでアプリを起動する")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--gemini-ms", type=float, default=0)
+    parser.add_argument("--enrichment-ms", type=float, default=None)
+    parser.add_argument("--maps-ms", type=float, default=0)
+    parser.add_argument("--details-ms", type=float, default=None)
+    parser.add_argument("--line-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    bench = BenchmarkApp(
+        gemini_ms=args.gemini_ms,
+        enrichment_ms=args.enrichment_ms,
+        maps_ms=args.maps_ms,
+        details_ms=args.details_ms,
+        line_ms=args.line_ms,
+    )
+    uvicorn.run(bench.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+# bench/fakes.py
+"""
+外部サービス（Gemini / Google Maps Platform / LINE Messaging API）の偽物。
+ネットワークには接続せず、設定した遅延だけ待ってから決まった応答を返す。
+呼び出し回数は CallCounter に記録する。
+"""
+import copy
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+
+
+class CallCounter:
+    """外部APIの呼び出し回数を、スレッドセーフに数える"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def add(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+class Latency:
+    """平均latency_msミリ秒、±jitter_msミリ秒の遅延を発生させる"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, seed: int = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.latency_ms <= 0 and self.jitter_ms <= 0:
+            return
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(0.0, self.latency_ms + jitter) / 1000)
+
+
+# --- Gemini ---
+
+class FakeFunctionCall:
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+
+
+class FakePart:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeContent:
+    def __init__(self, text: str):
+        self.parts = [FakePart(text)]
+
+
+class FakeCandidate:
+    def __init__(self, text: str, function_calls: list):
+        self.content = FakeContent(text)
+        self.function_calls = function_calls
+
+
+class FakeUsageMetadata:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+        self.cached_content_token_count = 0
+
+
+class FakeResponse:
+    """vertexaiのGenerationResponseのうち、アプリが使う属性だけを持つ応答"""
+
+    def __init__(self, prompt: str, text: str = "", function_call: FakeFunctionCall = None, cached_tokens: int = 0):
+        function_calls = [function_call] if function_call else []
+        self.text = text
+        self.candidates = [FakeCandidate(text, function_calls)]
+        # 日本語はおおよそ1文字1トークン程度として概算する。キャッシュから読んだ分もプロンプトに含まれる
+        self.usage_metadata = FakeUsageMetadata(len(prompt) + cached_tokens, len(text) + (20 if function_call else 0))
+        self.usage_metadata.cached_content_token_count = cached_tokens
+
+
+def text_reply(text: str) -> dict:
+    """シナリオ用: AIがテキストで返答する"""
+    return {"text": text}
+
+
+def function_call(name: str, **args) -> dict:
+    """シナリオ用: AIが関数を呼び出す"""
+    return {"function_call": (name, args)}
+
+
+NEW_MESSAGE_PATTERN = re.compile(r'新しいメッセージ: "(.*)"')
+
+
+class FakeChatSession:
+    def __init__(self, model: "FakeGenerativeModel", history: list = None):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, prompt: str) -> FakeResponse:
+        self.model.counter.add("gemini.send_message")
+        self.model.latency.wait()
+        return self.model.decide(prompt)
+
+
+class FakeGenerativeModel:
+    """
+    GenerativeModelの偽物。
+    チャットでは、プロンプト中の「新しいメッセージ」に対する応答を script から選んで返す。
+    script は {メッセージ本文: text_reply(...) または function_call(...)} の辞書。
+    """
+
+    def __init__(self, counter: CallCounter, latency: Latency = None,
+                 enrichment_latency: Latency = None, script: dict = None):
+        self.counter = counter
+        self.latency = latency or Latency()
+        # 口コミ要約・ジャンル推定（generate_content）の遅延
+        self.enrichment_latency = enrichment_latency or self.latency
+        self.script = script or {}
+        # from_cached_contentで作られたモデルの場合、キャッシュしている先頭部分のトークン数
+        self.cached_content_token_count = 0
+
+    def start_chat(self, history: list = None, **kwargs) -> FakeChatSession:
+        return FakeChatSession(self, history)
+
+    def decide(self, prompt: str) -> FakeResponse:
+        match = NEW_MESSAGE_PATTERN.search(prompt)
+        if not match:
+            # システムプロンプトなど、ユーザーのメッセージを含まないもの
+            return FakeResponse(prompt, text="承知しました。", cached_tokens=self.cached_content_token_count)
+
+        action = self.script.get(match.group(1), text_reply("なるほど、承知しました！"))
+        if "function_call" in action:
+            name, args = action["function_call"]
+            return FakeResponse(prompt, function_call=FakeFunctionCall(name, dict(args)),
+                                cached_tokens=self.cached_content_token_count)
+        return FakeResponse(prompt, text=action["text"], cached_tokens=self.cached_content_token_count)
+
+    def generate_content(self, prompt: str, **kwargs) -> FakeResponse:
+        self.counter.add("gemini.generate_content")
+        self.enrichment_latency.wait()
+        if "【ポジティブな点】" in prompt:
+            text = "【ポジティブな点】: 料理が美味しく、店員さんの対応が丁寧。\n【ネガティブな点】: 週末は混雑している。"
+        else:
+            text = "和食"
+        return FakeResponse(prompt, text=text)
+
+
+class FakeCachedContent:
+    def __init__(self, name: str, token_count: int):
+        self.name = name
+        self.token_count = token_count
+
+
+class FakeCachedContentBackend:
+    """
+    VertexCachedContentBackendの偽物。キャッシュの作成・延長の回数を数え、
+    キャッシュを参照するモデルとして、応答にcached_content_token_countを付けるFakeGenerativeModelを返す。
+    """
+
+    # ツールの定義のトークン数の概算
+    TOOL_SCHEMA_TOKENS = 1500
+
+    def __init__(self, model: FakeGenerativeModel, latency: Latency = None):
+        self.model = model
+        self.latency = latency or Latency()
+        self._created = 0
+
+    def create(self, system_instruction: str, ttl):
+        self.model.counter.add("gemini.create_cached_content")
+        self.latency.wait()
+        self._created += 1
+        return FakeCachedContent(f"cachedContents/fake-{self._created}", len(system_instruction) + self.TOOL_SCHEMA_TOKENS)
+
+    def extend(self, cached_content: FakeCachedContent, ttl):
+        self.model.counter.add("gemini.update_cached_content")
+        self.latency.wait()
+
+    def model_for(self, cached_content: FakeCachedContent) -> FakeGenerativeModel:
+        model = copy.copy(self.model)
+        model.cached_content_token_count = cached_content.token_count
+        return model
+
+
+# --- Google Maps Platform ---
+
+class FakeGoogleMapsClient:
+    """googlemaps.Clientの偽物。検索ごとに決まったお店のリストを、1ページ20件で最大3ページ返す"""
+
+    PAGE_SIZE = 20
+    MAX_PAGES = 3
+
+    def __init__(self, counter: CallCounter, latency: Latency = None, details_latency: Latency = None):
+        self.counter = counter
+        self.latency = latency or Latency()
+        self.details_latency = details_latency or self.latency
+        self._lock = threading.Lock()
+        self._pages = {}  # page_token -> (検索語, ページ番号)
+        self._issued_tokens = 0
+
+    def places(self, query: str = None, page_token: str = None, **kwargs) -> dict:
+        self.counter.add("maps.places")
+        self.latency.wait()
+        return self._page(query, page_token, kwargs.get("location"))
+
+    def places_nearby(self, location=None, keyword: str = None, page_token: str = None, **kwargs) -> dict:
+        self.counter.add("maps.places_nearby")
+        self.latency.wait()
+        return self._page(keyword, page_token, location)
+
+    def place(self, place_id: str, fields: list = None, **kwargs) -> dict:
+        self.counter.add("maps.place")
+        self.details_latency.wait()
+        place = self._make_place(place_id, None)
+        place["website"] = f"https://example.com/{place_id}"
+        place["reviews"] = [
+            {"text": "料理がとても美味しかったです。また来たいと思います。", "rating": 5},
+            {"text": "雰囲気が良く、接客も丁寧でした。少し混んでいました。", "rating": 4},
+            {"text": "コスパが良いお店です。", "rating": 4},
+        ]
+        return {"result": place, "status": "OK"}
+
+    def geocode(self, address: str, **kwargs) -> list:
+        self.counter.add("maps.geocode")
+        self.latency.wait()
+        return []
+
+    def _page(self, query: str, page_token: str, location) -> dict:
+        with self._lock:
+            if page_token:
+                # 本物と同じく、同じページトークンは期限内なら何度でも使える
+                query, page = self._pages[page_token]
+            else:
+                page = 0
+            next_page_token = None
+            if page + 1 < self.MAX_PAGES:
+                self._issued_tokens += 1
+                next_page_token = f"token-{self._issued_tokens}"
+                self._pages[next_page_token] = (query, page + 1)
+
+        query_hash = zlib.crc32(str(query).encode("utf-8"))
+
+        results = [
+            self._make_place(f"{query_hash % 100000}-{page * self.PAGE_SIZE + i}", location)
+            for i in range(self.PAGE_SIZE)
+        ]
+        response = {"results": results, "status": "OK"}
+        if next_page_token:
+            response["next_page_token"] = next_page_token
+        return response
+
+    @staticmethod
+    def _make_place(place_id: str, location) -> dict:
+        number = sum(ord(c) for c in place_id)
+        lat, lng = location if location else (35.6909, 139.7003)
+        return {
+            "place_id": f"fake-{place_id}" if not place_id.startswith("fake-") else place_id,
+            "name": f"ベンチマーク食堂 {place_id}",
+            "formatted_address": "東京都新宿区西新宿1丁目",
+            "rating": round(3.0 + (number % 20) / 10, 1),
+            "user_ratings_total": 50 + number % 500,
+            "price_level": 1 + number % 4,
+            "types": ["restaurant", "food", "point_of_interest", "establishment"],
+            "photos": [{"photo_reference": f"photo-{place_id}"}],
+            "geometry": {"location": {"lat": lat + (number % 100) / 20000, "lng": lng + (number % 37) / 20000}},
+        }
+
+
+# --- LINE Messaging API ---
+
+class FakeLineBotApi:
+    """
+    LineBotApiの偽物。送信したメッセージを記録し、reply_tokenごとに返信が完了したことを通知する。
+    """
+
+    def __init__(self, counter: CallCounter, latency: Latency = None):
+        self.counter = counter
+        self.latency = latency or Latency()
+        self._lock = threading.Lock()
+        self._replied = {}      # reply_token -> threading.Event
+        self.reply_times = {}   # reply_token -> 最初に返信した時刻(time.perf_counter)
+        self.sent = []          # (種別, 宛先, メッセージのリスト)
+
+    def reply_message(self, reply_token: str, messages, **kwargs):
+        self.counter.add("line.reply_message")
+        self.latency.wait()
+        self._record("reply", reply_token, messages)
+        with self._lock:
+            self.reply_times.setdefault(reply_token, time.perf_counter())
+        self._event_for(reply_token).set()
+
+    def push_message(self, to: str, messages, **kwargs):
+        self.counter.add("line.push_message")
+        self.latency.wait()
+        self._record("push", to, messages)
+
+    def wait_for_reply(self, reply_token: str, timeout: float) -> bool:
+        """reply_tokenへの返信が送られるまで待つ。タイムアウトした場合はFalseを返す"""
+        return self._event_for(reply_token).wait(timeout)
+
+    def _record(self, kind: str, to: str, messages):
+        if not isinstance(messages, (list, tuple)):
+            messages = [messages]
+        with self._lock:
+            self.sent.append((kind, to, list(messages)))
+
+    def _event_for(self, reply_token: str) -> threading.Event:
+        with self._lock:
+            return self._replied.setdefault(reply_token, threading.Event())
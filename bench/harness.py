@@ -0,0 +1,213 @@
+# bench/harness.py
+"""
+偽の外部サービスをつないだアプリに、署名付きのWebhookをASGI経由で直接送って計測するハーネス。
+ネットワークにもLINE・Google Cloudの認証情報にも依存しない。
+"""
+import asyncio
+import math
+import os
+import time
+
+from . import payloads
+from .fakes import CallCounter, FakeCachedContentBackend, FakeGenerativeModel, FakeGoogleMapsClient, FakeLineBotApi, Latency
+from .scenarios import AI_SCRIPT
+
+BENCH_CHANNEL_SECRET = "bench-channel-secret"
+
+
+def configure_environment():
+    """app.main を import する前に、本物のサービスに接続しないための環境変数を設定する"""
+    os.environ["LINE_CHANNEL_SECRET"] = BENCH_CHANNEL_SECRET
+    os.environ["LINE_CHANNEL_ACCESS_TOKEN"] = "bench-access-token"
+    # googlemaps.Client はキーの形式だけを検査するため、それらしい形式の偽キーを使う
+    os.environ["Maps_API_KEY"] = "AIzaBenchmarkFakeKey"
+    os.environ["GCP_PROJECT_ID"] = "bench-project"
+    os.environ["LOCAL_INDEX_PATH"] = ":memory:"
+    os.environ["AREA_CACHE_PATH"] = ""
+    # 計測対象はアプリの処理性能なので、レート制限はかけない（既に指定されていればそれに従う）
+    for name in ("RATE_LIMIT_GROUP_PER_MIN", "RATE_LIMIT_USER_PER_MIN", "RATE_LIMIT_GEMINI_PER_MIN", "RATE_LIMIT_PLACES_PER_MIN"):
+        os.environ.setdefault(name, "0")
+    # 計測中のログ出力を抑える（既に指定されていればそれに従う）
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+class BenchmarkApp:
+    """偽の外部サービスに差し替えたアプリ一式"""
+
+    def __init__(self, gemini_ms: float = 0, enrichment_ms: float = None, maps_ms: float = 0,
+                 details_ms: float = None, line_ms: float = 0, jitter_ratio: float = 0.2, seed: int = 0,
+                 context_cache: bool = False, progressive: bool = False):
+        configure_environment()
+        from app import main
+        from app.ai_agent import AIAgent, SYSTEM_PROMPT
+        from app.context_cache import ContextCache
+        from app.google_maps_actions import GoogleMapsActions
+        from app.line_actions import LineActions
+
+        def latency(ms):
+            return Latency(ms, ms * jitter_ratio, seed)
+
+        self.counter = CallCounter()
+        self.model = FakeGenerativeModel(
+            self.counter, latency(gemini_ms),
+            enrichment_latency=latency(gemini_ms if enrichment_ms is None else enrichment_ms),
+            script=AI_SCRIPT,
+        )
+        self.gmaps = FakeGoogleMapsClient(
+            self.counter, latency(maps_ms),
+            details_latency=latency(maps_ms if details_ms is None else details_ms),
+        )
+        self.line_bot_api = FakeLineBotApi(self.counter, latency(line_ms))
+
+        self.main = main
+        main.sessions.clear()
+        # コンテナのサービスを偽物に差し替える（本物のクライアントは作られない）
+        container = main.container
+        rate_limiter = container.rate_limiter
+        # RECORD_PATH が指定されていれば、偽の外部サービスとのやりとりも記録する（bench.replay の確認用）
+        recorder = container.recorder
+        model, gmaps, line_bot_api = self.model, self.gmaps, self.line_bot_api
+        cache_backend = FakeCachedContentBackend(self.model)
+        if recorder:
+            from app.recorder import RecordingCachedContentBackend
+            model, gmaps, line_bot_api = recorder.wrap("gemini", model), recorder.wrap("maps", gmaps), recorder.wrap("line", line_bot_api)
+            cache_backend = RecordingCachedContentBackend(cache_backend, recorder)
+            # 環境変数ではなく引数で指定した設定も、リプレイで同じになるよう記録する
+            recorder.write({"type": "meta", "config": {
+                "GEMINI_CONTEXT_CACHE_ENABLED": str(context_cache).lower(),
+                "PROGRESSIVE_CAROUSEL": str(progressive).lower(),
+            }})
+        actions = LineActions(line_bot_api, GoogleMapsActions(
+            model, "", gmaps_client=gmaps, rate_limiter=rate_limiter,
+            search_cache=container.search_cache), progressive_carousel=progressive)
+        cache = ContextCache(cache_backend, SYSTEM_PROMPT) if context_cache else None
+        container.override("gemini_model", model)
+        container.override("gmaps", gmaps)
+        container.override("line_bot_api", line_bot_api)
+        container.override("line_actions", actions)
+        container.override("ai_agent", AIAgent(model, actions, context_cache=cache, rate_limiter=rate_limiter))
+        self.app = main.app
+
+    async def post_webhook(self, body: bytes, signature: str = None) -> int:
+        """/webhook にリクエストを送り、HTTPステータスコードを返す"""
+        return await post_webhook(self.app, body, signature)
+
+
+async def post_webhook(app, body: bytes, signature: str = None) -> int:
+    """ASGIアプリの /webhook にリクエストを送り、HTTPステータスコードを返す"""
+    if signature is None:
+        signature = payloads.sign(body, BENCH_CHANNEL_SECRET)
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/webhook",
+        "raw_path": b"/webhook",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"x-line-signature", signature.encode("utf-8")),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    request_messages = [{"type": "http.request", "body": body, "more_body": False}]
+    status = {}
+
+    async def receive():
+        if request_messages:
+            return request_messages.pop(0)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    await app(scope, receive, send)
+    return status.get("code")
+
+
+def build_event(step) -> dict:
+    if step.kind == "join":
+        return payloads.join_event(step.group_id)
+    if step.kind == "postback":
+        return payloads.postback_event(step.text, step.user_id, step.group_id)
+    return payloads.text_message_event(step.text, step.user_id, step.group_id)
+
+
+def percentile(values: list, q: float) -> float:
+    """最近傍順位法によるパーセンタイル"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class BenchmarkResult:
+    def __init__(self):
+        self.latencies_ms = []
+        self.errors = 0
+        self.timeouts = 0
+        self.events = 0
+        self.elapsed_s = 0.0
+        self.call_counts = {}
+
+    def summary(self) -> dict:
+        return {
+            "events": self.events,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "elapsed_s": round(self.elapsed_s, 3),
+            "throughput_eps": round(self.events / self.elapsed_s, 2) if self.elapsed_s else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(self.latencies_ms, 50), 1),
+                "p95": round(percentile(self.latencies_ms, 95), 1),
+                "p99": round(percentile(self.latencies_ms, 99), 1),
+                "max": round(max(self.latencies_ms, default=0.0), 1),
+            },
+            "external_calls": dict(sorted(self.call_counts.items())),
+            "external_calls_per_event": {
+                name: round(count / self.events, 2) for name, count in sorted(self.call_counts.items())
+            } if self.events else {},
+        }
+
+
+async def run_conversations(bench: BenchmarkApp, conversations: list, concurrency: int,
+                            reply_timeout: float = 30.0) -> BenchmarkResult:
+    """
+    会話のリストを、最大concurrency件ずつ並行して再生する。
+    1つの会話の中では、前のイベントへの返信が届いてから次のイベントを送る。
+    レイテンシはWebhookの送信から、そのイベントへの返信(reply_message)が送られるまでの時間。
+    """
+    result = BenchmarkResult()
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    bench.counter.reset()
+
+    async def play(steps):
+        async with semaphore:
+            for step in steps:
+                event = build_event(step)
+                body = payloads.build_body([event])
+                started = time.perf_counter()
+                status = await bench.post_webhook(body)
+                result.events += 1
+                if status != 200:
+                    result.errors += 1
+                    continue
+                reply_token = event["replyToken"]
+                replied = await loop.run_in_executor(None, bench.line_bot_api.wait_for_reply, reply_token, reply_timeout)
+                if not replied:
+                    result.timeouts += 1
+                    continue
+                result.latencies_ms.append((bench.line_bot_api.reply_times[reply_token] - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(play(steps) for steps in conversations))
+    result.elapsed_s = time.perf_counter() - started
+    result.call_counts = bench.counter.snapshot()
+    return result
@@ -0,0 +1,364 @@
+# bench/load_generator.py
+"""
+署名付きのLINE Webhookを、起動中のアプリの /webhook に指定した到着レートで送り続ける負荷試験ツール。
+
+使い方:
+    # 偽の外部サービスでアプリを起動（本番と同じ設定のアプリに向けても良い）
+    python -m bench.fake_server --port 8000 --gemini-ms 800 --maps-ms 150
+
+    # 5, 10, 20, 40 events/s の順に30秒ずつ負荷をかける
+    python -m bench.load_generator --url http://localhost:8000/webhook \
+        --channel-secret bench-channel-secret --rates 5,10,20,40 --duration 30 --concurrency 64
+
+到着はポアソン過程（オープンループ）で、アプリが遅くなっても送信のペースは落とさない。
+レートごとに、スループット・レイテンシ・キュー待ち時間・エラー率を表示し、飽和したレートを報告する。
+アプリはイベントをキューに入れた時点で応答し、受け付けなかったイベントにも200を返すため、
+HTTPのレイテンシやエラー率だけでは飽和がわからない。そこでレートごとにアプリの /metrics から
+restaurant_agent_scheduler_queue_depth・restaurant_agent_scheduler_wait_seconds・
+restaurant_agent_scheduler_rejected_total を読み、処理が追いついているかも判定に使う。
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from . import payloads
+from .harness import percentile
+
+GROUP_TEXTS = ["新宿", "渋谷でディナー", "ランチ", "明日の12時で！", "来週の金曜19時", "東京駅の近くがいいな", "全員OKです"]
+QUEUE_DEPTH = "restaurant_agent_scheduler_queue_depth"
+WAIT_SECONDS = "restaurant_agent_scheduler_wait_seconds"
+REJECTED = "restaurant_agent_scheduler_rejected_total"
+_SAMPLE_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+INDIVIDUAL_TEXTS = ["和食がいいです", "予算は安めで", "個室があると嬉しい", "他のお店も見たい", "辛いものは苦手です", "お酒が飲めるお店"]
+
+
+class TrafficGenerator:
+    """多数のグループとユーザーからの、それらしいイベントの組み合わせを作る"""
+
+    # イベント種別ごとの割合
+    MIX = [
+        ("join", 0.02),
+        ("start", 0.05),
+        ("group_text", 0.28),
+        ("decide", 0.03),
+        ("individual_text", 0.62),
+    ]
+
+    def __init__(self, groups: int, members: int, seed: int = None):
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.groups = [f"Cloadgroup{i:05d}" for i in range(groups)]
+        self.members = {
+            group_id: [f"Uload{i:05d}m{j}" for j in range(members)]
+            for i, group_id in enumerate(self.groups)
+        }
+        self._kinds = [kind for kind, _ in self.MIX]
+        self._weights = [weight for _, weight in self.MIX]
+        # 「スタート」済みのグループ。実際の利用と同じく、グループでの会話はスタートから始める
+        self._started_groups = set()
+
+    def next_event(self) -> tuple:
+        """(イベント種別, Webhookのイベント) を返す"""
+        with self._lock:
+            kind = self._random.choices(self._kinds, self._weights)[0]
+            group_id = self._random.choice(self.groups)
+            user_id = self._random.choice(self.members[group_id])
+            group_text = self._random.choice(GROUP_TEXTS)
+            individual_text = self._random.choice(INDIVIDUAL_TEXTS)
+            if kind in ("group_text", "decide") and group_id not in self._started_groups:
+                kind = "start"
+            if kind == "start":
+                self._started_groups.add(group_id)
+
+        if kind == "join":
+            return kind, payloads.join_event(group_id)
+        if kind == "start":
+            return kind, payloads.text_message_event("スタート", user_id, group_id)
+        if kind == "group_text":
+            return kind, payloads.text_message_event(group_text, user_id, group_id)
+        if kind == "decide":
+            return kind, payloads.text_message_event("お店を決める！", user_id, group_id)
+        return kind, payloads.text_message_event(individual_text, user_id)
+
+
+class Sample:
+    __slots__ = ("kind", "status", "queue_wait", "latency", "total")
+
+    def __init__(self, kind, status, queue_wait, latency, total):
+        self.kind = kind
+        self.status = status          # HTTPステータス（通信エラーの場合はNone）
+        self.queue_wait = queue_wait  # 予定の送信時刻から、実際に送信を始めるまでの時間(s)
+        self.latency = latency        # 送信開始から応答までの時間(s)
+        self.total = total            # 予定の送信時刻から応答までの時間(s)
+
+
+def send_webhook(url: str, body: bytes, signature: str, kind: str, scheduled: float, timeout: float) -> Sample:
+    started = time.perf_counter()
+    request = urllib.request.Request(url, data=body, method="POST", headers={
+        "Content-Type": "application/json",
+        "X-Line-Signature": signature,
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = None
+    finished = time.perf_counter()
+    return Sample(kind, status, started - scheduled, finished - started, finished - scheduled)
+
+
+def fetch_metrics(url: str, timeout: float) -> list:
+    """/metrics を読み、(メトリクス名, ラベルの辞書, 値) のリストを返す。読めなかった場合はNone"""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            text = response.read().decode("utf-8")
+    except Exception:
+        return None
+    samples = []
+    for line in text.splitlines():
+        match = _SAMPLE_LINE.match(line.strip())
+        if match is None:
+            continue
+        name, labels, value = match.groups()
+        samples.append((name, dict(_LABEL.findall(labels or "")), float(value)))
+    return samples
+
+
+def _sum_samples(samples: list, name: str) -> float:
+    return sum(value for sample_name, _, value in samples if sample_name == name)
+
+
+def _wait_buckets(samples: list) -> dict:
+    """待ち時間のヒストグラムの、上限 -> 累積件数（全優先度の合計）"""
+    buckets = {}
+    for name, labels, value in samples:
+        if name == WAIT_SECONDS + "_bucket":
+            upper_bound = float(labels["le"])
+            buckets[upper_bound] = buckets.get(upper_bound, 0) + value
+    return buckets
+
+
+def _bucket_percentile(before: dict, after: dict, q: float) -> float:
+    """2回の読み取りの差分から、q パーセンタイルが入るバケットの上限を返す"""
+    counts = sorted((bound, count - before.get(bound, 0)) for bound, count in after.items())
+    if not counts or counts[-1][1] <= 0:
+        return 0.0
+    target = counts[-1][1] * q / 100
+    for bound, cumulative in counts:
+        if cumulative >= target:
+            return bound
+    return counts[-1][0]
+
+
+class QueueDepthSampler(threading.Thread):
+    """負荷をかけている間、/metrics の処理待ちの数を定期的に読み、最大値を記録する"""
+
+    def __init__(self, url: str, interval: float, timeout: float):
+        super().__init__(daemon=True)
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.max_depth = 0.0
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            samples = fetch_metrics(self.url, self.timeout)
+            if samples is not None:
+                self.max_depth = max(self.max_depth, _sum_samples(samples, QUEUE_DEPTH))
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def scheduler_stats(before: list, after: list, max_depth: float, elapsed: float) -> dict:
+    """負荷をかける前後の /metrics から、スケジューラの処理の状況を集計する"""
+    rejected = _sum_samples(after, REJECTED) - _sum_samples(before, REJECTED)
+    # 処理が始まったイベント数（受け付けなかったイベントへの返信を除く）
+    started = _sum_samples(after, WAIT_SECONDS + "_count") - _sum_samples(before, WAIT_SECONDS + "_count")
+    processed = max(started - rejected, 0)
+    before_buckets, after_buckets = _wait_buckets(before), _wait_buckets(after)
+    queue_depth = _sum_samples(after, QUEUE_DEPTH)
+    return {
+        "processed_throughput": round(processed / elapsed, 2) if elapsed else 0.0,
+        "rejected": int(rejected),
+        "queue_depth_end": int(queue_depth),
+        "queue_depth_max": int(max(max_depth, queue_depth)),
+        "wait_ms": {
+            "p50": round(_bucket_percentile(before_buckets, after_buckets, 50) * 1000, 1),
+            "p95": round(_bucket_percentile(before_buckets, after_buckets, 95) * 1000, 1),
+        },
+    }
+
+
+def run_rate(url: str, channel_secret: str, generator: TrafficGenerator, rate: float,
+             duration: float, concurrency: int, timeout: float, seed: int = None,
+             metrics_url: str = None) -> dict:
+    """1つの到着レートで duration 秒間負荷をかけ、その結果を集計する"""
+    arrivals = random.Random(seed)
+    futures = []
+    metrics_before = fetch_metrics(metrics_url, timeout) if metrics_url else None
+    sampler = None
+    if metrics_before is not None:
+        sampler = QueueDepthSampler(metrics_url, interval=0.5, timeout=timeout)
+        sampler.start()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        scheduled = started
+        while True:
+            scheduled += arrivals.expovariate(rate)
+            if scheduled - started > duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            kind, event = generator.next_event()
+            body = payloads.build_body([event])
+            futures.append(executor.submit(
+                send_webhook, url, body, payloads.sign(body, channel_secret), kind, scheduled, timeout))
+        samples = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+    if sampler is not None:
+        sampler.stop()
+    metrics_after = fetch_metrics(metrics_url, timeout) if metrics_before is not None else None
+
+    succeeded = [s for s in samples if s.status == 200]
+    errors = len(samples) - len(succeeded)
+
+    def ms(values, q):
+        return round(percentile(values, q) * 1000, 1)
+
+    latencies = [s.latency for s in succeeded]
+    queue_waits = [s.queue_wait for s in samples]
+    totals = [s.total for s in succeeded]
+    step = {
+        "offered_rate": rate,
+        "sent": len(samples),
+        # 実際に送れたレート。ポアソン到着は短い時間だと指定したレートからずれるため、判定にはこちらを使う
+        "sent_rate": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "throughput": round(len(succeeded) / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "latency_ms": {"p50": ms(latencies, 50), "p95": ms(latencies, 95), "p99": ms(latencies, 99)},
+        "queue_wait_ms": {"p50": ms(queue_waits, 50), "p95": ms(queue_waits, 95), "p99": ms(queue_waits, 99)},
+        "total_ms": {"p50": ms(totals, 50), "p95": ms(totals, 95), "p99": ms(totals, 99)},
+        "status_counts": _count_statuses(samples),
+        # /metrics を読めなかった場合はNone（HTTPの結果だけで判定する）
+        "scheduler": None,
+    }
+    if metrics_after is not None:
+        step["scheduler"] = scheduler_stats(metrics_before, metrics_after, sampler.max_depth, elapsed)
+    return step
+
+
+def _count_statuses(samples: list) -> dict:
+    counts = {}
+    for sample in samples:
+        key = str(sample.status) if sample.status is not None else "connection_error"
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def is_saturated(step: dict, max_error_rate: float, max_p95_ms: float, max_queue_seconds: float) -> bool:
+    """
+    処理が到着に追いつかない、エラーや受け付けなかったイベントが増える、
+    レイテンシやキューでの待ち時間が許容値を超える、または処理待ちが溜まり続けたら飽和とみなす
+    """
+    if (
+        step["throughput"] < step["sent_rate"] * 0.9
+        or step["error_rate"] > max_error_rate
+        or step["total_ms"]["p95"] > max_p95_ms
+    ):
+        return True
+    scheduler = step["scheduler"]
+    if scheduler is None:
+        return False
+    return (
+        scheduler["processed_throughput"] < step["sent_rate"] * 0.9
+        or (scheduler["rejected"] / step["sent"] if step["sent"] else 0.0) > max_error_rate
+        or scheduler["wait_ms"]["p95"] > max_p95_ms
+        # 到着 max_queue_seconds 秒分より多くのイベントが処理待ちのまま残った
+        or scheduler["queue_depth_end"] > step["sent_rate"] * max_queue_seconds
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="署名付きWebhookによる負荷試験")
+    parser.add_argument("--url", default="http://localhost:8000/webhook")
+    parser.add_argument("--channel-secret", default=os.getenv("LINE_CHANNEL_SECRET"),
+                        help="署名に使うチャネルシークレット（省略時は環境変数LINE_CHANNEL_SECRET）")
+    parser.add_argument("--rates", default="2,5,10,20", help="到着レート(events/s)のカンマ区切りリスト")
+    parser.add_argument("--duration", type=float, default=20, help="1つのレートで負荷をかける秒数")
+    parser.add_argument("--concurrency", type=int, default=32, help="同時に送信するリクエストの上限")
+    parser.add_argument("--groups", type=int, default=200, help="グループ数")
+    parser.add_argument("--members", type=int, default=4, help="1グループあたりのメンバー数")
+    parser.add_argument("--timeout", type=float, default=30, help="1リクエストのタイムアウト(s)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="飽和とみなすエラー率")
+    parser.add_argument("--max-p95-ms", type=float, default=5000, help="飽和とみなすp95レイテンシ・キューでの待ち時間(ms)")
+    parser.add_argument("--max-queue-seconds", type=float, default=5,
+                        help="レートの終わりに、到着この秒数分より多く処理待ちが残っていたら飽和とみなす")
+    parser.add_argument("--metrics-url", help="アプリの /metrics のURL（省略時は --url の /webhook を /metrics に置き換える）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="結果を保存するJSONファイルのパス")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.channel_secret:
+        raise SystemExit("--channel-secret か環境変数 LINE_CHANNEL_SECRET を指定してください。")
+
+    metrics_url = args.metrics_url or args.url.rsplit("/webhook", 1)[0] + "/metrics"
+    if fetch_metrics(metrics_url, args.timeout) is None:
+        print(f"{metrics_url} を読めないため、HTTPの結果だけで飽和を判定します。")
+        metrics_url = None
+
+    generator = TrafficGenerator(args.groups, args.members, seed=args.seed)
+    rates = [float(rate) for rate in args.rates.split(",")]
+    steps = []
+    saturation_rate = None
+
+    print(f"{'rate':>7} {'sent':>6} {'tput':>7} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'wait95':>8}"
+          f" {'proc':>7} {'rej':>5} {'qmax':>5} {'qend':>5} {'swait95':>8}")
+    for rate in rates:
+        step = run_rate(args.url, args.channel_secret, generator, rate, args.duration,
+                        args.concurrency, args.timeout, seed=args.seed, metrics_url=metrics_url)
+        steps.append(step)
+        total, wait = step["total_ms"], step["queue_wait_ms"]
+        line = (f"{rate:>7.1f} {step['sent']:>6} {step['throughput']:>7.2f} {step['error_rate'] * 100:>6.2f} "
+                f"{total['p50']:>8.1f} {total['p95']:>8.1f} {total['p99']:>8.1f} {wait['p95']:>8.1f}")
+        scheduler = step["scheduler"]
+        if scheduler is not None:
+            line += (f" {scheduler['processed_throughput']:>7.2f} {scheduler['rejected']:>5} "
+                     f"{scheduler['queue_depth_max']:>5} {scheduler['queue_depth_end']:>5} "
+                     f"{scheduler['wait_ms']['p95']:>8.1f}")
+        print(line)
+        if saturation_rate is None and is_saturated(step, args.max_error_rate, args.max_p95_ms,
+                                                    args.max_queue_seconds):
+            saturation_rate = rate
+
+    if saturation_rate is None:
+        print("指定したレートの範囲では飽和しませんでした。")
+    else:
+        print(f"飽和したレート: {saturation_rate} events/s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "steps": steps, "saturation_rate": saturation_rate},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# bench/memory_benchmark.py
+"""
+多数の同時セッションを保持した時のメモリ使用量を、tracemallocで計測する。
+以前の辞書とリストによる表現と、app.models の __slots__ を使ったモデルを比べる。
+
+使い方（リポジトリのルートで実行）:
+    python -m bench.memory_benchmark --sessions 5000 --members 4 --messages 3 --restaurants 6
+
+セッションごとに、メンバーの希望と、提案したお店のカード（Restaurant）を保持した状態を作り、
+1セッションあたりのメモリ、保存用にシリアライズした時のサイズ、
+プロンプトに埋め込む希望の文字列を作る時間を表示する。
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from app.models import Restaurant, Session
+
+GROUP_TEXTS = ["新宿", "明日の19時", "ディナーで", "4人です"]
+MEMBER_TEXTS = ["和食がいいです", "予算は5000円くらい", "個室があると嬉しい", "辛いものは苦手です", "お酒が飲めるお店"]
+
+
+def _message(texts: list, i: int) -> str:
+    # 同じ文字列オブジェクトを共有しないよう、毎回新しい文字列を作る
+    return f"{texts[i % len(texts)]}（{i}）"
+
+
+def _restaurant_fields(session_index: int, j: int) -> dict:
+    place_id = f"ChIJ{session_index:08d}{j:04d}xxxxxxxxxxxx"
+    return {
+        "place_id": place_id,
+        "tier": "lite",
+        "name": f"居酒屋 {session_index}-{j}",
+        "image_url": f"https://maps.googleapis.com/maps/api/place/photo?maxwidth=800&photoreference=ref{session_index}{j}",
+        "rating": 3.5 + (j % 15) / 10,
+        "user_rating_count": 100 + j,
+        "address": f"東京都新宿区西新宿{j}-{session_index}",
+        "genre": "居酒屋",
+        "url": f"https://www.google.com/maps/search/?api=1&query=Google&query_place_id={place_id}",
+        "review_good_summary": "「口コミを見る」で要約を表示します。",
+        "review_bad_summary": "-",
+    }
+
+
+def build_legacy(args) -> tuple:
+    """以前の表現（セッションは辞書、お店はキーが文字列の辞書でレビュー数も文字列）"""
+    sessions, restaurants = {}, {}
+    for i in range(args.sessions):
+        preferences = {"common": [_message(GROUP_TEXTS, i + k) for k in range(args.messages)]}
+        for m in range(args.members):
+            preferences[f"U{i:08d}{m:02d}"] = [_message(MEMBER_TEXTS, i + m + k) for k in range(args.messages)]
+        sessions[f"C{i:08d}"] = {"status": "hearing", "preferences": preferences}
+
+        cards = []
+        for j in range(args.restaurants):
+            fields = _restaurant_fields(i, j)
+            cards.append({
+                "place_id": fields["place_id"],
+                "tier": fields["tier"],
+                "name": fields["name"],
+                "image_url": fields["image_url"],
+                "rating": fields["rating"],
+                "userRatingCount": str(fields["user_rating_count"]),
+                "address": fields["address"],
+                "genre": fields["genre"],
+                "url": fields["url"],
+                "reviewGoodSummary": fields["review_good_summary"],
+                "reviewBadSummary": fields["review_bad_summary"],
+            })
+        restaurants[f"C{i:08d}"] = cards
+    return sessions, restaurants
+
+
+def build_models(args) -> tuple:
+    """app.models の表現"""
+    sessions, restaurants = {}, {}
+    for i in range(args.sessions):
+        session = Session()
+        for k in range(args.messages):
+            session.add_common(_message(GROUP_TEXTS, i + k))
+        for m in range(args.members):
+            for k in range(args.messages):
+                session.add_member_message(f"U{i:08d}{m:02d}", _message(MEMBER_TEXTS, i + m + k))
+        sessions[f"C{i:08d}"] = session
+        restaurants[f"C{i:08d}"] = [Restaurant(**_restaurant_fields(i, j)) for j in range(args.restaurants)]
+    return sessions, restaurants
+
+
+def measure(build, args) -> tuple:
+    """build が作ったデータが保持しているメモリ（バイト）と、作ったデータを返す"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        data = build(args)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return after - before, data
+
+
+def prompt_seconds(render, sessions: dict, rounds: int) -> float:
+    """すべてのセッションについて、プロンプトに埋め込む希望の文字列を rounds 回ずつ作る時間"""
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for session in sessions.values():
+            render(session)
+    return time.perf_counter() - started
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="多数の同時セッションを保持した時のメモリ使用量の計測")
+    parser.add_argument("--sessions", type=int, default=5000, help="同時に保持するセッション（グループ）の数")
+    parser.add_argument("--members", type=int, default=4, help="1セッションあたりのメンバー数")
+    parser.add_argument("--messages", type=int, default=3, help="1メンバーあたりの希望のメッセージ数")
+    parser.add_argument("--restaurants", type=int, default=6, help="1セッションあたりに保持するお店のカードの数")
+    parser.add_argument("--prompt-rounds", type=int, default=5, help="希望の文字列を作る回数（1セッションあたり）")
+    parser.add_argument("--json", help="結果を保存するJSONファイルのパス")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    legacy_bytes, (legacy_sessions, legacy_restaurants) = measure(build_legacy, args)
+    model_bytes, (model_sessions, model_restaurants) = measure(build_models, args)
+
+    legacy_serialized = sum(len(json.dumps(s, ensure_ascii=False).encode()) for s in legacy_sessions.values())
+    legacy_serialized += sum(len(json.dumps(r, ensure_ascii=False).encode()) for r in legacy_restaurants.values())
+    model_serialized = sum(len(s.dumps().encode()) for s in model_sessions.values())
+    model_serialized += sum(len(r.dumps().encode()) for cards in model_restaurants.values() for r in cards)
+
+    # 以前はメッセージのたびに、希望の辞書をf文字列で文字列に変換していた
+    legacy_prompt = prompt_seconds(lambda s: f"{s['preferences']}", legacy_sessions, args.prompt_rounds)
+    model_prompt = prompt_seconds(Session.preferences_text, model_sessions, args.prompt_rounds)
+
+    summary = {
+        "sessions": args.sessions,
+        "bytes_per_session": {
+            "legacy": round(legacy_bytes / args.sessions),
+            "models": round(model_bytes / args.sessions),
+        },
+        "total_mib": {
+            "legacy": round(legacy_bytes / 2**20, 2),
+            "models": round(model_bytes / 2**20, 2),
+        },
+        "serialized_bytes_per_session": {
+            "legacy": round(legacy_serialized / args.sessions),
+            "models": round(model_serialized / args.sessions),
+        },
+        "preferences_prompt_ms": {
+            "legacy": round(legacy_prompt * 1000, 1),
+            "models": round(model_prompt * 1000, 1),
+        },
+        "config": vars(args),
+    }
+
+    print("=== メモリベンチマーク結果 ===")
+    print(f"セッション数             : {args.sessions}（メンバー {args.members}人 / お店 {args.restaurants}件）")
+    for label, key, unit in (
+        ("1セッションあたりのメモリ", "bytes_per_session", "bytes"),
+        ("合計メモリ               ", "total_mib", "MiB"),
+        ("保存時のサイズ           ", "serialized_bytes_per_session", "bytes"),
+        ("希望の文字列の作成       ", "preferences_prompt_ms", "ms"),
+    ):
+        values = summary[key]
+        print(f"{label} : 以前={values['legacy']} {unit} / モデル={values['models']} {unit}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# bench/payloads.py
+"""LINEのWebhookと同じ形式のリクエストボディを作り、チャネルシークレットで署名する"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+import uuid
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _source(user_id: str, group_id: str = None) -> dict:
+    if group_id:
+        return {"type": "group", "groupId": group_id, "userId": user_id}
+    return {"type": "user", "userId": user_id}
+
+
+def _base_event(event_type: str, source: dict) -> dict:
+    return {
+        "type": event_type,
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": source,
+        "webhookEventId": _new_id(),
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": _new_id(),
+    }
+
+
+def join_event(group_id: str) -> dict:
+    """ボットがグループに招待された時のイベント"""
+    return _base_event("join", {"type": "group", "groupId": group_id})
+
+
+def text_message_event(text: str, user_id: str, group_id: str = None) -> dict:
+    """テキストメッセージのイベント。group_idを省略すると1対1チャットになる"""
+    event = _base_event("message", _source(user_id, group_id))
+    event["message"] = {"id": _new_id(), "type": "text", "quoteToken": _new_id(), "text": text}
+    return event
+
+
+def postback_event(data: str, user_id: str, group_id: str = None) -> dict:
+    """カードのボタンなどが押された時のイベント"""
+    event = _base_event("postback", _source(user_id, group_id))
+    event["postback"] = {"data": data}
+    return event
+
+
+def build_body(events: list, destination: str = "Ubench") -> bytes:
+    return json.dumps({"destination": destination, "events": events}, ensure_ascii=False).encode("utf-8")
+
+
+def sign(body: bytes, channel_secret: str) -> str:
+    """X-Line-Signatureヘッダーの値（HMAC-SHA256のBase64）を計算する"""
+    digest = hmac.new(channel_secret.encode("utf-8"), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
@@ -0,0 +1,224 @@
+# bench/replay.py
+"""
+RECORD_PATH で記録した本番の会話を、ネットワークなしで再生する（リプレイ）。
+
+使い方（リポジトリのルートで実行）:
+    # 本番（またはベンチマーク）で記録する
+    RECORD_PATH=recordings.jsonl uvicorn app.main:app
+    RECORD_PATH=recordings.jsonl python -m bench.run_benchmark --groups 2 --individuals 2
+
+    # 記録を再生し、LINEへ送ったメッセージと外部APIの呼び出し回数を記録と比べる
+    python -m bench.replay recordings.jsonl --json replay.json
+
+    # 別のバージョンで再生し、前回の結果と比べる
+    python -m bench.replay recordings.jsonl --baseline replay.json
+
+Webhookは記録した順に1件ずつ送り、そのイベントの処理が終わってから次を送る。
+Gemini・Places APIには記録した応答を返し、記録にないリクエストは「記録なし」として数える。
+記録時にエリアのキャッシュやローカルインデックスを使っていた場合は、
+--area-cache / --local-index にそのコピーを指定すると、記録時と同じ流れで処理される。
+差分があった場合は終了コード1で終わる。
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from itertools import zip_longest
+
+from .harness import configure_environment, percentile, post_webhook
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="記録した会話を、記録した外部APIの応答で再生する")
+    parser.add_argument("recording", help="RECORD_PATH で記録したJSON Linesファイル")
+    parser.add_argument("--area-cache", default="", help="エリアのキャッシュファイル（記録時のもののコピー）")
+    parser.add_argument("--local-index", default=":memory:", help="ローカルインデックスのファイル（記録時のもののコピー）")
+    parser.add_argument("--timeout", type=float, default=60.0, help="1イベントの処理を待つ最大の秒数")
+    parser.add_argument("--show-diffs", type=int, default=5, help="表示する差分の最大数")
+    parser.add_argument("--baseline", help="比べる前回のリプレイ結果（--json で保存したもの）")
+    parser.add_argument("--json", help="結果を保存するJSONファイルのパス")
+    return parser.parse_args()
+
+
+def configure_replay_environment(store, args):
+    """記録時の設定に合わせ、本物のサービスに接続しないための環境変数を設定する"""
+    from app.recorder import REDACTED, REPLAY_CONFIG_VARS
+    configure_environment()
+    os.environ.pop("RECORD_PATH", None)
+    # 記録ではAPIキーを置き換えているため、写真のURLなどが記録と同じになるよう同じ値にする
+    os.environ["Maps_API_KEY"] = REDACTED
+    os.environ["AREA_CACHE_PATH"] = args.area_cache
+    os.environ["LOCAL_INDEX_PATH"] = args.local_index
+    for name in REPLAY_CONFIG_VARS:
+        os.environ.pop(name, None)
+    os.environ.update(store.config)
+
+
+def group_by_target(outputs: list) -> dict:
+    """LINEへ送ったメッセージを、宛先（reply_token / ユーザーID）ごとに送った順にまとめる"""
+    grouped = {}
+    for output in outputs:
+        grouped.setdefault(output["to"], []).append(output)
+    return grouped
+
+
+def compare_outputs(recorded: list, replayed: list) -> tuple:
+    """宛先ごとに、記録と再生で送ったメッセージを順に比べ、(一致した数, 差分のリスト) を返す"""
+    recorded_by_target = group_by_target(recorded)
+    replayed_by_target = group_by_target(replayed)
+    matched, diffs = 0, []
+    for target in sorted(set(recorded_by_target) | set(replayed_by_target)):
+        pairs = zip_longest(recorded_by_target.get(target, []), replayed_by_target.get(target, []))
+        for index, (expected, actual) in enumerate(pairs):
+            if expected == actual:
+                matched += 1
+            else:
+                diffs.append({"to": target, "index": index, "recorded": expected, "replayed": actual})
+    return matched, diffs
+
+
+def output_digest(outputs: list) -> str:
+    """送ったメッセージのハッシュ（イベントの処理順が前後しても、宛先ごとの内容が同じなら同じ値）"""
+    text = json.dumps(group_by_target(outputs), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+async def replay_webhooks(app, scheduler, webhooks: list, timeout: float) -> tuple:
+    """Webhookを1件ずつ送り、処理が終わるまで待つ。(処理時間(ms)のリスト, タイムアウト数, エラー数) を返す"""
+    loop = asyncio.get_running_loop()
+    durations_ms, timeouts, errors = [], 0, 0
+    for body in webhooks:
+        started = time.perf_counter()
+        status = await post_webhook(app, body.encode("utf-8"))
+        if status != 200:
+            errors += 1
+            continue
+        if not await loop.run_in_executor(None, scheduler.wait_idle, timeout):
+            timeouts += 1
+            continue
+        durations_ms.append((time.perf_counter() - started) * 1000)
+    return durations_ms, timeouts, errors
+
+
+def run_replay(args) -> dict:
+    from app.recorder import (
+        ReplayCachedContentBackend, ReplayGenerativeModel, ReplayLineBotApi, ReplayMapsClient, ReplayStore,
+        load_records,
+    )
+    store = ReplayStore(load_records(args.recording))
+    configure_replay_environment(store, args)
+
+    from app import main
+    from app.ai_agent import SYSTEM_PROMPT
+    from app.context_cache import ContextCache
+
+    container = main.container
+    model = ReplayGenerativeModel(store)
+    line_bot_api = ReplayLineBotApi(store)
+    container.override("recorder", None)
+    container.override("gemini_model", model)
+    container.override("gmaps", ReplayMapsClient(store))
+    container.override("line_bot_api", line_bot_api)
+    context_cache_enabled = os.getenv("GEMINI_CONTEXT_CACHE_ENABLED", "false").lower() == "true"
+    container.override(
+        "context_cache",
+        ContextCache(ReplayCachedContentBackend(model), SYSTEM_PROMPT) if context_cache_enabled else None,
+    )
+
+    started = time.perf_counter()
+    durations_ms, timeouts, errors = asyncio.run(
+        replay_webhooks(main.app, container.scheduler, store.webhooks, args.timeout))
+    elapsed = time.perf_counter() - started
+
+    matched, diffs = compare_outputs(store.recorded_outputs, line_bot_api.outputs)
+    return {
+        "events": len(store.webhooks),
+        "errors": errors,
+        "timeouts": timeouts,
+        "elapsed_s": round(elapsed, 3),
+        "latency_ms": {
+            "p50": round(percentile(durations_ms, 50), 1),
+            "p95": round(percentile(durations_ms, 95), 1),
+            "max": round(max(durations_ms, default=0.0), 1),
+        },
+        "outputs": {
+            "recorded": len(store.recorded_outputs),
+            "replayed": len(line_bot_api.outputs),
+            "matched": matched,
+            "mismatched": len(diffs),
+        },
+        "output_digest": output_digest(line_bot_api.outputs),
+        "external_calls": {
+            "recorded": dict(sorted(store.recorded_calls.items())),
+            "replayed": dict(sorted(store.calls.items())),
+        },
+        "approximate": dict(sorted(store.approximate.items())),
+        "misses": dict(sorted(store.misses.items())),
+        "diffs": diffs,
+    }
+
+
+def compare_with_baseline(summary: dict, baseline: dict) -> list:
+    """前回のリプレイ結果と比べ、違いの説明のリストを返す"""
+    differences = []
+    if summary["output_digest"] != baseline.get("output_digest"):
+        differences.append("LINEへ送ったメッセージが前回と異なります")
+    previous_calls = baseline.get("external_calls", {}).get("replayed", {})
+    current_calls = summary["external_calls"]["replayed"]
+    for name in sorted(set(previous_calls) | set(current_calls)):
+        if previous_calls.get(name, 0) != current_calls.get(name, 0):
+            differences.append(f"{name} の呼び出し回数: {previous_calls.get(name, 0)} → {current_calls.get(name, 0)}")
+    return differences
+
+
+def print_summary(summary: dict, show_diffs: int):
+    latency = summary["latency_ms"]
+    outputs = summary["outputs"]
+    print("=== リプレイ結果 ===")
+    print(f"イベント数       : {summary['events']}（エラー {summary['errors']} / タイムアウト {summary['timeouts']}）")
+    print(f"所要時間         : {summary['elapsed_s']} s")
+    print(f"処理時間(ms)     : p50={latency['p50']} p95={latency['p95']} max={latency['max']}")
+    print(f"LINEへの送信     : 記録 {outputs['recorded']} / 再生 {outputs['replayed']}"
+          f"（一致 {outputs['matched']} / 不一致 {outputs['mismatched']}）")
+    print("外部API呼び出し  :（記録 → 再生）")
+    recorded, replayed = summary["external_calls"]["recorded"], summary["external_calls"]["replayed"]
+    for name in sorted(set(recorded) | set(replayed)):
+        print(f"  {name:<28} {recorded.get(name, 0):>6} → {replayed.get(name, 0):<6}")
+    if summary["approximate"]:
+        print("近似一致（同じイベントの、プロンプトが異なる呼び出し）:")
+        for name, count in summary["approximate"].items():
+            print(f"  {name:<28} {count:>6}")
+    if summary["misses"]:
+        print("記録になかったリクエスト:")
+        for name, count in summary["misses"].items():
+            print(f"  {name:<28} {count:>6}")
+    for diff in summary["diffs"][:show_diffs]:
+        print(f"--- 差分: 宛先 {diff['to']} の {diff['index'] + 1}件目")
+        print(f"  記録: {json.dumps(diff['recorded'], ensure_ascii=False)[:300]}")
+        print(f"  再生: {json.dumps(diff['replayed'], ensure_ascii=False)[:300]}")
+
+
+def main():
+    args = parse_args()
+    summary = run_replay(args)
+    print_summary(summary, args.show_diffs)
+
+    failed = bool(summary["diffs"] or summary["misses"] or summary["timeouts"] or summary["errors"])
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            differences = compare_with_baseline(summary, json.load(f))
+        print("前回との比較     :" + ("".join(f"\n  {d}" for d in differences) if differences else " 差分なし"))
+        failed = failed or bool(differences)
+
+    if args.json:
+        summary["config"] = vars(args)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
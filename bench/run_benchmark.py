@@ -0,0 +1,93 @@
+# bench/run_benchmark.py
+"""
+外部サービスを偽物に差し替えて、/webhook → AIAgent → GoogleMapsActions → LineActions の性能を計測する。
+
+使い方（リポジトリのルートで実行）:
+    python -m bench.run_benchmark --groups 20 --individuals 20 --concurrency 8 \
+        --gemini-ms 800 --maps-ms 150 --line-ms 50
+
+結果はp50/p95/p99のレイテンシ、スループット、外部APIの呼び出し回数を表示する。
+--json を指定すると、比較しやすいようにJSONファイルにも保存する。
+"""
+import argparse
+import asyncio
+import json
+
+from .harness import BenchmarkApp, run_conversations
+from .scenarios import group_conversation, individual_conversation
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="偽の外部サービスを使ったエンドツーエンドのベンチマーク")
+    parser.add_argument("--groups", type=int, default=10, help="再生するグループ会話の数")
+    parser.add_argument("--members", type=int, default=3, help="1グループあたりのメンバー数")
+    parser.add_argument("--individuals", type=int, default=10, help="再生する1対1だけの会話の数")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時に進める会話の数")
+    parser.add_argument("--gemini-ms", type=float, default=0, help="Geminiのチャット応答の遅延(ms)")
+    parser.add_argument("--enrichment-ms", type=float, default=None, help="口コミ要約・ジャンル推定の遅延(ms)。省略時は--gemini-ms")
+    parser.add_argument("--maps-ms", type=float, default=0, help="Places検索の遅延(ms)")
+    parser.add_argument("--details-ms", type=float, default=None, help="Place詳細取得の遅延(ms)。省略時は--maps-ms")
+    parser.add_argument("--line-ms", type=float, default=0, help="LINE APIの遅延(ms)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="遅延のばらつき（遅延に対する割合）")
+    parser.add_argument("--context-cache", action="store_true", help="システムプロンプトとツールの定義をコンテキストキャッシュから読む")
+    parser.add_argument("--progressive", action="store_true",
+                        help="候補のカルーセルを返信した後、口コミの要約入りのカードをプッシュで送り直す")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="結果を保存するJSONファイルのパス")
+    return parser.parse_args()
+
+
+def print_summary(summary: dict):
+    latency = summary["latency_ms"]
+    print("=== ベンチマーク結果 ===")
+    print(f"イベント数       : {summary['events']}（エラー {summary['errors']} / タイムアウト {summary['timeouts']}）")
+    print(f"所要時間         : {summary['elapsed_s']} s")
+    print(f"スループット     : {summary['throughput_eps']} events/s")
+    print(f"レイテンシ(ms)   : p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} max={latency['max']}")
+    print("外部API呼び出し  :")
+    for name, count in summary["external_calls"].items():
+        per_event = summary["external_calls_per_event"][name]
+        print(f"  {name:<28} {count:>6}（{per_event}/event）")
+    tokens = summary["gemini_chat_tokens"]
+    print(f"Geminiトークン   : prompt={tokens['prompt']} response={tokens['response']} "
+          f"cached={tokens['cached']}（キャッシュから読んだ入力トークン）")
+
+
+def gemini_chat_tokens() -> dict:
+    """会話（システムプロンプトの送信を含む）で消費したGeminiのトークン数を、種類ごとに合計する"""
+    from app.metrics import GEMINI_TOKENS
+    return {
+        kind: int(sum(GEMINI_TOKENS.get(purpose=purpose, kind=kind) for purpose in ("system_prompt", "chat")))
+        for kind in ("prompt", "response", "cached")
+    }
+
+
+def main():
+    args = parse_args()
+    bench = BenchmarkApp(
+        gemini_ms=args.gemini_ms,
+        enrichment_ms=args.enrichment_ms,
+        maps_ms=args.maps_ms,
+        details_ms=args.details_ms,
+        line_ms=args.line_ms,
+        jitter_ratio=args.jitter,
+        seed=args.seed,
+        context_cache=args.context_cache,
+        progressive=args.progressive,
+    )
+    conversations = [group_conversation(i, args.members) for i in range(args.groups)]
+    conversations += [individual_conversation(i) for i in range(args.individuals)]
+
+    result = asyncio.run(run_conversations(bench, conversations, args.concurrency))
+    summary = result.summary()
+    summary["gemini_chat_tokens"] = gemini_chat_tokens()
+    summary["config"] = vars(args)
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
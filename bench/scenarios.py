@@ -0,0 +1,67 @@
+# bench/scenarios.py
+"""ベンチマークで再生する会話のシナリオ"""
+from dataclasses import dataclass
+
+from .fakes import function_call, text_reply
+
+
+@dataclass
+class Step:
+    """会話の1ステップ（Webhookで届く1イベント）"""
+    kind: str              # "join" / "text" / "postback"
+    user_id: str = None
+    group_id: str = None   # Noneの場合は1対1チャット
+    text: str = None       # kindが"text"の場合はメッセージ本文、"postback"の場合はdata
+
+
+# シナリオ中のメッセージに対して、AIがどう応答するか（FakeGenerativeModelのscript）
+AI_SCRIPT = {
+    "スタート": text_reply("エリアはどこにしますか？"),
+    "新宿": text_reply("ランチとディナー、どちらにしますか？"),
+    "ランチ": text_reply("日時はいつにしますか？"),
+    "明日の12時で！": function_call("start_individual_hearing"),
+    "和食がいいです": function_call("search_restaurants", query="新宿 和食"),
+    "予算は安めで": function_call("search_restaurants", query="新宿 和食", max_price=2),
+    "個室があると嬉しい": function_call(
+        "reply_with_quick_reply", question="個室の希望はどのくらいですか？", choices=["必須", "できれば", "不要"]),
+    "他のお店も見たい": function_call("show_more_restaurants"),
+    "お店を決める！": function_call("final_restaurant", query="新宿 和食", max_price=2),
+}
+
+
+def group_conversation(index: int, members: int = 3) -> list:
+    """
+    1グループ分の会話。
+    グループへの招待 → グループヒアリング → 各メンバーの個別ヒアリング → 最終決定 の順に進む。
+    """
+    group_id = f"Cbenchgroup{index:04d}"
+    users = [f"Ubench{index:04d}m{i}" for i in range(members)]
+    organizer = users[0]
+
+    steps = [
+        Step("join", group_id=group_id),
+        Step("text", organizer, group_id, "スタート"),
+        Step("text", users[1 % members], group_id, "新宿"),
+        Step("text", users[2 % members], group_id, "ランチ"),
+        Step("text", organizer, group_id, "明日の12時で！"),
+    ]
+    individual_messages = ["和食がいいです", "予算は安めで", "個室があると嬉しい"]
+    for i, user_id in enumerate(users):
+        steps.append(Step("text", user_id, text=individual_messages[i % len(individual_messages)]))
+    steps += [
+        Step("text", users[1 % members], text="他のお店も見たい"),
+        Step("postback", users[1 % members], text="action=more"),
+        Step("text", organizer, group_id, "お店を決める！"),
+    ]
+    return steps
+
+
+def individual_conversation(index: int) -> list:
+    """グループを経由せず、1対1チャットだけで何度も検索する会話"""
+    user_id = f"Ubenchsolo{index:04d}"
+    return [
+        Step("text", user_id, text="和食がいいです"),
+        Step("text", user_id, text="他のお店も見たい"),
+        Step("postback", user_id, text="action=more"),
+        Step("text", user_id, text="予算は安めで"),
+    ]
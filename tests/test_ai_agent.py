@@ -0,0 +1,45 @@
+# tests/test_ai_agent.py
+from app.ai_agent import SYSTEM_PROMPT, AIAgent
+from app.context_cache import ContextCache
+from app.rate_limiter import RateLimiter
+from bench.fakes import CallCounter, FakeCachedContentBackend, FakeGenerativeModel
+
+
+class Content:
+    """vertexaiのContentのうち、会話履歴として使う属性だけを持つもの"""
+
+    def __init__(self, role, text):
+        self.role = role
+        self.parts = [type("Part", (), {"text": text})()]
+
+
+def test_recreated_chat_does_not_repeat_system_prompt():
+    counter = CallCounter()
+    model = FakeGenerativeModel(counter)
+    backend = FakeCachedContentBackend(model)
+    cache = ContextCache(backend, SYSTEM_PROMPT)
+    agent = AIAgent(model, line_actions=None, context_cache=cache)
+
+    # キャッシュが使えない間に作ったチャットは、履歴の先頭にシステムプロンプトを持つ
+    chat = model.start_chat()
+    chat.history = [
+        Content("user", SYSTEM_PROMPT), Content("model", "承知しました。"),
+        Content("user", "新宿でランチ"), Content("model", "ジャンルは？"),
+    ]
+    agent.chat_sessions["U1"] = chat
+    agent.chat_generations["U1"] = None
+
+    # キャッシュが作られると、システムプロンプトを除いた履歴でチャットを作り直す
+    recreated = agent._get_or_create_chat_session("U1")
+    assert recreated is not chat
+    assert [(c.role, c.parts[0].text) for c in recreated.history] == [("user", "新宿でランチ"), ("model", "ジャンルは？")]
+    assert agent.chat_generations["U1"] == 1
+
+
+def test_individual_chat_is_limited_per_user_only(clock, monkeypatch):
+    monkeypatch.setattr("app.rate_limiter.time", clock)
+    agent = AIAgent(FakeGenerativeModel(CallCounter()), line_actions=None,
+                    rate_limiter=RateLimiter({"group": 1, "user": 3, "gemini": 100}))
+    # 1対1チャットはグループの回数を使わない
+    assert all(agent._acquire_rate_limit("token", "U1") for _ in range(3))
+    assert agent._acquire_rate_limit("token", "U2", "G1")
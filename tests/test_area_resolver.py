@@ -0,0 +1,114 @@
+# tests/test_area_resolver.py
+import json
+
+import pytest
+
+from app import area_resolver
+from app.area_resolver import AreaResolver, looks_like_place
+
+
+class FakeGeocoder:
+    """指定した言葉だけを駅として返し、呼ばれた言葉を記録するジオコーダー"""
+
+    def __init__(self, areas=()):
+        self.areas = set(areas)
+        self.calls = []
+
+    def geocode(self, address, **kwargs):
+        self.calls.append(address)
+        if address not in self.areas:
+            return []
+        return [{
+            "types": ["train_station"],
+            "geometry": {"location": {"lat": 35.64, "lng": 139.67}},
+        }]
+
+
+@pytest.mark.parametrize("keyword, expected", [
+    ("三軒茶屋", True),
+    ("下北沢駅", True),
+    ("和食", False),
+    ("イタリアン", False),
+    ("個室", False),
+    ("5000円", False),
+])
+def test_looks_like_place(keyword, expected):
+    assert looks_like_place(keyword) is expected
+
+
+@pytest.mark.parametrize("query, area, remaining", [
+    ("新宿 ランチ", "新宿", "ランチ"),
+    ("新宿でランチ", "新宿", "ランチ"),
+    ("丸の内のカフェ", "丸の内", "カフェ"),
+    ("新宿駅周辺でラーメン", "新宿駅", "ラーメン"),
+    ("渋谷イタリアン", "渋谷", "イタリアン"),
+    ("新宿和食 個室", "新宿", "和食 個室"),
+])
+def test_resolves_known_areas_without_geocoding(query, area, remaining):
+    gmaps = FakeGeocoder()
+    resolved = AreaResolver(gmaps).resolve(query)
+    assert resolved[0] == area
+    assert resolved[3] == remaining
+    assert gmaps.calls == []
+
+
+def test_geocodes_area_written_before_a_particle():
+    gmaps = FakeGeocoder({"三軒茶屋"})
+    resolved = AreaResolver(gmaps).resolve("三軒茶屋でランチ")
+    assert gmaps.calls == ["三軒茶屋"]
+    assert resolved[0] == "三軒茶屋"
+    assert resolved[3] == "ランチ"
+
+
+def test_does_not_geocode_genre_words():
+    gmaps = FakeGeocoder()
+    resolver = AreaResolver(gmaps)
+    assert resolver.resolve("和食 個室") is None
+    assert resolver.resolve("おでん") is None
+    assert gmaps.calls == []
+
+
+def test_skips_geocoding_when_rate_limited():
+    gmaps = FakeGeocoder({"三軒茶屋"})
+    assert AreaResolver(gmaps, acquire=lambda: False).resolve("三軒茶屋") is None
+    assert gmaps.calls == []
+
+
+def test_remembers_misses_only_for_a_while(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr("app.search_cache.time", clock)
+    cache_path = tmp_path / "areas.json"
+    gmaps = FakeGeocoder()
+    resolver = AreaResolver(gmaps, str(cache_path))
+
+    assert resolver.resolve("不明地") is None
+    assert resolver.resolve("不明地") is None
+    assert gmaps.calls == ["不明地"]
+    # エリアではない言葉はファイルに保存しない
+    assert not cache_path.exists()
+
+    clock.advance(area_resolver.NEGATIVE_TTL_SECONDS)
+    assert resolver.resolve("不明地") is None
+    assert gmaps.calls == ["不明地", "不明地"]
+
+
+def test_persists_geocoded_areas(tmp_path):
+    cache_path = tmp_path / "areas.json"
+    AreaResolver(FakeGeocoder({"三軒茶屋"}), str(cache_path)).resolve("三軒茶屋")
+
+    gmaps = FakeGeocoder()
+    resolved = AreaResolver(gmaps, str(cache_path)).resolve("三軒茶屋 カフェ")
+    assert resolved[0] == "三軒茶屋"
+    assert gmaps.calls == []
+
+
+def test_ignores_corrupt_and_legacy_negative_cache(tmp_path):
+    corrupt = tmp_path / "corrupt.json"
+    corrupt.write_text("{not json", encoding="utf-8")
+    assert AreaResolver(FakeGeocoder(), str(corrupt)).resolve("新宿")[0] == "新宿"
+
+    # 以前の形式で保存された None は読み込まず、期限付きで判断し直す
+    legacy = tmp_path / "legacy.json"
+    legacy.write_text(json.dumps({"三軒茶屋": None}), encoding="utf-8")
+    gmaps = FakeGeocoder({"三軒茶屋"})
+    assert AreaResolver(gmaps, str(legacy)).resolve("三軒茶屋")[0] == "三軒茶屋"
+    assert gmaps.calls == ["三軒茶屋"]
@@ -0,0 +1,125 @@
+# tests/test_context_cache.py
+import threading
+
+import pytest
+
+from app import context_cache
+from app.context_cache import RETRY_INTERVAL_SECONDS, ContextCache
+from bench.fakes import CallCounter, FakeCachedContentBackend, FakeGenerativeModel
+
+
+class FailingBackend(FakeCachedContentBackend):
+    """延長・作成を失敗させられる FakeCachedContentBackend"""
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.fail_create = False
+        self.fail_extend = False
+
+    def create(self, system_instruction, ttl):
+        if self.fail_create:
+            self.model.counter.add("gemini.create_cached_content")
+            raise RuntimeError("cached content is too small")
+        return super().create(system_instruction, ttl)
+
+    def extend(self, cached_content, ttl):
+        if self.fail_extend:
+            raise RuntimeError("cached content not found")
+        super().extend(cached_content, ttl)
+
+
+@pytest.fixture
+def counter():
+    return CallCounter()
+
+
+@pytest.fixture
+def backend(counter):
+    return FailingBackend(FakeGenerativeModel(counter))
+
+
+@pytest.fixture
+def cache(backend, clock, monkeypatch):
+    monkeypatch.setattr(context_cache, "time", clock)
+    return ContextCache(backend, "システムプロンプト", ttl_seconds=3600, refresh_margin_seconds=300)
+
+
+def test_reuses_model_until_refresh_margin(cache, counter, clock):
+    model, generation = cache.get_model()
+    clock.advance(3000)
+    assert cache.get_model() == (model, generation)
+    assert generation == 1
+    assert counter.snapshot() == {"gemini.create_cached_content": 1}
+
+
+def test_extends_near_expiry_without_new_generation(cache, counter, clock):
+    model, _ = cache.get_model()
+    clock.advance(3400)
+    assert cache.get_model() == (model, 1)
+    assert counter.snapshot()["gemini.update_cached_content"] == 1
+
+    # 延長した時点から ttl_seconds は使える
+    clock.advance(3000)
+    assert cache.get_model() == (model, 1)
+    assert counter.snapshot() == {"gemini.create_cached_content": 1, "gemini.update_cached_content": 1}
+
+
+def test_recreates_after_expiry(cache, counter, clock):
+    cache.get_model()
+    clock.advance(3601)
+    _, generation = cache.get_model()
+    assert generation == 2
+    assert counter.snapshot() == {"gemini.create_cached_content": 2}
+
+
+def test_recreates_when_extend_fails(cache, backend, counter, clock):
+    cache.get_model()
+    backend.fail_extend = True
+    clock.advance(3400)
+    _, generation = cache.get_model()
+    assert generation == 2
+    assert counter.snapshot() == {"gemini.create_cached_content": 2}
+
+
+def test_falls_back_and_retries_after_interval(cache, backend, counter, clock):
+    backend.fail_create = True
+    assert cache.get_model() is None
+
+    # 失敗した直後は、作成を試みずにキャッシュなしで処理させる
+    clock.advance(RETRY_INTERVAL_SECONDS - 1)
+    assert cache.get_model() is None
+    assert counter.snapshot() == {"gemini.create_cached_content": 1}
+
+    # 再試行は別スレッドで行い、終わるまではキャッシュなしで処理させる
+    backend.fail_create = False
+    clock.advance(1)
+    assert cache.get_model() is None
+    cache._retry_thread.join()
+    model, generation = cache.get_model()
+    assert model.cached_content_token_count > 0
+    assert generation == 1
+
+
+def test_retry_does_not_block_callers(cache, backend, clock):
+    backend.fail_create = True
+    assert cache.get_model() is None
+    clock.advance(RETRY_INTERVAL_SECONDS)
+
+    started, release = threading.Event(), threading.Event()
+    create = backend.create
+
+    def slow_create(system_instruction, ttl):
+        started.set()
+        release.wait(5)
+        return create(system_instruction, ttl)
+
+    backend.fail_create = False
+    backend.create = slow_create
+    assert cache.get_model() is None
+    assert started.wait(5)
+    # 作成中も、ほかの呼び出しはロックを待たずにキャッシュなしで処理を続ける
+    assert cache.get_model() is None
+
+    release.set()
+    cache._retry_thread.join()
+    assert cache.get_model()[1] == 1
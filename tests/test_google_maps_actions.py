@@ -0,0 +1,100 @@
+# tests/test_google_maps_actions.py
+import pytest
+
+from app.google_maps_actions import TIER_FULL, TIER_LITE, GoogleMapsActions
+from app.rate_limiter import RateLimiter
+from app.search_cache import TTLCache
+from bench.fakes import CallCounter, FakeGenerativeModel, FakeGoogleMapsClient
+
+
+@pytest.fixture
+def counter():
+    return CallCounter()
+
+
+def make_actions(counter, **kwargs):
+    return GoogleMapsActions(
+        FakeGenerativeModel(counter), "", gmaps_client=FakeGoogleMapsClient(counter), area_cache_path="", **kwargs)
+
+
+def test_lite_tier_uses_search_results_only(counter):
+    actions = make_actions(counter)
+    restaurants = actions.search_and_format_restaurants("新宿 和食", max_results=3, tier=TIER_LITE)
+    assert [r.tier for r in restaurants] == [TIER_LITE] * 3
+    assert restaurants[0].genre == "レストラン"
+    assert counter.snapshot() == {"maps.places_nearby": 1}
+
+
+def test_full_tier_enriches_once_per_place(counter):
+    actions = make_actions(counter)
+    full = actions.search_and_format_restaurants("新宿 和食", max_results=2, tier=TIER_FULL)
+    assert [r.tier for r in full] == [TIER_FULL] * 2
+    assert full[0].genre == "和食"
+    # 口コミ要約とジャンル推定を1店舗につき1回ずつ
+    assert counter.snapshot() == {"maps.places_nearby": 1, "maps.place": 2, "gemini.generate_content": 4}
+
+    # AI分析済みのお店は、liteカードでも要約を表示する
+    lite = actions.search_and_format_restaurants("新宿 和食", max_results=2, tier=TIER_LITE)
+    assert [r.review_good_summary for r in lite] == [r.review_good_summary for r in full]
+    assert all(actions.has_enrichment(r.place_id) for r in lite)
+
+
+def test_skips_results_without_place_id(counter):
+    actions = make_actions(counter)
+    places = [{"name": "place_idなし"}, {"place_id": "p1", "name": "和食処", "types": ["restaurant"]}]
+    assert [r.place_id for r in actions._format_places(places, TIER_LITE)] == ["p1"]
+
+
+def test_rate_limited_enrichment_keeps_genre_from_types(counter):
+    actions = make_actions(counter, rate_limiter=RateLimiter({"gemini": 1}))
+    restaurants = actions.search_and_format_restaurants("新宿 和食", max_results=1, tier=TIER_FULL)
+    assert restaurants[0].tier == TIER_FULL
+    assert restaurants[0].genre == "レストラン"
+    assert "混み合っている" in restaurants[0].review_good_summary
+    assert "gemini.generate_content" not in counter.snapshot()
+    # 省略したAI分析はキャッシュしない
+    assert not actions.has_enrichment(restaurants[0].place_id)
+
+
+def test_place_caches_are_bounded():
+    cache = TTLCache(ttl_seconds=60, max_entries=2)
+    for place_id in ("p1", "p2", "p3"):
+        cache.put(place_id, {"place_id": place_id})
+    cache.get("p2")
+    cache.put("p4", {"place_id": "p4"})
+    assert len(cache) == 2
+    assert "p1" not in cache and "p3" not in cache
+    assert cache.get("p2") == {"place_id": "p2"}
+
+
+def test_ttl_cache_expires(clock, monkeypatch):
+    from app import search_cache
+    monkeypatch.setattr(search_cache, "time", clock)
+    cache = TTLCache(ttl_seconds=60, max_entries=10)
+    cache.put("p1", "value")
+    clock.advance(59)
+    assert cache.get("p1") == "value"
+    clock.advance(1)
+    assert cache.get("p1", {}) == {}
+    assert len(cache) == 0
+
+
+def test_rephrased_search_hits_cache_and_resumes_with_a_new_search(counter):
+    from app.search_cache import SearchResultCache
+    actions = make_actions(counter, search_cache=SearchResultCache())
+    first = actions.search_and_format_restaurants("新宿 和食", max_results=3, session_id="U1")
+    cached = actions.search_and_format_restaurants("和食 新宿", max_results=3, session_id="U2")
+    assert [r.place_id for r in cached] == [r.place_id for r in first]
+    assert counter.snapshot() == {"maps.places_nearby": 1}
+
+    # キャッシュした1ページ目を使い切るまでは、APIを呼ばない
+    shown = {r.place_id for r in cached}
+    for _ in range(5):
+        shown.update(r.place_id for r in actions.show_more_restaurants("U2", max_results=3))
+    assert len(shown) == FakeGoogleMapsClient.PAGE_SIZE - 2
+    assert counter.snapshot() == {"maps.places_nearby": 1}
+
+    # 続きは検索し直して、新しいnext_page_tokenで取得する
+    more = actions.show_more_restaurants("U2", max_results=5)
+    assert len(more) == 5 and not shown & {r.place_id for r in more}
+    assert counter.snapshot() == {"maps.places_nearby": 3}
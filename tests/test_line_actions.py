@@ -0,0 +1,29 @@
+# tests/test_line_actions.py
+from app.google_maps_actions import GoogleMapsActions
+from app.line_actions import LineActions
+from bench.fakes import CallCounter, FakeGenerativeModel, FakeGoogleMapsClient, FakeLineBotApi
+
+
+def make_line_actions(counter, **kwargs):
+    gmaps_actions = GoogleMapsActions(
+        FakeGenerativeModel(counter), "", gmaps_client=FakeGoogleMapsClient(counter), area_cache_path="")
+    return LineActions(FakeLineBotApi(counter), gmaps_actions, **kwargs)
+
+
+def test_progressive_carousel_enriches_only_leading_cards():
+    counter = CallCounter()
+    actions = make_line_actions(counter, progressive_carousel=True, progressive_enrich_limit=1)
+    actions.search_restaurants("reply-token", "新宿 和食", session_id="U1")
+
+    # 3枚のカードのうち、先頭の1枚だけPlace Detailsと口コミ要約を取得する
+    assert counter.snapshot()["maps.place"] == 1
+    assert counter.snapshot()["line.push_message"] == 1
+    assert [kind for kind, _, _ in actions.line_bot_api.sent] == ["reply", "push"]
+
+
+def test_carousel_is_not_enriched_by_default():
+    counter = CallCounter()
+    actions = make_line_actions(counter)
+    actions.search_restaurants("reply-token", "新宿 和食", session_id="U1")
+    assert "maps.place" not in counter.snapshot()
+    assert "line.push_message" not in counter.snapshot()
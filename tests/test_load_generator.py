@@ -0,0 +1,65 @@
+# tests/test_load_generator.py
+from bench.load_generator import _bucket_percentile, _wait_buckets, is_saturated, scheduler_stats
+
+METRICS_BEFORE = [
+    ("restaurant_agent_scheduler_queue_depth", {"priority": "group"}, 0.0),
+    ("restaurant_agent_scheduler_rejected_total", {"priority": "group"}, 2.0),
+    ("restaurant_agent_scheduler_wait_seconds_bucket", {"priority": "group", "le": "0.01"}, 10.0),
+    ("restaurant_agent_scheduler_wait_seconds_bucket", {"priority": "group", "le": "1"}, 10.0),
+    ("restaurant_agent_scheduler_wait_seconds_bucket", {"priority": "group", "le": "+Inf"}, 10.0),
+    ("restaurant_agent_scheduler_wait_seconds_count", {"priority": "group"}, 10.0),
+]
+
+
+def metrics_after(queue_depth: float, rejected: float, fast: float, slow: float) -> list:
+    return [
+        ("restaurant_agent_scheduler_queue_depth", {"priority": "group"}, queue_depth),
+        ("restaurant_agent_scheduler_rejected_total", {"priority": "group"}, 2.0 + rejected),
+        ("restaurant_agent_scheduler_wait_seconds_bucket", {"priority": "group", "le": "0.01"}, 10.0 + fast),
+        ("restaurant_agent_scheduler_wait_seconds_bucket", {"priority": "group", "le": "1"}, 10.0 + fast + slow),
+        ("restaurant_agent_scheduler_wait_seconds_bucket", {"priority": "group", "le": "+Inf"}, 10.0 + fast + slow),
+        ("restaurant_agent_scheduler_wait_seconds_count", {"priority": "group"}, 10.0 + fast + slow),
+    ]
+
+
+def make_step(rate: float, sent: int, elapsed: float, scheduler: dict = None) -> dict:
+    return {
+        "offered_rate": rate,
+        "sent": sent,
+        "sent_rate": round(sent / elapsed, 2),
+        "throughput": round(sent / elapsed, 2),
+        "error_rate": 0.0,
+        "total_ms": {"p50": 2.0, "p95": 5.0, "p99": 8.0},
+        "scheduler": scheduler,
+    }
+
+
+def test_scheduler_stats_uses_metric_deltas():
+    stats = scheduler_stats(METRICS_BEFORE, metrics_after(queue_depth=3, rejected=1, fast=19, slow=1), 7, 2.0)
+    # 受け付けなかったイベントへの返信は、処理できたイベントに数えない
+    assert stats["processed_throughput"] == 9.5
+    assert stats["rejected"] == 1
+    assert stats["queue_depth_end"] == 3
+    assert stats["queue_depth_max"] == 7
+    assert stats["wait_ms"] == {"p50": 10.0, "p95": 10.0}
+
+
+def test_bucket_percentile_ignores_earlier_observations():
+    before = _wait_buckets(METRICS_BEFORE)
+    after = _wait_buckets(metrics_after(queue_depth=0, rejected=0, fast=1, slow=9))
+    assert _bucket_percentile(before, after, 50) == 1.0
+
+
+def test_not_saturated_when_poisson_sends_fewer_than_nominal_rate():
+    # 20 events/s を3秒間の指定でも、ポアソン到着で50件しか送らず、すべて処理できた
+    stats = scheduler_stats(METRICS_BEFORE, metrics_after(queue_depth=0, rejected=0, fast=50, slow=0), 0, 2.94)
+    step = make_step(20, 50, 2.94, stats)
+    assert not is_saturated(step, max_error_rate=0.01, max_p95_ms=5000, max_queue_seconds=5)
+
+
+def test_saturated_when_backlog_or_rejections_grow():
+    backlog = scheduler_stats(METRICS_BEFORE, metrics_after(queue_depth=150, rejected=0, fast=10, slow=40), 150, 3.0)
+    assert is_saturated(make_step(40, 120, 3.0, backlog), 0.01, 5000, 1)
+
+    rejected = scheduler_stats(METRICS_BEFORE, metrics_after(queue_depth=0, rejected=20, fast=120, slow=0), 0, 3.0)
+    assert is_saturated(make_step(40, 120, 3.0, rejected), 0.01, 5000, 5)
@@ -0,0 +1,109 @@
+# tests/test_local_index.py
+from app.local_index import LocalPlaceIndex
+
+SHINJUKU = {"lat": 35.6909, "lng": 139.7003}
+SHIBUYA = {"lat": 35.6580, "lng": 139.7016}
+
+
+def make_place(place_id, name, location, rating=4.0, price_level=2, address="東京都"):
+    return {
+        "place_id": place_id,
+        "name": name,
+        "formatted_address": address,
+        "rating": rating,
+        "user_ratings_total": 100,
+        "price_level": price_level,
+        "geometry": {"location": dict(location)},
+    }
+
+
+def build_index(db_path=None):
+    index = LocalPlaceIndex(db_path)
+    index.add_places([
+        make_place("p1", "和食処 さくら", SHINJUKU, rating=4.5, address="東京都新宿区西新宿1丁目"),
+        make_place("p2", "鮨 まつ", {"lat": 35.6915, "lng": 139.7010}, rating=4.2, price_level=4),
+        make_place("p3", "イタリアン ルナ", SHIBUYA, rating=4.8),
+    ], query="新宿 個室")
+    return index
+
+
+def ids(results):
+    return [place["place_id"] for place in results]
+
+
+def test_keyword_search_uses_names_and_query_words():
+    index = build_index()
+    assert ids(index.search("和食")) == ["p1"]
+    # 店名や住所になくても、ヒットした時の検索キーワードで見つかる
+    assert ids(index.search("個室")) == ["p3", "p1", "p2"]
+    # キーワードはすべてを含むお店だけ（AND検索）
+    assert ids(index.search("個室 イタリアン")) == ["p3"]
+    assert index.search("中華") == []
+
+
+def test_location_search_uses_grid_and_radius():
+    index = build_index()
+    assert ids(index.search(location=SHINJUKU, radius=500)) == ["p1", "p2"]
+    assert ids(index.search(location=SHIBUYA, radius=500)) == ["p3"]
+    assert ids(index.search("個室", location=SHINJUKU, radius=500, max_price=3)) == ["p1"]
+
+
+def test_requires_a_condition():
+    assert build_index().search() == []
+
+
+def test_reindexing_a_place_replaces_old_entries():
+    index = build_index()
+    index.add_places([make_place("p1", "中華 龍", SHIBUYA)])
+    assert index.search("和食") == []
+    assert ids(index.search("中華")) == ["p1"]
+    assert "p1" in ids(index.search(location=SHIBUYA, radius=300))
+    assert "p1" not in ids(index.search(location=SHINJUKU, radius=300))
+
+
+def test_persists_to_sqlite(tmp_path):
+    path = str(tmp_path / "places.db")
+    build_index(path).close()
+    reloaded = LocalPlaceIndex(path)
+    assert len(reloaded) == 3
+    assert ids(reloaded.search("個室 和食", location=SHINJUKU, radius=500)) == ["p1"]
+
+
+def test_writes_to_sqlite_in_background(tmp_path):
+    path = str(tmp_path / "places.db")
+    index = LocalPlaceIndex(path, flush_interval=60)
+    index.add_places([make_place("p1", "和食処 さくら", SHINJUKU)])
+    # リクエストの処理中には書き込まない
+    assert len(LocalPlaceIndex(path)) == 0
+    index.flush()
+    assert len(LocalPlaceIndex(path)) == 1
+    index.close()
+
+
+def test_evicts_least_recently_added_places(tmp_path):
+    path = str(tmp_path / "places.db")
+    index = LocalPlaceIndex(path, max_places=2)
+    index.add_places([make_place("p1", "和食処 さくら", SHINJUKU), make_place("p2", "鮨 まつ", SHINJUKU)])
+    # 再び検索結果に現れたお店は新しいものとして扱う
+    index.add_places([make_place("p1", "和食処 さくら", SHINJUKU)])
+    index.add_places([make_place("p3", "和食 はな", SHIBUYA)])
+
+    assert len(index) == 2
+    assert sorted(ids(index.search("和食"))) == ["p1", "p3"]
+    assert index.search("鮨") == []
+    assert ids(index.search(location=SHINJUKU, radius=300)) == ["p1"]
+    index.close()
+    assert sorted(ids(LocalPlaceIndex(path).search("和食"))) == ["p1", "p3"]
+    # 上限を下げて読み込んだ場合は、古いお店から捨てる
+    assert ids(LocalPlaceIndex(path, max_places=1).search("和食")) == ["p3"]
+
+
+def test_empty_index_is_filled_by_searches():
+    from app.google_maps_actions import GoogleMapsActions
+    from bench.fakes import CallCounter, FakeGoogleMapsClient
+
+    index = LocalPlaceIndex()
+    actions = GoogleMapsActions(None, "", gmaps_client=FakeGoogleMapsClient(CallCounter()),
+                                local_index=index, area_cache_path="")
+    actions.search_and_format_restaurants("新宿 和食", max_results=3)
+    assert len(index) == 20
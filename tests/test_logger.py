@@ -0,0 +1,79 @@
+# tests/test_logger.py
+import atexit
+import logging
+
+import pytest
+
+from app import logger as app_logger
+from app.logger import ROOT_LOGGER_NAME, RateLimitFilter, SamplingFilter
+
+
+def make_record(level=logging.INFO, msg="検索しました"):
+    return logging.LogRecord("restaurant_agent.test", level, __file__, 1, msg, None, None)
+
+
+def test_rate_limit_suppresses_repeated_info_logs(clock, monkeypatch):
+    monkeypatch.setattr(app_logger, "time", clock)
+    rate_limit = RateLimitFilter(limit=2, interval=10)
+    assert [rate_limit.filter(make_record()) for _ in range(4)] == [True, True, False, False]
+
+    # 次の期間の最初のログに、間引いた件数を記録する
+    clock.advance(10)
+    record = make_record()
+    assert rate_limit.filter(record)
+    assert record.suppressed == 2
+
+
+def test_rate_limit_never_drops_warnings(clock, monkeypatch):
+    monkeypatch.setattr(app_logger, "time", clock)
+    rate_limit = RateLimitFilter(limit=1, interval=10)
+    assert all(rate_limit.filter(make_record(logging.WARNING)) for _ in range(5))
+    assert all(rate_limit.filter(make_record(logging.ERROR)) for _ in range(5))
+
+
+def test_sampling_keeps_warnings():
+    sampling = SamplingFilter(0.0)
+    assert not sampling.filter(make_record(logging.INFO))
+    assert sampling.filter(make_record(logging.WARNING))
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def fresh_root_logger(monkeypatch):
+    """setup_logging を、既存の設定の影響を受けずに呼び出せるようにする"""
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    saved = (root.level, list(root.handlers), root.propagate)
+    monkeypatch.setattr(app_logger, "_listener", None)
+    root.handlers = []
+    yield root
+    if app_logger._listener is not None:
+        atexit.unregister(app_logger._listener.stop)
+        app_logger._listener.stop()
+    root.setLevel(saved[0])
+    root.handlers = saved[1]
+    root.propagate = saved[2]
+
+
+def test_invalid_log_level_falls_back_to_info(fresh_root_logger, monkeypatch):
+    monkeypatch.setenv("LOG_LEVEL", "verbose")
+    handler = ListHandler()
+    fresh_root_logger.addHandler(handler)
+
+    app_logger.setup_logging()
+
+    assert fresh_root_logger.level == logging.INFO
+    assert [(r.levelno, r.log_level) for r in handler.records] == [(logging.WARNING, "VERBOSE")]
+
+
+def test_valid_log_level_is_used(fresh_root_logger, monkeypatch):
+    monkeypatch.setenv("LOG_LEVEL", "debug")
+    app_logger.setup_logging()
+    assert fresh_root_logger.level == logging.DEBUG
@@ -0,0 +1,55 @@
+# tests/test_metrics.py
+import pytest
+
+from app.metrics import MetricsRegistry, STAGE_ERRORS, STAGE_SECONDS, record_token_usage, GEMINI_TOKENS, stage_timer
+from bench.fakes import FakeResponse
+
+
+def test_renders_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter("test_requests_total", "リクエスト数", ("result",))
+    latency = registry.histogram("test_seconds", "所要時間", buckets=(0.1, 1.0))
+    requests.inc(result="hit")
+    requests.inc(2, result="miss")
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    lines = registry.render().splitlines()
+    assert 'test_requests_total{result="hit"} 1' in lines
+    assert 'test_requests_total{result="miss"} 2' in lines
+    # バケットは累積の件数
+    assert 'test_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{le="1"} 2' in lines
+    assert 'test_seconds_bucket{le="+Inf"} 2' in lines
+    assert "test_seconds_count 2" in lines
+
+
+def test_rejects_wrong_labels_and_duplicate_names():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "回数", ("stage",))
+    with pytest.raises(ValueError):
+        counter.inc(kind="x")
+    with pytest.raises(ValueError):
+        registry.counter("test_total", "回数")
+
+
+def test_stage_timer_counts_errors():
+    def observations():
+        prefix = 'restaurant_agent_stage_seconds_count{stage="test_stage"} '
+        return next((int(line[len(prefix):]) for line in STAGE_SECONDS.render() if line.startswith(prefix)), 0)
+
+    before = observations()
+    with stage_timer("test_stage"):
+        pass
+    with pytest.raises(RuntimeError):
+        with stage_timer("test_stage"):
+            raise RuntimeError("boom")
+    assert observations() == before + 2
+    assert STAGE_ERRORS.get(stage="test_stage") == 1
+
+
+def test_records_cached_tokens():
+    before = GEMINI_TOKENS.get(purpose="test", kind="cached")
+    record_token_usage(FakeResponse("prompt", text="ok", cached_tokens=100), "test")
+    assert GEMINI_TOKENS.get(purpose="test", kind="cached") == before + 100
+    assert GEMINI_TOKENS.get(purpose="test", kind="prompt") >= 100 + len("prompt")
@@ -0,0 +1,61 @@
+# tests/test_models.py
+import json
+import threading
+
+from app.models import COMMON_MEMBER_ID, Restaurant, Session
+
+
+def test_preferences_text_is_rebuilt_after_new_messages():
+    session = Session()
+    session.add_common("新宿でランチ")
+    first = session.preferences_text()
+    assert session.preferences_text() is first
+
+    session.add_member_message("U1", "和食がいい")
+    assert json.loads(session.preferences_text()) == {COMMON_MEMBER_ID: ["新宿でランチ"], "U1": ["和食がいい"]}
+    assert json.loads(session.common_text()) == ["新宿でランチ"]
+
+
+def test_preferences_returns_a_copy():
+    session = Session()
+    session.add_member_message("U1", "和食がいい")
+    session.preferences()["U1"].append("書き換え")
+    assert session.preferences() == {COMMON_MEMBER_ID: [], "U1": ["和食がいい"]}
+
+
+def test_session_round_trips_through_compact_json():
+    session = Session()
+    session.add_common("新宿でランチ")
+    session.add_member_message("U1", "和食がいい")
+    session.add_member_message("U2", "個室")
+    session.add_member_message("U1", "予算3000円")
+
+    restored = Session.loads(session.dumps())
+    assert restored.status == session.status
+    assert restored.preferences() == session.preferences()
+    # メンバーは希望を送った順のまま
+    assert list(restored.members) == ["U1", "U2"]
+
+
+def test_concurrent_messages_are_not_lost():
+    session = Session()
+
+    def add(member_id):
+        for i in range(200):
+            session.add_member_message(member_id, str(i))
+            session.preferences_text()
+
+    threads = [threading.Thread(target=add, args=(f"U{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    preferences = json.loads(session.preferences_text())
+    assert all(len(preferences[f"U{n}"]) == 200 for n in range(4))
+
+
+def test_restaurant_round_trips_through_compact_json():
+    restaurant = Restaurant("p1", "lite", "和食処", "https://example.com/p1.jpg", rating=4.2, user_rating_count=31)
+    restored = Restaurant.from_compact(json.loads(restaurant.dumps()))
+    assert restored.to_compact() == restaurant.to_compact()
@@ -0,0 +1,140 @@
+# tests/test_place_cursor.py
+import pytest
+from googlemaps.exceptions import ApiError
+
+from app import place_cursor
+from app.place_cursor import PlaceResultCursor
+from app.rate_limiter import RateLimitExceeded
+from bench.fakes import CallCounter, FakeGoogleMapsClient
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(clock, monkeypatch):
+    monkeypatch.setattr(place_cursor, "time", clock)
+
+
+@pytest.fixture
+def counter():
+    return CallCounter()
+
+
+@pytest.fixture
+def gmaps(counter):
+    return FakeGoogleMapsClient(counter)
+
+
+def make_cursor(gmaps, query="新宿 和食"):
+    first_page = gmaps.places(query=query)
+    return PlaceResultCursor(lambda token: gmaps.places(page_token=token), first_page)
+
+
+def test_takes_across_pages_without_duplicates(gmaps, counter):
+    cursor = make_cursor(gmaps)
+    first = cursor.take(15)
+    assert counter.snapshot() == {"maps.places": 1}
+
+    # 1ページ目の残り5件と、2ページ目の10件
+    second = cursor.take(15)
+    assert counter.snapshot() == {"maps.places": 2}
+
+    rest = list(cursor)
+    place_ids = [place["place_id"] for place in first + second + rest]
+    assert len(place_ids) == len(set(place_ids)) == FakeGoogleMapsClient.PAGE_SIZE * FakeGoogleMapsClient.MAX_PAGES
+    assert cursor.exhausted
+    assert cursor.take(3) == []
+
+
+def test_skips_places_already_returned():
+    page = {"results": [{"place_id": "a"}, {"place_id": "a"}, {"name": "place_idなし"}, {"place_id": "b"}]}
+    cursor = PlaceResultCursor(None, page)
+    assert [place["place_id"] for place in cursor.take(5)] == ["a", "b"]
+
+
+def test_retries_invalid_request_until_token_is_ready(gmaps, clock):
+    attempts = []
+
+    def fetch_page(token):
+        attempts.append(token)
+        if len(attempts) < 3:
+            raise ApiError("INVALID_REQUEST")
+        return gmaps.places(page_token=token)
+
+    cursor = PlaceResultCursor(fetch_page, gmaps.places(query="新宿"))
+    assert len(cursor.take(25)) == 25
+    assert len(attempts) == 3
+    assert clock.sleeps == [PlaceResultCursor.PAGE_TOKEN_RETRY_WAIT] * 2
+
+
+def test_gives_up_after_max_wait(clock):
+    def fetch_page(token):
+        raise ApiError("INVALID_REQUEST")
+
+    cursor = PlaceResultCursor(fetch_page, {"results": [], "next_page_token": "expired"})
+    with pytest.raises(ApiError):
+        cursor.take(1)
+    assert sum(clock.sleeps) == PlaceResultCursor.PAGE_TOKEN_MAX_WAIT
+    # 同じトークンで何度も再試行しない
+    assert cursor.exhausted
+
+
+def test_does_not_wait_for_an_old_token(clock):
+    def fetch_page(token):
+        raise ApiError("INVALID_REQUEST")
+
+    cursor = PlaceResultCursor(fetch_page, {"results": [], "next_page_token": "expired"})
+    # 「他のお店を見る」が押されたのは、トークンを受け取ってからしばらく後
+    clock.advance(30)
+    with pytest.raises(ApiError):
+        cursor.take(1)
+    assert clock.sleeps == []
+
+
+def test_other_api_errors_are_not_retried(clock):
+    def fetch_page(token):
+        raise ApiError("OVER_QUERY_LIMIT")
+
+    cursor = PlaceResultCursor(fetch_page, {"results": [], "next_page_token": "token"})
+    with pytest.raises(ApiError):
+        cursor.take(1)
+    assert clock.sleeps == []
+
+
+def test_keeps_token_when_rate_limited(gmaps):
+    limited = [True]
+
+    def fetch_page(token):
+        if limited[0]:
+            raise RateLimitExceeded("places")
+        return gmaps.places(page_token=token)
+
+    cursor = PlaceResultCursor(fetch_page, gmaps.places(query="新宿"))
+    # 取り出せた分だけを返し、次のページは後で取得できる
+    assert len(cursor.take(25)) == 20
+    assert not cursor.exhausted
+    with pytest.raises(RateLimitExceeded):
+        cursor.take(5)
+
+    limited[0] = False
+    assert len(cursor.take(5)) == 5
+
+
+def test_searches_again_after_cached_first_page(gmaps, counter):
+    first_page = gmaps.places(query="新宿 和食")
+    calls = []
+
+    def search_again():
+        calls.append(1)
+        page = gmaps.places(query="新宿 和食")
+        return page, lambda token: gmaps.places(page_token=token)
+
+    # キャッシュした1ページ目だけから始める（next_page_tokenは持たない）
+    cursor = PlaceResultCursor(None, {"results": first_page["results"]}, search_again=search_again)
+    first = cursor.take(20)
+    assert calls == []
+
+    # 検索し直した1ページ目は読み飛ばし、新しいトークンで2ページ目を取得する
+    second = cursor.take(5)
+    assert calls == [1]
+    assert counter.snapshot() == {"maps.places": 3}
+    assert not {p["place_id"] for p in first} & {p["place_id"] for p in second}
+    assert len(second) == 5
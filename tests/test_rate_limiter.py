@@ -0,0 +1,59 @@
+# tests/test_rate_limiter.py
+import pytest
+
+from app import rate_limiter
+from app.rate_limiter import GLOBAL_KEY, RateLimiter, RateLimitExceeded
+
+
+@pytest.fixture
+def limiter_factory(clock, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "time", clock)
+    return RateLimiter
+
+
+def test_refills_at_per_minute_rate(limiter_factory, clock):
+    limiter = limiter_factory({"gemini": 60})
+    for _ in range(60):
+        assert limiter.try_acquire(("gemini", GLOBAL_KEY))
+    assert not limiter.try_acquire(("gemini", GLOBAL_KEY))
+
+    # 1分あたり60回なので、1秒で1回分だけ戻る
+    clock.advance(1)
+    assert limiter.try_acquire(("gemini", GLOBAL_KEY))
+    assert not limiter.try_acquire(("gemini", GLOBAL_KEY))
+
+    # 上限（1分間に使える回数）より多くは溜まらない
+    clock.advance(600)
+    assert limiter.try_acquire(("gemini", GLOBAL_KEY), cost=60)
+    assert not limiter.try_acquire(("gemini", GLOBAL_KEY))
+
+
+def test_multi_key_acquire_rolls_back_on_any_limit(limiter_factory):
+    limiter = limiter_factory({"group": 10, "user": 2})
+    keys = (("group", "Cgroup"), ("user", "Uuser"))
+    assert limiter.try_acquire(*keys)
+    assert limiter.try_acquire(*keys)
+
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        limiter.acquire(*keys)
+    assert excinfo.value.scope == "user"
+
+    # ユーザーの制限で断った呼び出しは、グループの回数を使わない
+    for _ in range(8):
+        assert limiter.try_acquire(("group", "Cgroup"))
+    assert not limiter.try_acquire(("group", "Cgroup"))
+
+
+def test_keys_are_limited_separately(limiter_factory):
+    limiter = limiter_factory({"user": 1})
+    assert limiter.try_acquire(("user", "U1"))
+    assert not limiter.try_acquire(("user", "U1"))
+    assert limiter.try_acquire(("user", "U2"))
+
+
+def test_ignores_unset_scopes_and_missing_keys(limiter_factory):
+    limiter = limiter_factory({"group": 0, "user": 1})
+    for _ in range(5):
+        assert limiter.try_acquire(("group", "Cgroup"), ("places", GLOBAL_KEY))
+    assert limiter.try_acquire(("user", None), ("user", "U1"))
+    assert not limiter.try_acquire(("user", "U1"))
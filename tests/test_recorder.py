@@ -0,0 +1,103 @@
+# tests/test_recorder.py
+import pytest
+
+from app.recorder import (
+    REDACTED, REPLAY_CONFIG_VARS, Recorder, ReplayedError, ReplayMiss, ReplayStore, ReplayMapsClient, ReplayGenerativeModel,
+    load_records, serialize_gemini_response,
+)
+from app.tracing import Tracer
+from bench.fakes import CallCounter, FakeFunctionCall, FakeGenerativeModel, FakeGoogleMapsClient, FakeResponse
+
+
+@pytest.fixture
+def record_path(tmp_path, monkeypatch):
+    monkeypatch.setenv("Maps_API_KEY", "secret-key")
+    for name in REPLAY_CONFIG_VARS:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("PROGRESSIVE_CAROUSEL", "true")
+    return str(tmp_path / "record.jsonl")
+
+
+def capture(path, func):
+    recorder = Recorder(path)
+    try:
+        func(recorder)
+    finally:
+        recorder.close()
+    return load_records(path)
+
+
+def test_records_config_and_redacts_secrets(record_path):
+    records = capture(record_path, lambda recorder: recorder.record_webhook('{"key": "secret-key"}'))
+    assert records[0]["type"] == "meta"
+    assert records[0]["config"] == {"PROGRESSIVE_CAROUSEL": "true"}
+    assert records[1]["body"] == f'{{"key": "{REDACTED}"}}'
+    assert [record["seq"] for record in records] == [1, 2]
+
+
+def test_replays_recorded_maps_responses(record_path):
+    gmaps = FakeGoogleMapsClient(CallCounter())
+
+    def run(recorder):
+        maps = recorder.wrap("maps", gmaps)
+        maps.places(query="新宿 和食", language="ja")
+
+    store = ReplayStore(capture(record_path, run))
+    replay = ReplayMapsClient(store)
+    # 引数の順番が違っても同じリクエストとして照合する
+    page = replay.places(language="ja", query="新宿 和食")
+    assert len(page["results"]) == FakeGoogleMapsClient.PAGE_SIZE
+    assert store.calls["maps.places"] == 1
+
+    # 同じ記録は二度使わない
+    with pytest.raises(ReplayMiss):
+        replay.places(query="新宿 和食", language="ja")
+    assert store.misses["maps.places"] == 1
+
+
+def test_replays_recorded_errors(record_path):
+    class FailingMaps:
+        def place(self, **kwargs):
+            raise RuntimeError("OVER_QUERY_LIMIT")
+
+    def run(recorder):
+        with pytest.raises(RuntimeError):
+            recorder.wrap("maps", FailingMaps()).place(place_id="p1")
+
+    replay = ReplayMapsClient(ReplayStore(capture(record_path, run)))
+    with pytest.raises(ReplayedError, match="OVER_QUERY_LIMIT"):
+        replay.place(place_id="p1")
+
+
+def test_prompt_changed_by_interleaving_is_matched_within_the_same_event(record_path):
+    model = FakeGenerativeModel(CallCounter())
+    tracer = Tracer()
+
+    def run(recorder):
+        with tracer.trace("handle_message", event_id="E1"):
+            recorder.wrap("gemini", model).start_chat().send_message('希望: [] 新しいメッセージ: "和食"')
+
+    store = ReplayStore(capture(record_path, run))
+    chat = ReplayGenerativeModel(store).start_chat()
+    with tracer.trace("handle_message", event_id="E1"):
+        # 同時に進んでいた会話によって希望の部分が変わっても、同じイベントの応答を返す
+        response = chat.send_message('希望: ["個室"] 新しいメッセージ: "和食"')
+    assert response.text == "なるほど、承知しました！"
+    assert store.approximate["gemini.send_message"] == 1
+
+
+def test_serializes_function_call_only_response():
+    class FunctionCallResponse(FakeResponse):
+        @property
+        def text(self):
+            raise ValueError("no text")
+
+        @text.setter
+        def text(self, value):
+            pass
+
+    response = FunctionCallResponse("prompt", function_call=FakeFunctionCall("search_restaurants", {"query": "和食"}))
+    data = serialize_gemini_response(response)
+    assert data["text"] is None
+    assert data["function_calls"] == [{"name": "search_restaurants", "args": {"query": "和食"}}]
+    assert data["usage"]["prompt_token_count"] == len("prompt")
@@ -0,0 +1,141 @@
+# tests/test_scheduler.py
+import threading
+import time
+
+import pytest
+
+from app.scheduler import PRIORITY_COMMAND, PRIORITY_GROUP, PRIORITY_INDIVIDUAL, EventScheduler
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+
+    def make(**kwargs):
+        scheduler = EventScheduler(**kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.shutdown(timeout=5)
+
+
+def blocked(scheduler, key="blocker"):
+    """ワーカーを1つ止めておき、その間に submit した処理の順番を確かめるためのゲート"""
+    gate = threading.Event()
+    started = threading.Event()
+
+    def wait():
+        started.set()
+        gate.wait(5)
+
+    scheduler.submit(wait, PRIORITY_INDIVIDUAL, key)
+    assert started.wait(5)
+    return gate
+
+
+def test_same_key_is_processed_one_at_a_time_in_order(make_scheduler):
+    scheduler = make_scheduler(workers=8)
+    lock = threading.Lock()
+    running, overlaps, order = set(), [], []
+
+    def task(key, i):
+        def run():
+            with lock:
+                if key in running:
+                    overlaps.append(key)
+                running.add(key)
+            time.sleep(0.001)
+            with lock:
+                running.discard(key)
+                order.append((key, i))
+        return run
+
+    for i in range(20):
+        for key in ("C1", "C2", "U1"):
+            scheduler.submit(task(key, i), PRIORITY_GROUP, key)
+    assert scheduler.wait_idle(10)
+
+    assert overlaps == []
+    for key in ("C1", "C2", "U1"):
+        assert [i for k, i in order if k == key] == list(range(20))
+
+
+def test_extra_keys_serialize_with_other_queues(make_scheduler):
+    scheduler = make_scheduler(workers=4)
+    lock = threading.Lock()
+    users_running, overlaps = [0], []
+
+    def task():
+        with lock:
+            users_running[0] += 1
+            if users_running[0] > 1:
+                overlaps.append(users_running[0])
+        time.sleep(0.002)
+        with lock:
+            users_running[0] -= 1
+
+    for _ in range(10):
+        # 同じユーザーのグループでの発言と、1対1チャット
+        scheduler.submit(task, PRIORITY_GROUP, "C1", ("U1",))
+        scheduler.submit(task, PRIORITY_INDIVIDUAL, "U1")
+    assert scheduler.wait_idle(10)
+    assert overlaps == []
+
+
+def test_higher_priority_first_and_round_robin_between_keys(make_scheduler):
+    scheduler = make_scheduler(workers=1)
+    gate = blocked(scheduler)
+    order = []
+    for key in ("U1", "U1", "U1", "U2"):
+        scheduler.submit(lambda key=key: order.append(key), PRIORITY_INDIVIDUAL, key)
+    scheduler.submit(lambda: order.append("C1"), PRIORITY_COMMAND, "C1")
+    gate.set()
+    assert scheduler.wait_idle(5)
+
+    # コマンドが先で、1つのキーが続けて大量に処理されない
+    assert order == ["C1", "U1", "U2", "U1", "U1"]
+
+
+def test_key_keeps_fifo_order_across_priority_classes(make_scheduler):
+    scheduler = make_scheduler(workers=1)
+    gate = blocked(scheduler)
+    order = []
+    scheduler.submit(lambda: order.append("C1 ヒアリング1"), PRIORITY_GROUP, "C1")
+    scheduler.submit(lambda: order.append("C1 ヒアリング2"), PRIORITY_GROUP, "C1")
+    scheduler.submit(lambda: order.append("C2 ヒアリング"), PRIORITY_GROUP, "C2")
+    scheduler.submit(lambda: order.append("C1 お店を決める"), PRIORITY_COMMAND, "C1")
+    gate.set()
+    assert scheduler.wait_idle(5)
+
+    # C1のコマンドは、C1のそれより前のメッセージを追い越さない（C1はコマンドの優先度で順番を待つ）
+    assert order.index("C1 ヒアリング1") < order.index("C1 ヒアリング2") < order.index("C1 お店を決める")
+    assert order.index("C1 お店を決める") < order.index("C2 ヒアリング")
+
+
+def test_admission_rejects_non_commands_when_full(make_scheduler):
+    scheduler = make_scheduler(workers=1, max_depth=2)
+    gate = blocked(scheduler)
+    scheduler.submit(lambda: None, PRIORITY_GROUP, "C1")
+    scheduler.submit(lambda: None, PRIORITY_GROUP, "C2")
+
+    assert not scheduler.admits(PRIORITY_GROUP)
+    assert not scheduler.admits(PRIORITY_INDIVIDUAL)
+    assert scheduler.admits(PRIORITY_COMMAND)
+    gate.set()
+    assert scheduler.wait_idle(5)
+    assert scheduler.admits(PRIORITY_INDIVIDUAL)
+
+
+def test_task_errors_do_not_stop_workers(make_scheduler):
+    scheduler = make_scheduler(workers=1)
+    done = []
+
+    def fail():
+        raise RuntimeError("boom")
+
+    scheduler.submit(fail, PRIORITY_GROUP, "C1")
+    scheduler.submit(lambda: done.append(True), PRIORITY_GROUP, "C1")
+    assert scheduler.wait_idle(5)
+    assert done == [True]
@@ -0,0 +1,36 @@
+# tests/test_search_cache.py
+import pytest
+
+from app.search_cache import normalize_keywords, normalize_search
+
+
+@pytest.mark.parametrize("a, b", [
+    ("新宿 和食 個室", "和食 新宿 個室あり"),
+    ("新宿　和食", "新宿 和食"),
+    ("駐車場付き 焼肉", "焼肉 駐車場"),
+    ("新宿 おすすめ 居酒屋", "居酒屋 新宿"),
+    ("ＳＨＩＢＵＹＡ Bar", "shibuya bar"),
+])
+def test_rephrased_queries_share_a_key(a, b):
+    assert normalize_search(a) == normalize_search(b)
+
+
+def test_different_queries_have_different_keys():
+    assert normalize_search("新宿 和食") != normalize_search("新宿 中華")
+    assert normalize_search("新宿 和食", min_price=2) != normalize_search("新宿 和食")
+
+
+def test_keeps_query_when_every_token_is_noise():
+    assert normalize_keywords("おすすめ お店") == normalize_keywords("お店 おすすめ") == ("おすすめ", "お店")
+
+
+def test_full_price_range_means_no_price_filter():
+    assert normalize_search("和食", min_price=0, max_price=4) == normalize_search("和食")
+    assert normalize_search("和食", min_price=1, max_price=3)[3:] == (1, 3)
+
+
+def test_rounds_location():
+    near = normalize_search("和食", {"lat": 35.690912, "lng": 139.700311}, 800)
+    same = normalize_search("和食", {"lat": 35.690949, "lng": 139.700349}, 800)
+    assert near == same
+    assert near[1] == (35.6909, 139.7003)
@@ -0,0 +1,53 @@
+# tests/test_tracing.py
+import pytest
+
+from app.metrics import stage_timer
+from app.tracing import Tracer, TRACER, argument_sizes, current_trace_id
+
+
+def test_spans_nest_under_the_current_trace():
+    tracer = Tracer(max_traces=2)
+    with tracer.trace("handle_message", group_id="G1") as root:
+        assert current_trace_id() == root.trace.trace_id
+        with tracer.span("llm_decision"):
+            with tracer.span("tool.search_restaurants"):
+                pass
+    assert current_trace_id() is None
+
+    trace = tracer.get(root.trace.trace_id)
+    spans = {span["name"]: span for span in trace["spans"]}
+    assert spans["llm_decision"]["parent_id"] == spans["handle_message"]["span_id"]
+    assert spans["tool.search_restaurants"]["parent_id"] == spans["llm_decision"]["span_id"]
+    assert tracer.recent(group_id="G1")[0]["trace_id"] == trace["trace_id"]
+    assert tracer.recent(group_id="G2") == []
+
+
+def test_records_error_and_keeps_recent_traces_only():
+    tracer = Tracer(max_traces=2)
+    with pytest.raises(ValueError):
+        with tracer.trace("failing"):
+            raise ValueError("boom")
+    assert tracer.recent()[0]["error"] == "ValueError: boom"
+
+    for name in ("a", "b"):
+        with tracer.trace(name):
+            pass
+    assert [trace["name"] for trace in tracer.recent()] == ["b", "a"]
+
+
+def test_span_outside_trace_records_nothing():
+    tracer = Tracer()
+    with tracer.span("orphan") as span:
+        assert span is None
+    assert tracer.recent() == []
+
+
+def test_tool_span_records_argument_sizes_not_text():
+    args = {"query": "新宿 和食 個室", "choices": ["和食", "中華"], "min_price": 2}
+    with TRACER.trace("test_tool_span") as root:
+        with stage_timer("tool.search_restaurants", arg_sizes=argument_sizes(args)):
+            pass
+
+    span = next(s for s in TRACER.get(root.trace.trace_id)["spans"] if s["name"] == "tool.search_restaurants")
+    assert span["attributes"] == {"arg_sizes": {"query": 8, "choices": 2, "min_price": "int"}}
+    assert "新宿" not in repr(span)
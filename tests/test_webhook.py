@@ -0,0 +1,64 @@
+# tests/test_webhook.py
+import asyncio
+import threading
+
+import pytest
+
+from bench import payloads
+from bench.harness import BenchmarkApp
+
+
+@pytest.fixture
+def bench():
+    bench = BenchmarkApp()
+    container = bench.main.container
+    original = container.scheduler
+    yield bench
+    container.override("scheduler", original)
+
+
+def use_scheduler(bench, **kwargs):
+    from app.scheduler import EventScheduler
+    scheduler = EventScheduler(**kwargs)
+    bench.main.container.override("scheduler", scheduler)
+    return scheduler
+
+
+def post(bench, events: list) -> int:
+    return asyncio.run(bench.post_webhook(payloads.build_body(events)))
+
+
+def test_busy_reply_does_not_wait_behind_group_backlog(bench):
+    from app.rate_limiter import BUSY_MESSAGE
+    from app.scheduler import PRIORITY_INDIVIDUAL
+
+    scheduler = use_scheduler(bench, workers=1, max_depth=2)
+    assert post(bench, [payloads.text_message_event("スタート", "Uorganizer", "Cgroup")]) == 200
+    assert scheduler.wait_idle(10)
+    bench.line_bot_api.sent.clear()
+
+    gate, started = threading.Event(), threading.Event()
+    scheduler.submit(lambda: (started.set(), gate.wait(5)), PRIORITY_INDIVIDUAL, "blocker")
+    assert started.wait(5)
+
+    events = [
+        payloads.text_message_event("新宿", "Uorganizer", "Cgroup"),
+        payloads.text_message_event("ランチ", "Umember", "Cgroup"),
+        # 処理待ちが上限に達しているため、受け付けずに「混み合っています」と返す
+        payloads.text_message_event("明日の12時で！", "Umember", "Cgroup"),
+    ]
+    assert post(bench, events) == 200
+    gate.set()
+    assert scheduler.wait_idle(10)
+    scheduler.shutdown(5)
+
+    replies = [(to, messages) for kind, to, messages in bench.line_bot_api.sent if kind == "reply"]
+    assert replies[0][0] == events[2]["replyToken"]
+    assert replies[0][1][0].text == BUSY_MESSAGE
+    assert [to for to, _ in replies[1:]] == [events[0]["replyToken"], events[1]["replyToken"]]
+
+
+def test_returns_503_while_shutting_down(bench):
+    scheduler = use_scheduler(bench, workers=1)
+    scheduler.shutdown(5)
+    assert post(bench, [payloads.text_message_event("和食がいいです", "Uuser")]) == 503